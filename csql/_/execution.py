@@ -0,0 +1,496 @@
+# pyarrow and pandas are untyped, and the database drivers are all Any.
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false, reportUnknownParameterType=false
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections.abc import Callable, Generator, Iterator
+from contextlib import AbstractContextManager, contextmanager, suppress
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Literal, get_args
+
+if TYPE_CHECKING:
+	import pandas as pd  # pyright: ignore[reportMissingTypeStubs]
+	import polars as pl
+	import pyarrow as pa  # pyright: ignore[reportMissingTypeStubs]
+
+	import csql
+	import csql.adapters
+
+BatchFormat = Literal["tuples", "arrow", "pandas", "polars"]
+
+
+class Adapter:
+	"""
+	How to run a :class:`csql.RenderedQuery` on one kind of connection. :meth:`csql.Query.preview_pd`,
+	:meth:`~csql.Query.preview_pl`, :meth:`~csql.Query.to_arrow` and :meth:`~csql.Query.iter_batches`
+	look up the adapter for their connection with :func:`adapter_for`, and leave the fetching to it.
+
+	This base class treats connections as DBAPI connections. To teach csql about your own driver,
+	subclass it, override whichever methods your driver can do better, and :func:`register_adapter` it.
+	"""
+
+	def native_arrow(self, rq: csql.RenderedQuery, con: Any) -> pa.Table | None:
+		"""
+		Run ``rq`` and return its results as a :class:`pyarrow.Table`, if ``con`` can give us Arrow data
+		directly. Otherwise return ``None`` without running anything.
+		"""
+		return None
+
+	def to_arrow(self, rq: csql.RenderedQuery, con: Any) -> pa.Table:
+		"""Run ``rq`` and return its results as a :class:`pyarrow.Table`."""
+		if (table := self.native_arrow(rq, con)) is not None:
+			return table
+
+		import pyarrow as pa  # pyright: ignore[reportMissingTypeStubs]
+
+		c = con.cursor()
+		try:
+			c.execute(*rq.db)
+			names = [d[0] for d in c.description]
+			rows = c.fetchall()
+		finally:
+			c.close()
+		columns = list(zip(*rows)) if rows else [() for _ in names]
+		return pa.Table.from_arrays([pa.array(col) for col in columns], names=names)
+
+	def to_pandas(self, rq: csql.RenderedQuery, con: Any) -> pd.DataFrame:
+		"""Run ``rq`` and return its results as a :class:`pandas.DataFrame`."""
+		if (table := self.native_arrow(rq, con)) is not None:
+			return table.to_pandas()
+
+		import pandas as pd  # pyright: ignore[reportMissingTypeStubs]
+
+		return pd.read_sql(**rq.pd, con=con)
+
+	def to_polars(self, rq: csql.RenderedQuery, con: Any) -> pl.DataFrame:
+		"""Run ``rq`` and return its results as a :class:`polars.DataFrame`."""
+		import polars as pl
+
+		return pl.read_database(
+			rq.sql, con, execute_options={"parameters": rq.parameters}
+		)
+
+	def iter_batches(
+		self, rq: csql.RenderedQuery, con: Any, batch_size: int, format: BatchFormat
+	) -> Iterator[Any]:
+		"""
+		Run ``rq`` and yield its results ``batch_size`` rows at a time (or thereabouts), in ``format``.
+		See :meth:`csql.Query.iter_batches`.
+		"""
+		c = con.cursor()
+		for batch in _fetchmany(c, rq, batch_size):
+			if format == "tuples":
+				yield batch
+			else:
+				yield _from_rows(batch, [d[0] for d in c.description], format)
+
+	def timeout(self, con: Any, seconds: float) -> AbstractContextManager[None] | None:
+		"""
+		A context manager that cancels whatever is running on ``con`` once ``seconds`` have passed,
+		and turns the driver's error into a :class:`TimeoutError`. Return ``None`` if ``con`` can't be
+		cancelled. See :func:`statement_timeout`.
+
+		This base class calls ``con.interrupt()`` from a timer thread, for connections that have one
+		(like DuckDB's and :mod:`sqlite3`'s).
+		"""
+		interrupt = getattr(con, "interrupt", None)
+		if not callable(interrupt):
+			return None
+		return _interrupt_after(seconds, interrupt)
+
+
+class DuckDBAdapter(Adapter):
+	"""For ``duckdb`` connections."""
+
+	def native_arrow(self, rq: csql.RenderedQuery, con: Any) -> pa.Table:
+		result = con.execute(rq.sql, rq.parameters)
+		if hasattr(result, "to_arrow_table"):
+			return result.to_arrow_table()
+		return result.fetch_arrow_table()
+
+	def to_polars(self, rq: csql.RenderedQuery, con: Any) -> pl.DataFrame:
+		return con.query(**rq.ddb).pl()  # type: ignore[no-any-return]
+
+	def iter_batches(
+		self, rq: csql.RenderedQuery, con: Any, batch_size: int, format: BatchFormat
+	) -> Iterator[Any]:
+		# not con.cursor(), which can't see con's temp tables.
+		result = con.execute(rq.sql, rq.parameters)
+		if format == "tuples":
+			while batch := result.fetchmany(batch_size):
+				yield batch
+		elif hasattr(result, "to_arrow_reader"):
+			yield from _arrow_batches(result.to_arrow_reader(batch_size), format)
+		else:
+			yield from _arrow_batches(result.fetch_record_batch(batch_size), format)
+
+
+class ClickHouseAdapter(Adapter):
+	"""For ``clickhouse_connect`` clients."""
+
+	def native_arrow(self, rq: csql.RenderedQuery, con: Any) -> pa.Table:
+		return con.query_arrow(**rq.ch)
+
+	def to_polars(self, rq: csql.RenderedQuery, con: Any) -> pl.DataFrame:
+		return con.query_df_arrow(**rq.ch, dataframe_library="polars")  # type: ignore[no-any-return]
+
+	def iter_batches(
+		self, rq: csql.RenderedQuery, con: Any, batch_size: int, format: BatchFormat
+	) -> Iterator[Any]:
+		settings = {"max_block_size": batch_size}
+		if format == "tuples":
+			with con.query_row_block_stream(**rq.ch, settings=settings) as stream:
+				for block in stream:
+					yield [tuple(row) for row in block]
+			return
+
+		with con.query_arrow_stream(**rq.ch, settings=settings) as stream:
+			for table in stream:
+				yield from _arrow_batches(table.to_batches(), format)
+
+	def timeout(self, con: Any, seconds: float) -> AbstractContextManager[None]:
+		# a client setting, so it applies to everything run on this client in the meantime.
+		previous = con.get_client_setting("max_execution_time")
+
+		def reset() -> None:
+			# 0 is ClickHouse's "no limit", its default.
+			con.set_client_setting(
+				"max_execution_time", 0 if previous is None else previous
+			)
+
+		return _session_timeout(
+			seconds,
+			lambda: con.set_client_setting("max_execution_time", math.ceil(seconds)),
+			reset,
+		)
+
+
+class ADBCAdapter(Adapter):
+	"""For ADBC DBAPI connections (``adbc_driver_manager.dbapi.Connection``)."""
+
+	def native_arrow(self, rq: csql.RenderedQuery, con: Any) -> pa.Table:
+		c = con.cursor()
+		try:
+			c.execute(*rq.db)
+			return c.fetch_arrow_table()
+		finally:
+			c.close()
+
+
+class PostgresAdapter(Adapter):
+	"""For ``psycopg`` and ``psycopg2`` connections. Only needed for :meth:`timeout`."""
+
+	def timeout(self, con: Any, seconds: float) -> AbstractContextManager[None]:
+		[previous] = _fetchone(con, "show statement_timeout")
+
+		def reset() -> None:
+			# if this fails, the transaction failed, and rolling it back resets the timeout anyway.
+			with suppress(Exception):
+				_execute(con, f"set statement_timeout = {_quote(previous)}")
+
+		return _session_timeout(
+			seconds,
+			lambda: _execute(
+				con, f"set statement_timeout = {math.ceil(seconds * 1000)}"
+			),
+			reset,
+		)
+
+
+class SnowflakeAdapter(Adapter):
+	"""For ``snowflake.connector`` connections. Only needed for :meth:`timeout`."""
+
+	def timeout(self, con: Any, seconds: float) -> AbstractContextManager[None]:
+		# (key, value, default, level, ...)
+		row = _fetchone(
+			con, "show parameters like 'STATEMENT_TIMEOUT_IN_SECONDS' in session"
+		)
+
+		def reset() -> None:
+			if row[3] == "SESSION":
+				_execute(
+					con, f"alter session set statement_timeout_in_seconds = {row[1]}"
+				)
+			else:
+				_execute(con, "alter session unset statement_timeout_in_seconds")
+
+		return _session_timeout(
+			seconds,
+			lambda: _execute(
+				con,
+				f"alter session set statement_timeout_in_seconds = {math.ceil(seconds)}",
+			),
+			reset,
+		)
+
+
+# registered by name, so we don't have to import drivers just to find out we aren't using them.
+# keyed by type, or by "module.QualName" of a type.
+_adapters: dict[type | str, Adapter] = {
+	"_duckdb.DuckDBPyConnection": DuckDBAdapter(),
+	"duckdb.DuckDBPyConnection": DuckDBAdapter(),
+	"clickhouse_connect.driver.client.Client": ClickHouseAdapter(),
+	"adbc_driver_manager.dbapi.Connection": ADBCAdapter(),
+	"psycopg.connection.Connection": PostgresAdapter(),
+	"psycopg2.extensions.connection": PostgresAdapter(),
+	"snowflake.connector.connection.SnowflakeConnection": SnowflakeAdapter(),
+	"snowflake.connector.connection._connection.Connection": SnowflakeAdapter(),
+}
+_resolved: dict[type, Adapter] = {}
+_default_adapter = Adapter()
+_lock = threading.Lock()
+
+
+def register_adapter(
+	connection_type: type | str, adapter: csql.adapters.Adapter
+) -> None:
+	"""
+	Use ``adapter`` for connections that are instances of ``connection_type``, in preference to
+	anything registered for its base classes.
+
+	``connection_type`` can also be given as a ``"module.QualifiedName"`` string, to avoid importing
+	a driver that might not be installed.
+
+	.. code-block:: py
+
+	    class MyAdapter(csql.adapters.Adapter):
+	        def native_arrow(self, rq, con):
+	            return con.execute_arrow(rq.sql, rq.parameters)
+
+	    csql.adapters.register_adapter('mydriver.Connection', MyAdapter())
+	"""
+	with _lock:
+		_adapters[connection_type] = adapter
+		_resolved.clear()
+
+
+def adapter_for(con: Any) -> csql.adapters.Adapter:
+	"""
+	The :class:`Adapter` registered for the closest class of ``con``, or the DBAPI :class:`Adapter`
+	if there isn't one. This is only worked out once per connection type.
+	"""
+	t = type(con)
+	if (adapter := _resolved.get(t)) is not None:
+		return adapter
+	with _lock:
+		for cls in t.__mro__:
+			adapter = _adapters.get(cls) or _adapters.get(
+				f"{cls.__module__}.{cls.__qualname__}"
+			)
+			if adapter is not None:
+				break
+		else:
+			adapter = _default_adapter
+		_resolved[t] = adapter
+	return adapter
+
+
+def iter_batches(
+	rq: csql.RenderedQuery, con: Any, batch_size: int, format: BatchFormat
+) -> Iterator[Any]:
+	"""
+	Run ``rq`` on ``con``, and return an iterator of its results, ``batch_size`` rows at a time
+	(or thereabouts, for backends that decide their own batch sizes).
+
+	DuckDB and ClickHouse results are streamed with their native readers, and anything else
+	with DBAPI ``fetchmany``.
+	"""
+	# check these now, rather than whenever the first batch is asked for.
+	if batch_size < 1:
+		raise ValueError(f"batch_size needs to be at least 1, not {batch_size}")
+	if format not in get_args(BatchFormat):
+		raise ValueError(
+			f"format needs to be one of {get_args(BatchFormat)}, not {format!r}"
+		)
+	return adapter_for(con).iter_batches(rq, con, batch_size, format)
+
+
+def fetch_arrow(rq: csql.RenderedQuery, con: Any) -> pa.Table:
+	"""
+	Run ``rq`` on ``con``, and return its results as a :class:`pyarrow.Table`, using the backend's
+	own Arrow export where it has one.
+	"""
+	return adapter_for(con).to_arrow(rq, con)
+
+
+# (deadline, ids of connections already being timed out)
+_deadline: ContextVar[tuple[float, frozenset[int]] | None] = ContextVar(
+	"csql_deadline", default=None
+)
+
+
+@contextmanager
+def statement_timeout(
+	con: Any, seconds: float | None = None
+) -> Generator[None, None, None]:
+	"""
+	Cancel anything still running on ``con`` ``seconds`` from now, using whatever ``con``'s adapter
+	has for the job (see :meth:`Adapter.timeout`), and raise :class:`TimeoutError`.
+
+	.. code-block:: py
+
+	    with csql.adapters.statement_timeout(con, 30):
+	        df = q.preview_pd(con)
+
+	The deadline carries on to anything persisted while the block is running, including on other
+	connections: the builtin cachers run their SQL inside ``statement_timeout(connection)``, with no
+	``seconds``, which uses whatever is left of the enclosing deadline (or does nothing if there isn't
+	one, or if that connection can't be cancelled). Do the same in your own cachers.
+
+	:raises ValueError: if ``seconds`` is given, but ``con`` can't be cancelled.
+	"""
+	outer = _deadline.get()
+	if seconds is None and outer is None:
+		yield
+		return
+	if seconds is not None and seconds <= 0:
+		raise ValueError(f"timeout needs to be positive, not {seconds}")
+
+	now = time.monotonic()
+	outer_deadline, covered = outer or (math.inf, frozenset[int]())
+	deadline = outer_deadline if seconds is None else min(outer_deadline, now + seconds)
+	if id(con) in covered and deadline >= outer_deadline:
+		# already being timed out at least this soon.
+		yield
+		return
+	if deadline <= now:
+		raise TimeoutError("Ran out of time before starting")
+
+	timeout = adapter_for(con).timeout(con, deadline - now)
+	if timeout is None:
+		if seconds is not None:
+			raise ValueError(
+				f"Don't know how to time out queries on {type(con).__qualname__} connections. "
+				"Register an adapter for them with a timeout() method."
+			)
+		yield
+		return
+
+	token = _deadline.set((deadline, covered | {id(con)}))
+	try:
+		with timeout:
+			yield
+	finally:
+		_deadline.reset(token)
+
+
+@contextmanager
+def _interrupt_after(
+	seconds: float, interrupt: Callable[[], object]
+) -> Generator[None, None, None]:
+	done = threading.Event()
+	fired = threading.Event()
+
+	def watch() -> None:
+		if done.wait(seconds):
+			return
+		fired.set()
+		# interrupting only stops what's running right now, so keep at it until the block exits.
+		while True:
+			interrupt()
+			if done.wait(0.05):
+				return
+
+	threading.Thread(target=watch, name="csql-timeout", daemon=True).start()
+	try:
+		yield
+	except TimeoutError:
+		raise  # e.g. a cacher giving up on the same deadline
+	except Exception as e:
+		if fired.is_set():
+			raise TimeoutError(f"Cancelled after {seconds:.3g}s") from e
+		raise
+	finally:
+		done.set()
+
+
+@contextmanager
+def _session_timeout(
+	seconds: float, set_timeout: Callable[[], None], reset: Callable[[], None]
+) -> Generator[None, None, None]:
+	set_timeout()
+	start = time.monotonic()
+	try:
+		yield
+	except TimeoutError:
+		raise
+	except Exception as e:
+		# the database cancelled it, or it failed for some other reason - we can only go on how long it took.
+		if time.monotonic() - start >= seconds:
+			raise TimeoutError(f"Cancelled after {seconds:.3g}s") from e
+		raise
+	finally:
+		reset()
+
+
+def _execute(con: Any, sql: str) -> None:
+	c = con.cursor()
+	try:
+		c.execute(sql)
+	finally:
+		c.close()
+
+
+def _fetchone(con: Any, sql: str) -> tuple[Any, ...]:
+	c = con.cursor()
+	try:
+		c.execute(sql)
+		return tuple(c.fetchone())
+	finally:
+		c.close()
+
+
+def _quote(value: str) -> str:
+	escaped = value.replace("'", "''")
+	return f"'{escaped}'"
+
+
+def _fetchmany(
+	c: Any, rq: csql.RenderedQuery, batch_size: int
+) -> Iterator[list[tuple[Any, ...]]]:
+	try:
+		c.execute(*rq.db)
+		while batch := c.fetchmany(batch_size):
+			yield [tuple(row) for row in batch]
+	finally:
+		c.close()
+
+
+def _arrow_batches(batches: Any, format: BatchFormat) -> Iterator[Any]:
+	for batch in batches:
+		if format == "arrow":
+			yield batch
+		elif format == "pandas":
+			yield batch.to_pandas()
+		elif format == "polars":
+			import polars as pl
+
+			yield pl.from_arrow(batch)
+		else:
+			raise ValueError(f"Unknown batch format {format!r}")
+
+
+def _from_rows(
+	rows: list[tuple[Any, ...]], names: list[str], format: BatchFormat
+) -> Any:
+	if format == "arrow":
+		import pyarrow as pa  # pyright: ignore[reportMissingTypeStubs]
+
+		columns = list(zip(*rows))
+		return pa.RecordBatch.from_arrays(
+			[pa.array(col) for col in columns],
+			names=names,
+		)
+	elif format == "pandas":
+		import pandas as pd  # pyright: ignore[reportMissingTypeStubs]
+
+		return pd.DataFrame.from_records(rows, columns=names)
+	elif format == "polars":
+		import polars as pl
+
+		return pl.DataFrame(rows, schema=names, orient="row")
+	else:
+		raise ValueError(f"Unknown batch format {format!r}")
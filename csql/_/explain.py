@@ -0,0 +1,235 @@
+# explain output is untyped JSON.
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
+
+from __future__ import annotations
+
+import json
+from collections.abc import Iterator, Mapping
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from .execution import adapter_for
+from .models.dialect import Explain
+from .utils import assert_never
+
+if TYPE_CHECKING:
+	import csql
+	import csql.dialect
+	import csql.overrides
+
+
+class PlanNode(NamedTuple):
+	"""
+	One step of a query plan, as returned by :meth:`csql.Query.explain`. Whatever the database, plans
+	come back as a tree of these, so checks like this work on any of them:
+
+	>>> con = my_connection()
+	>>> _ = con.execute('create table events (id integer primary key, user text)')
+	>>> plan = Q('select * from events where id = 123', dialect=csql.dialect.SQLite).explain(con)
+	>>> assert not any(n.operation in ('SCAN', 'SEQ_SCAN') for n in plan.walk())
+
+	``print()`` a plan to see it as an indented tree.
+	"""
+
+	operation: str
+	"""What this step does, in the database's own words, e.g. ``SEQ_SCAN`` (DuckDB), ``ReadFromMergeTree`` (ClickHouse),
+	``TableScan`` (Snowflake) or ``SCAN`` (SQLite)."""
+	detail: str
+	"""Anything else the database said about this step, on one line."""
+	children: tuple[csql.PlanNode, ...]
+	"""The steps that feed into this one."""
+	estimated_rows: int | None = None
+	"""How many rows the database expects this step to produce, if it said."""
+	actual_rows: int | None = None
+	"""How many rows this step actually produced, if the plan was analyzed."""
+	seconds: float | None = None
+	"""How long this step took, if the plan was analyzed."""
+	raw: Any = None
+	"""This step as the database described it, e.g. a ``dict`` from its JSON output."""
+
+	def walk(self) -> Iterator[csql.PlanNode]:
+		"""This step, and every step under it, depth-first."""
+		yield self
+		for child in self.children:
+			yield from child.walk()
+
+	def render(self) -> str:
+		"""Render the plan as an indented tree."""
+		lines: list[str] = []
+
+		def walk(node: PlanNode, depth: int) -> None:
+			stats = [
+				f"{label}={value}"
+				for label, value in (
+					("est_rows", node.estimated_rows),
+					("rows", node.actual_rows),
+					(
+						"seconds",
+						None if node.seconds is None else f"{node.seconds:.3f}",
+					),
+				)
+				if value is not None
+			]
+			line = "  " * depth + node.operation
+			if stats:
+				line += f" ({', '.join(stats)})"
+			if node.detail:
+				line += f"  {node.detail}"
+			lines.append(line)
+			for child in node.children:
+				walk(child, depth + 1)
+
+		walk(self, 0)
+		return "\n".join(lines)
+
+	def __str__(self) -> str:
+		return self.render()
+
+
+def explain(
+	q: csql.Query,
+	con: Any,
+	analyze: bool = False,
+	dialect: csql.dialect.SQLDialect | None = None,
+	newParams: Mapping[str, Any] | None = None,
+	overrides: csql.overrides.Overrides | None = None,
+) -> csql.PlanNode:
+	"""See :meth:`csql.Query.explain`."""
+	from .models.query import RenderedQuery
+
+	dialect = dialect or q._default_dialect()
+	method = dialect.explain
+	if method is None:
+		raise ValueError(
+			f"Don't know how to explain queries in {dialect}. Set its explain= to a csql.dialect.Explain."
+		)
+	if analyze and method is not Explain.duckdb:
+		raise ValueError(f"Explain.{method.name} plans can't be analyzed.")
+
+	rq = q.build(dialect=dialect, newParams=newParams, overrides=overrides)
+	if method is Explain.duckdb:
+		prefix = (
+			"explain (analyze, format json)" if analyze else "explain (format json)"
+		)
+	elif method is Explain.clickhouse:
+		prefix = "explain json=1, description=1, indexes=1"
+	elif method is Explain.snowflake:
+		prefix = "explain using json"
+	elif method is Explain.sqlite:
+		prefix = "explain query plan"
+	else:
+		assert_never(method)
+
+	explain_rq = RenderedQuery(
+		sql=f"{prefix}\n{rq.sql}",
+		parameters=rq.parameters,
+		parameter_names=rq.parameter_names,
+	)
+	rows = [
+		row
+		for batch in adapter_for(con).iter_batches(explain_rq, con, 10_000, "tuples")
+		for row in batch
+	]
+	return parse_plan(method, rows)
+
+
+def parse_plan(method: csql.dialect.Explain, rows: list[tuple[Any, ...]]) -> PlanNode:
+	"""Turn the rows returned by an explain statement into a tree of :class:`PlanNode`-s."""
+	if method is Explain.duckdb:
+		# (explain_key, explain_value)
+		plan = json.loads(rows[0][1])
+		return _duckdb_node(plan[0] if isinstance(plan, list) else plan)
+	elif method is Explain.clickhouse:
+		plan = json.loads("\n".join(row[0] for row in rows))
+		return _clickhouse_node(plan[0]["Plan"])
+	elif method is Explain.snowflake:
+		return _snowflake_plan(json.loads(rows[0][0]))
+	elif method is Explain.sqlite:
+		return _sqlite_plan(rows)
+	else:
+		assert_never(method)
+
+
+def _detail(info: Mapping[str, Any], skip: tuple[str, ...] = ()) -> str:
+	def fmt(v: Any) -> str:
+		return ", ".join(map(str, v)) if isinstance(v, list) else str(v)
+
+	return "; ".join(f"{k}: {fmt(v)}" for k, v in info.items() if k not in skip and v)
+
+
+def _int(v: Any) -> int | None:
+	try:
+		return int(v)
+	except (TypeError, ValueError):
+		return None
+
+
+def _duckdb_node(node: Mapping[str, Any]) -> PlanNode:
+	children = [_duckdb_node(c) for c in node.get("children", [])]
+	if "operator_type" not in node and "name" not in node:
+		# the top level of an analyzed plan is stats about the whole query, with an
+		# EXPLAIN_ANALYZE operator under it.
+		[child] = children
+		[root] = child.children
+		return root
+
+	info = node.get("extra_info", {})
+	analyzed = "operator_type" in node
+	return PlanNode(
+		operation=node["operator_type"] if analyzed else node["name"],
+		detail=_detail(info, skip=("Estimated Cardinality",)),
+		children=tuple(children),
+		estimated_rows=_int(info.get("Estimated Cardinality")),
+		actual_rows=node.get("operator_cardinality") if analyzed else None,
+		seconds=node.get("operator_timing") if analyzed else None,
+		raw=node,
+	)
+
+
+def _clickhouse_node(node: Mapping[str, Any]) -> PlanNode:
+	return PlanNode(
+		operation=node["Node Type"],
+		detail=_detail(node, skip=("Node Type", "Node Id", "Plans")),
+		children=tuple(_clickhouse_node(c) for c in node.get("Plans", [])),
+		raw=node,
+	)
+
+
+def _snowflake_plan(plan: Mapping[str, Any]) -> PlanNode:
+	[operations] = plan["Operations"]
+	children: dict[int | None, list[Mapping[str, Any]]] = {}
+	for op in operations:
+		for parent in op.get("parentOperators", [None]):
+			children.setdefault(parent, []).append(op)
+
+	def node(op: Mapping[str, Any]) -> PlanNode:
+		return PlanNode(
+			operation=op["operation"],
+			detail=_detail(op, skip=("id", "operation", "parentOperators")),
+			children=tuple(node(c) for c in children.get(op["id"], [])),
+			raw=op,
+		)
+
+	[root] = children[None]
+	return node(root)
+
+
+def _sqlite_plan(rows: list[tuple[Any, ...]]) -> PlanNode:
+	# (id, parent, notused, detail)
+	children: dict[int, list[tuple[Any, ...]]] = {}
+	for row in rows:
+		children.setdefault(row[1], []).append(row)
+
+	def node(row: tuple[Any, ...]) -> PlanNode:
+		operation, _, detail = row[3].partition(" ")
+		return PlanNode(
+			operation=operation,
+			detail=detail,
+			children=tuple(node(c) for c in children.get(row[0], [])),
+			raw=row,
+		)
+
+	return PlanNode(
+		operation="QUERY PLAN",
+		detail="",
+		children=tuple(node(r) for r in children.get(0, [])),
+	)
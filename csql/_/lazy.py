@@ -0,0 +1,218 @@
+# serialized polars expressions are untyped JSON.
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
+
+from __future__ import annotations
+
+import functools
+import json
+import re
+from collections.abc import Iterator, Mapping
+from typing import TYPE_CHECKING, Any
+
+from .execution import adapter_for
+from .utils import limit_query
+
+if TYPE_CHECKING:
+	import polars as pl
+
+	import csql
+	import csql.dialect
+	import csql.overrides
+
+_DEFAULT_BATCH_SIZE = 100_000
+
+_OPS = {
+	"Eq": "=",
+	"NotEq": "<>",
+	"Lt": "<",
+	"LtEq": "<=",
+	"Gt": ">",
+	"GtEq": ">=",
+	"And": "and",
+	"Or": "or",
+}
+
+
+def lazy_pl(
+	q: csql.Query,
+	con: Any,
+	schema: Mapping[str, Any] | None = None,
+	dialect: csql.dialect.SQLDialect | None = None,
+	newParams: Mapping[str, Any] | None = None,
+	overrides: csql.overrides.Overrides | None = None,
+) -> pl.LazyFrame:
+	"""See :meth:`csql.Query.lazy_pl`."""
+	import polars as pl
+	from polars.io.plugins import register_io_source
+
+	@functools.cache
+	def get_schema() -> pl.Schema:
+		if schema is not None:
+			return pl.Schema(schema)
+		rq = limit_query(q, 0, dialect).build(
+			dialect=dialect, newParams=newParams, overrides=overrides
+		)
+		return adapter_for(con).to_polars(rq, con).schema
+
+	def source(
+		with_columns: list[str] | None,
+		predicate: pl.Expr | None,
+		n_rows: int | None,
+		batch_size: int | None,
+	) -> Iterator[pl.DataFrame]:
+		rq = pushdown_query(
+			q, with_columns, predicate, n_rows, dialect, get_schema()
+		).build(dialect=dialect, newParams=newParams, overrides=overrides)
+		batches = adapter_for(con).iter_batches(
+			rq, con, batch_size or _DEFAULT_BATCH_SIZE, "polars"
+		)
+		for df in batches:
+			# the pushed-down SQL might not have covered the whole predicate, so
+			# polars still needs to apply it.
+			if predicate is not None:
+				df = df.filter(predicate)
+			if with_columns is not None:
+				df = df.select(with_columns)
+			yield df
+
+	return register_io_source(source, schema=get_schema)
+
+
+def pushdown_query(
+	q: csql.Query,
+	with_columns: list[str] | None,
+	predicate: pl.Expr | None,
+	n_rows: int | None,
+	dialect: csql.dialect.SQLDialect | None,
+	schema: Mapping[str, Any] | None = None,
+) -> csql.Query:
+	"""
+	Wrap ``q`` in ``select <columns> from (q limit <n_rows>) where <predicate>``, as far as we can translate them.
+	polars only passes both ``n_rows`` and a predicate for ``lf.head(n).filter(...)``, so the limit goes first.
+	"""
+	from .api import Q
+	from .models.query import Parameters
+
+	columns = None
+	if with_columns and predicate is not None:
+		# the predicate might need columns that aren't being selected.
+		columns = list(dict.fromkeys([*with_columns, *predicate.meta.root_names()]))
+	elif with_columns:
+		columns = with_columns
+
+	select = "*" if columns is None else ", ".join(_quote(c) for c in columns)
+	query_str = f"select {select} from {limit_query(q, n_rows, dialect)}"
+	if predicate is not None:
+		params = Parameters()
+		if (where := predicate_sql(predicate, params, schema)) is not None:
+			query_str += f" where {where}"
+	return Q(query_str)
+
+
+def predicate_sql(
+	predicate: pl.Expr, params: csql.Parameters, schema: Mapping[str, Any] | None = None
+) -> str | None:
+	"""
+	Translate as much of a polars predicate as we can to SQL, with literals added to ``params``.
+	The result might match more rows than ``predicate`` (if we had to leave some of it out),
+	but never fewer. Returns ``None`` if we couldn't translate any of it.
+	Casts are only translated if ``schema`` shows they can't lose anything.
+	"""
+	dtypes = {name: str(dtype) for name, dtype in (schema or {}).items()}
+	try:
+		node = json.loads(predicate.meta.serialize(format="json"))
+		return _node_sql(node, params, dtypes)
+	except (ValueError, TypeError, KeyError, AttributeError):
+		# polars doesn't promise to keep this format stable.
+		return None
+
+
+def _node_sql(
+	node: Any, params: csql.Parameters, dtypes: Mapping[str, str]
+) -> str | None:
+	if not isinstance(node, dict) or len(node) != 1:
+		return None
+	[(kind, body)] = node.items()
+
+	if kind == "Column":
+		return _quote(body)
+
+	elif kind == "Literal":
+		[(scalar_kind, scalar)] = body.items()
+		if scalar_kind not in ("Scalar", "Dyn"):
+			return None
+		[(dtype, value)] = scalar.items()
+		if not dtype.startswith(("Int", "UInt", "Float", "String", "Str", "Boolean")):
+			return None
+		if not isinstance(value, (bool, int, float, str)):
+			return None
+		return f"{params.add(value)}"
+
+	elif kind == "BinaryExpr":
+		op = _OPS.get(body["op"])
+		if op is None:
+			return None
+		left = _node_sql(body["left"], params, dtypes)
+		right = _node_sql(body["right"], params, dtypes)
+		if op == "and":
+			# dropping one side of an and only lets more rows through, which polars will filter.
+			parts = [part for part in (left, right) if part is not None]
+			return f"({' and '.join(parts)})" if parts else None
+		if left is None or right is None:
+			return None
+		return f"({left} {op} {right})"
+
+	elif kind == "Function":
+		function = body["function"]
+		if function == {"Boolean": "IsNull"}:
+			op = "is null"
+		elif function == {"Boolean": "IsNotNull"}:
+			op = "is not null"
+		else:
+			return None
+		[arg] = body["input"]
+		if (arg_sql := _node_sql(arg, params, dtypes)) is None:
+			return None
+		return f"({arg_sql} {op})"
+
+	elif kind == "Cast":
+		# a cast that can't lose anything doesn't change how a column compares in SQL,
+		# but truncating or narrowing one could.
+		expr, dtype = body["expr"], body["dtype"].get("Literal")
+		if not isinstance(dtype, str) or not isinstance(
+			column := expr.get("Column"), str
+		):
+			return None
+		if column not in dtypes or not _widens(dtypes[column], dtype):
+			return None
+		return _node_sql(expr, params, dtypes)
+
+	return None
+
+
+def _quote(name: str) -> str:
+	escaped = name.replace('"', '""')
+	return f'"{escaped}"'
+
+
+def _widens(source: str, target: str) -> bool:
+	"""Whether casting a ``source`` column to ``target`` keeps every value exactly."""
+	if source == target:
+		return True
+	source_match = re.fullmatch(r"(UInt|Int|Float)(\d+)", source)
+	target_match = re.fullmatch(r"(UInt|Int|Float)(\d+)", target)
+	if source_match is None or target_match is None:
+		return False
+	source_kind, source_bits = source_match[1], int(source_match[2])
+	target_kind, target_bits = target_match[1], int(target_match[2])
+	if target_kind == "Float":
+		# floats hold ints exactly up to their mantissa size.
+		mantissa = {32: 24, 64: 53}.get(target_bits, 0)
+		if source_kind == "Float":
+			return source_bits < target_bits
+		return source_bits - (source_kind == "Int") < mantissa
+	if source_kind == "Float":
+		return False
+	if source_kind == "UInt":
+		return source_bits < target_bits
+	return target_kind == "Int" and source_bits < target_bits
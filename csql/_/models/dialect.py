@@ -71,6 +71,69 @@ class Limit(enum.Enum):
 		return f"Limit.{self.name}"
 
 
+class Sample(enum.Enum):
+	"""
+	Enum to define how to sample the queries that previews are built from (see the ``sample``
+	argument of :meth:`csql.Query.preview_pd`).
+	"""
+
+	using_sample = auto()
+	"""
+	Use DuckDB's ``using sample`` clause, e.g. ``select * from (query) using sample 1% (bernoulli)``.
+
+	:meta hide-value:
+	"""
+	tablesample = auto()
+	"""
+	Use a ``tablesample`` clause, e.g. ``select * from (query) tablesample bernoulli (1)``.
+
+	:meta hide-value:
+	"""
+	rand_canonical = auto()
+	"""
+	Filter on ClickHouse's ``randCanonical()``, e.g. ``select * from (query) where randCanonical() < 0.01``.
+
+	:meta hide-value:
+	"""
+
+	def __repr__(self) -> str:
+		return f"Sample.{self.name}"
+
+
+class Explain(enum.Enum):
+	"""
+	Enum to define how :meth:`csql.Query.explain` asks for, and reads, query plans.
+	"""
+
+	duckdb = auto()
+	"""
+	Use DuckDB's ``explain (format json)``, or ``explain (analyze, format json)``.
+
+	:meta hide-value:
+	"""
+	clickhouse = auto()
+	"""
+	Use ClickHouse's ``explain json=1``.
+
+	:meta hide-value:
+	"""
+	snowflake = auto()
+	"""
+	Use Snowflake's ``explain using json``.
+
+	:meta hide-value:
+	"""
+	sqlite = auto()
+	"""
+	Use SQLite's ``explain query plan``.
+
+	:meta hide-value:
+	"""
+
+	def __repr__(self) -> str:
+		return f"Explain.{self.name}"
+
+
 @dataclass(frozen=True)
 class SQLDialect:
 	"""
@@ -99,23 +162,42 @@ class SQLDialect:
 
 	paramstyle: csql.dialect.ParamStyle = ParamStyle.numeric
 	limit: csql.dialect.Limit = Limit.limit
+	sample: csql.dialect.Sample | None = None
+	explain: csql.dialect.Explain | None = None
 
 	# experiments for doc gen
 
 
-Snowflake = SQLDialect(paramstyle=ParamStyle.numeric, limit=Limit.limit)
+Snowflake = SQLDialect(
+	paramstyle=ParamStyle.numeric,
+	limit=Limit.limit,
+	sample=Sample.tablesample,
+	explain=Explain.snowflake,
+)
 """A dialect for Snowflake"""
 
-DuckDB = SQLDialect(paramstyle=ParamStyle.numeric_dollar, limit=Limit.limit)
+DuckDB = SQLDialect(
+	paramstyle=ParamStyle.numeric_dollar,
+	limit=Limit.limit,
+	sample=Sample.using_sample,
+	explain=Explain.duckdb,
+)
 """A dialect for DuckDB"""
 
 MSSQL = SQLDialect(paramstyle=ParamStyle.numeric, limit=Limit.top_n)
 """A dialect for MS SQL Server"""
 
-SQLite = SQLDialect(paramstyle=ParamStyle.qmark, limit=Limit.limit)
+SQLite = SQLDialect(
+	paramstyle=ParamStyle.qmark, limit=Limit.limit, explain=Explain.sqlite
+)
 """A dialect for SQLite."""
 
-ClickHouse = SQLDialect(paramstyle=ParamStyle.clickhouse, limit=Limit.limit)
+ClickHouse = SQLDialect(
+	paramstyle=ParamStyle.clickhouse,
+	limit=Limit.limit,
+	sample=Sample.rand_canonical,
+	explain=Explain.clickhouse,
+)
 
 # def __repr__(self) -> str:
 # 	import inspect
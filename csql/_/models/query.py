@@ -5,11 +5,12 @@ import dataclasses
 # from .persisted_query import PersistedQuery
 import itertools
 from abc import ABCMeta
-from collections.abc import Collection, Hashable, Iterable, Mapping
+from collections.abc import Collection, Hashable, Iterable, Iterator, Mapping
 from dataclasses import dataclass
 from typing import (
 	TYPE_CHECKING,
 	Any,
+	Literal,
 	NamedTuple,
 	Protocol,
 	TypedDict,
@@ -22,8 +23,12 @@ from ..utils import unique
 from .dialect import SQLDialect
 
 if TYPE_CHECKING:
+	from collections.abc import Callable, Sequence
+	from concurrent.futures import Executor, Future
+
 	import pandas as pd  # pyright: ignore[reportMissingTypeStubs]
 	import polars as pl
+	import pyarrow as pa  # pyright: ignore[reportMissingTypeStubs]
 	from typing_extensions import Self
 
 	# import public interface so we can avoid internal ._....  appearing in
@@ -33,6 +38,7 @@ if TYPE_CHECKING:
 	import csql.overrides
 	import csql.persist
 
+	from ..renderer.query import QueryRenderer
 	from .overrides import Overrides
 
 
@@ -196,6 +202,8 @@ class Query(QueryBit, InstanceTracking):
 		dialect: csql.dialect.SQLDialect | None = None,
 		newParams: Mapping[str, ParameterValue] | None = None,
 		overrides: csql.overrides.Overrides | None = None,
+		sample: float | None = None,
+		timeout: float | None = None,
 	) -> pd.DataFrame:
 		"""
 		Return a small dataframe to preview the results of this query.
@@ -209,21 +217,28 @@ class Query(QueryBit, InstanceTracking):
 		0  123
 
 
-		:param con: A DBAPI-compliant connection, passed directly to ``con`` arg of :func:`pandas.read_sql`.
+		:param con: A DBAPI-compliant connection, passed directly to ``con`` arg of :func:`pandas.read_sql`,
+		            or any other connection with an adapter in :mod:`csql.adapters`.
 		:param rows: The number of rows to pull.
+		:param sample: If given, sample this percentage of rows from the bottom of the query tree (the queries
+		               that don't reference others, and persisted queries), so anything expensive built on top
+		               of them has less to chew through. Only for dialects with a :class:`csql.dialect.Sample`
+		               method - for others, this is ignored. Bear in mind that joins of sampled queries will
+		               match fewer rows than usual, and aggregates will be smaller.
+		:param timeout: If given, cancel the preview and raise :class:`TimeoutError` if it takes longer than this
+		                many seconds, including persisting anything it depends on. See
+		                :func:`csql.adapters.statement_timeout`.
 		:rtype: :class:`pandas.DataFrame`
 		"""
-		import pandas as pd  # pyright: ignore[reportMissingTypeStubs]
-
+		from ..execution import adapter_for, statement_timeout
 		from ..utils import limit_query
 
-		previewQ = limit_query(self, rows, dialect)
-		return pd.read_sql(  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
-			**previewQ.build(
+		previewQ = limit_query(self, rows, dialect, sample)
+		with statement_timeout(con, timeout):
+			preview = previewQ.build(
 				dialect=dialect, newParams=newParams, overrides=overrides
-			).pd,
-			con=con,
-		)
+			)
+			return adapter_for(con).to_pandas(preview, con)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
 
 	def preview_pl(
 		self,
@@ -232,71 +247,215 @@ class Query(QueryBit, InstanceTracking):
 		dialect: csql.dialect.SQLDialect | None = None,
 		newParams: Mapping[str, ParameterValue] | None = None,
 		overrides: csql.overrides.Overrides | None = None,
+		sample: float | None = None,
+		timeout: float | None = None,
 	) -> pl.DataFrame:
 		"""
 		Return a small polars DataFrame to preview the results of this query.
 
+		Arguments are the same as :meth:`preview_pd`.
+
 		:rtype: :class:`polars.DataFrame`
 		"""
-		import polars as pl
-
+		from ..execution import adapter_for, statement_timeout
 		from ..utils import limit_query
 
-		previewQ = limit_query(self, rows, dialect)
-		preview = previewQ.build(
-			dialect=dialect, newParams=newParams, overrides=overrides
-		)
+		previewQ = limit_query(self, rows, dialect, sample)
+		with statement_timeout(con, timeout):
+			preview = previewQ.build(
+				dialect=dialect, newParams=newParams, overrides=overrides
+			)
+			return adapter_for(con).to_polars(preview, con)
 
-		try:
-			import clickhouse_connect  # pyright: ignore[reportMissingTypeStubs]
-			import clickhouse_connect.driver  # pyright: ignore[reportMissingTypeStubs]
-		except ImportError:
-			clickhouse_connect = None
+	def lazy_pl(
+		self,
+		con: Any,
+		schema: Mapping[str, Any] | None = None,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> pl.LazyFrame:
+		"""
+		Return a polars :class:`~polars.LazyFrame` of this query's results. Nothing is run until it's collected,
+		and then the columns it selects, the filters it applies and ``head(n)`` are pushed back into the SQL, as
+		``select <columns> from (query limit n) where <filters>``, so only what's needed comes over the wire.
+
+		>>> import polars as pl
+		>>> c = sqlite3.connect(':memory:', check_same_thread=False)  # polars collects on its own threads
+		>>> lf = Q('select 1 as a, 2 as b union all select 3, 4').lazy_pl(c, schema={'a': pl.Int64, 'b': pl.Int64})
+		>>> lf.filter(pl.col('a') > 1).select('b').collect().to_dicts()
+		[{'b': 4}]
 
-		if clickhouse_connect is not None and isinstance(
-			con, clickhouse_connect.driver.Client
-		):
-			return con.query_df_arrow(**preview.ch, dataframe_library="polars")  # pyright: ignore[reportUnknownVariableType, reportUnknownMemberType] # mypy: ignore[no-any-return]
+		Filters are translated to SQL as far as possible (column comparisons with literals, ``&``, ``|``,
+		``is_null()``, ``is_not_null()`` and casts that can't lose anything), and polars applies them again
+		to the results, so anything that couldn't be translated still works, just without being pushed down.
 
-		try:
-			import duckdb
-		except ImportError:
-			duckdb = None  # mypy: ignore[assignment]
-		if duckdb is not None and isinstance(con, duckdb.DuckDBPyConnection):
-			return con.query(**preview.ddb).pl()
-
-		return pl.read_database(  # pyright: ignore[reportUnknownMemberType]
-			preview.sql, con, execute_options={"parameters": preview.parameters}
+		:param con: Any connection that :meth:`preview_pl` accepts. It's used every time the frame is collected,
+		            from polars' own threads.
+		:param schema: The schema of the results, if you know it. Otherwise it's found by running the
+		               query with ``limit 0`` - for connections without an Arrow-native :mod:`adapter<csql.adapters>`,
+		               you might need to pass it, as their column types can't be found without any rows.
+
+		Other arguments are the same as :meth:`build`.
+
+		:rtype: :class:`polars.LazyFrame`
+		"""
+		from ..lazy import lazy_pl
+
+		return lazy_pl(
+			self,
+			con,
+			schema=schema,
+			dialect=dialect,
+			newParams=newParams,
+			overrides=overrides,
 		)
 
-	def build(
+	def to_arrow(  # pyright: ignore[reportUnknownParameterType]
+		self,
+		con: Any,
+		rows: int | None = None,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+		timeout: float | None = None,
+	) -> pa.Table:  # pyright: ignore[reportUnknownMemberType]
+		"""
+		Run this query and return its results as a :class:`pyarrow.Table`. DuckDB connections,
+		``clickhouse_connect`` clients and ADBC connections hand over Arrow data directly, without
+		converting it to Python objects and back. Anything else is treated as a DBAPI connection,
+		unless it has its own adapter in :mod:`csql.adapters`.
+
+		>>> c = my_connection()
+		>>> Q('select 123 as val').to_arrow(c).to_pydict()
+		{'val': [123]}
+
+		:param con: A DuckDB connection, ClickHouse client, ADBC connection, or DBAPI-compliant connection.
+		:param rows: The number of rows to pull, or ``None`` for all of them.
+		:param timeout: If given, cancel the query and raise :class:`TimeoutError` after this many seconds,
+		                like :meth:`preview_pd`.
+		:rtype: :class:`pyarrow.Table`
+		"""
+		from ..execution import fetch_arrow, statement_timeout  # pyright: ignore[reportUnknownVariableType]
+		from ..utils import limit_query
+
+		q = limit_query(self, rows, dialect)
+		with statement_timeout(con, timeout):
+			return fetch_arrow(  # pyright: ignore[reportUnknownVariableType]
+				q.build(dialect=dialect, newParams=newParams, overrides=overrides), con
+			)
+
+	def iter_batches(
+		self,
+		con: Any,
+		batch_size: int = 10_000,
+		format: Literal["tuples", "arrow", "pandas", "polars"] = "tuples",
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> Iterator[Any]:
+		"""
+		Run this query and stream all of its results, ``batch_size`` rows at a time, so memory use
+		stays the same however big the results are.
+
+		>>> c = my_connection()
+		>>> q = Q('select 1 as val union all select 2 union all select 3')
+		>>> for batch in q.iter_batches(c, batch_size=2):
+		...     print(batch)
+		[(1,), (2,)]
+		[(3,)]
+
+		DuckDB connections are streamed with Arrow record batch readers, and ClickHouse clients with
+		``query_arrow_stream()``/``query_row_block_stream()``, where ``batch_size`` becomes ClickHouse's
+		``max_block_size``. Anything else is treated as a DBAPI connection, and read with ``fetchmany()``.
+
+		:param con: A DuckDB connection, ClickHouse client, or DBAPI-compliant connection.
+		:param batch_size: How many rows to fetch at a time.
+		:param format: What each batch should be: ``"tuples"`` for a list of tuples, ``"arrow"`` for a
+		               :class:`pyarrow.RecordBatch`, ``"pandas"`` for a :class:`pandas.DataFrame`,
+		               or ``"polars"`` for a :class:`polars.DataFrame`.
+
+		Other arguments are the same as :meth:`build`.
+		"""
+		from ..execution import iter_batches
+
+		rq = self.build(dialect=dialect, newParams=newParams, overrides=overrides)
+		return iter_batches(rq, con, batch_size, format)
+
+	def partitioned(
 		self,
+		connect: Callable[[], Any],
+		splits: int | None = None,
 		*,
+		ranges: Sequence[tuple[ParameterValue, ParameterValue]] | None = None,
+		start: str = "start",
+		end: str = "end",
+		max_workers: int | None = None,
+		release: Callable[[Any], None] | None = None,
+		format: Literal["pandas", "polars", "arrow"] = "arrow",
+		timeout: float | None = None,
 		dialect: csql.dialect.SQLDialect | None = None,
 		newParams: Mapping[str, ParameterValue] | None = None,
 		overrides: csql.overrides.Overrides | None = None,
-	) -> csql.RenderedQuery:
+	) -> Any:
 		"""
-		Build this :class:`csql.Query` into a :class:`csql.RenderedQuery`.
+		Run this query as several smaller queries over disjoint sub-ranges of a range parameter,
+		concurrently, and concatenate their results. The query needs a ``start`` and ``end`` parameter,
+		and must return exactly the rows with ``start <= column < end``:
 
-		While you can specify paramters to manually override how this Query is rendered, it's normally
-		better to just supply these as defaults when you create your Queries in the first place. See: :ref:`sql-dialects`.
+		.. code-block:: py
 
-		:param dialect: An optional :class:`csql.dialect.SQLDialect` to render as. See :ref:`sql-dialects`.
-		:param newParams: A dictionary of ``{'key': value}`` to override any parameters. See: :ref:`reparam`.
-		:param overrides: An optional :class:`csql.overrides.Overrides` to override how rendering workd. See: :ref:`overrides`.
+		    p = Parameters(start=date(2024, 1, 1), end=date(2024, 4, 1))
+		    q = Q(f'select * from events where day >= {p.start} and day < {p.end}')
+		    df = q.partitioned(lambda: connect_to_warehouse(), splits=6, format='pandas')
+
+		Each sub-range is re-parameterized through ``newParams``, just like :ref:`reparam`, and run with
+		:func:`csql.run_all`, so the connection arguments work the same way as there.
+
+		Results are concatenated in range order, lowest first, and rows within each sub-range keep
+		whatever order the query gives them. So, if the query is ordered by the range column, so is the
+		result - but an ``order by`` on anything else only holds within each sub-range, and a ``limit``
+		applies to each sub-range separately.
+
+		:param connect: Called on each worker thread to get that thread's connection.
+		:param splits: How many equal sub-ranges to split the query's current ``[start, end)`` range into.
+		               Ints are split on whole numbers, and dates on whole days.
+		:param ranges: An explicit list of ``(start, end)`` sub-ranges to run instead.
+		:param start: The name of the parameter holding the (inclusive) start of the range.
+		:param end: The name of the parameter holding the (exclusive) end of the range.
+		:param format: ``"pandas"``, ``"polars"`` or ``"arrow"``.
+
+		Other arguments are the same as :func:`csql.run_all`. If any sub-range fails, its error is raised.
 		"""
-		dialect = dialect or self._default_dialect()
-		from ..persist import cache_replacer
+		from ..run import run_partitioned
+
+		return run_partitioned(
+			self,
+			connect,
+			splits,
+			ranges=ranges,
+			start=start,
+			end=end,
+			max_workers=max_workers,
+			release=release,
+			format=format,
+			timeout=timeout,
+			dialect=dialect,
+			newParams=newParams,
+			overrides=overrides,
+		)
+
+	def _renderer(
+		self,
+		dialect: csql.dialect.SQLDialect | None,
+		overrides: csql.overrides.Overrides | None,
+	) -> QueryRenderer:
+		"""Resolve the dialect and overrides to use, and make a QueryRenderer from them."""
 		from ..renderer.parameters import ParameterRenderer
 		from ..renderer.query import BoringSQLRenderer, QueryRenderer
 		from .overrides import Overrides
-		from .query_replacers import (
-			params_replacer,
-			pre_build_replacer,
-			replace_queries_in_tree,
-		)
 
+		dialect = dialect or self._default_dialect()
 		overrides = overrides or self._default_overrides() or Overrides()
 
 		ParamRenderer = (
@@ -318,14 +477,42 @@ class Query(QueryBit, InstanceTracking):
 			raise TypeError(
 				f"{QueryRenderer} needs to be a subclass of csql.SQLRenderer"
 			)
-		queryRenderer = QR(ParamRenderer, dialect=dialect)
+		return QR(ParamRenderer, dialect=dialect)
+
+	def build(
+		self,
+		*,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> csql.RenderedQuery:
+		"""
+		Build this :class:`csql.Query` into a :class:`csql.RenderedQuery`.
+
+		While you can specify paramters to manually override how this Query is rendered, it's normally
+		better to just supply these as defaults when you create your Queries in the first place. See: :ref:`sql-dialects`.
+
+		:param dialect: An optional :class:`csql.dialect.SQLDialect` to render as. See :ref:`sql-dialects`.
+		:param newParams: A dictionary of ``{'key': value}`` to override any parameters. See: :ref:`reparam`.
+		:param overrides: An optional :class:`csql.overrides.Overrides` to override how rendering workd. See: :ref:`overrides`.
+		"""
+		from ..persist import cache_replacer
+		from ..persist.usage import track_usage
+		from .query_replacers import (
+			params_replacer,
+			pre_build_replacer,
+			replace_queries_in_tree,
+		)
+
+		queryRenderer = self._renderer(dialect, overrides)
 
 		new_self = self
 		new_self = replace_queries_in_tree(params_replacer(newParams), new_self)
+		new_self = track_usage(new_self)
 		new_self = replace_queries_in_tree(cache_replacer(queryRenderer), new_self)
 		new_self = replace_queries_in_tree(pre_build_replacer(), new_self)
 
-		queryRenderer = QR(ParamRenderer, dialect=dialect)
+		queryRenderer = self._renderer(dialect, overrides)
 		return queryRenderer.render(new_self)
 
 		# return RenderedQuery(
@@ -334,6 +521,94 @@ class Query(QueryBit, InstanceTracking):
 		# 	parameter_names = rendered.parameter_names
 		# )
 
+	def plan(
+		self,
+		*,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> csql.persist.BuildPlan:
+		"""
+		Work out what building this :class:`csql.Query` would involve, without persisting anything. Returns a
+		:class:`csql.persist.BuildPlan` listing the persisted queries that still need saving, and the final SQL.
+		Nothing is executed until you call :meth:`BuildPlan.materialize()<csql.persist.BuildPlan.materialize>`.
+
+		Takes the same arguments as :meth:`build`.
+		"""
+		from ..persist.plan import make_plan
+
+		return make_plan(
+			self, dialect=dialect, newParams=newParams, overrides=overrides
+		)
+
+	def explain(
+		self,
+		con: Any,
+		analyze: bool = False,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> csql.PlanNode:
+		"""
+		Ask the database how it would run this query, and return its plan as a tree of :class:`csql.PlanNode`-s.
+		The explain syntax, and how its output is read, come from the dialect's :class:`csql.dialect.Explain` setting.
+
+		>>> con = my_connection()
+		>>> _ = con.execute('create table events (id integer primary key, user text)')
+		>>> plan = Q('select * from events where id = 123', dialect=csql.dialect.SQLite).explain(con)
+		>>> print(plan)  # doctest: +SKIP
+		QUERY PLAN
+		  SEARCH  events USING INTEGER PRIMARY KEY (rowid=?)
+
+		Handy in tests, to catch generated queries that would scan a whole table:
+
+		>>> assert not any(n.operation == 'SCAN' for n in plan.walk())
+
+		:param analyze: Run the query too, and include the actual rows and time taken by each step.
+		                Only DuckDB supports this.
+
+		Other arguments are the same as :meth:`build`.
+		"""
+		from ..explain import explain
+
+		return explain(
+			self,
+			con,
+			analyze=analyze,
+			dialect=dialect,
+			newParams=newParams,
+			overrides=overrides,
+		)
+
+	def profile(
+		self,
+		con: Any,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> csql.Profile:
+		"""
+		Find out which queries in this query's tree are slow. Each referenced query, and then this one, is run
+		on its own as ``select count(*) from (query)``, upstream first, and timed. Returns a :class:`csql.Profile`
+		of the results; ``print()`` it to see them as a tree.
+
+		>>> con = my_connection()
+		>>> q1 = Q('select * from events')
+		>>> q2 = Q(f'select user, count(*) from {q1} group by user')
+		>>> print(q2.profile(con))  # doctest: +SKIP
+
+		Each query's time includes everything upstream of it, because that has to run too. So as well as the
+		total, each :class:`csql.ProfileNode` has an estimate of the time taken by the query itself. Persisted
+		queries are persisted first, if they haven't been, and then timed as reads of their saved results.
+
+		Other arguments are the same as :meth:`build`.
+		"""
+		from ..profile import profile
+
+		return profile(
+			self, con, dialect=dialect, newParams=newParams, overrides=overrides
+		)
+
 	@property
 	def pd(self) -> dict[str, Any]:
 		"""
@@ -430,6 +705,54 @@ class Query(QueryBit, InstanceTracking):
 		"""
 		return cacher.persist(self, tag)
 
+	def warm(
+		self,
+		executor: Executor | None = None,
+		*,
+		dialect: csql.dialect.SQLDialect | None = None,
+		newParams: Mapping[str, ParameterValue] | None = None,
+		overrides: csql.overrides.Overrides | None = None,
+	) -> list[Future[csql.RenderedQuery]]:
+		"""
+		Start persisting every persisted query this one references (or this one, if it's persisted itself)
+		in the background, and return straight away. Building this query later will re-use those results,
+		or wait for any that are still in progress, rather than persisting them again.
+
+		Takes an optional :class:`concurrent.futures.Executor`, plus the same arguments as :meth:`build`.
+		See :func:`csql.warm`, which does the same for many queries at once.
+		"""
+		from ..persist.warm import warm
+
+		return warm(
+			[self],
+			executor,
+			dialect=dialect,
+			newParams=newParams,
+			overrides=overrides,
+		)
+
+	def depends_on(self, *sources: csql.persist.Source) -> csql.Query:
+		"""
+		Declares that this query reads from the given :class:`csql.persist.Source`-s. Their versions
+		become part of the key of this query, and of anything downstream of it, when persisted, so a
+		change to a source means a fresh materialization instead of a stale one.
+
+		>>> cache = csql.contrib.persist.TempTableCacher(my_connection())
+		>>> version = 1
+		>>> view = csql.persist.Source(lambda: version)
+		>>> q = Q('select * from slow_view').depends_on(view)
+		>>> q2 = Q(f'select count(*) from {q}').persist(cache)
+		>>> first = q2.build().sql
+		>>> q2.build().sql == first
+		True
+		>>> version = 2
+		>>> q2.build().sql == first
+		False
+		"""
+		from ..persist.sources import with_sources
+
+		return with_sources(self, sources)
+
 
 ParameterValue = Hashable | Collection[Hashable]
 
@@ -4,11 +4,13 @@ import hashlib
 import logging
 import pickle
 import threading
+import time
 from abc import ABC, abstractmethod
-from collections import defaultdict
-from collections.abc import Callable
-from dataclasses import dataclass
-from typing import TYPE_CHECKING, ClassVar
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from contextlib import AbstractContextManager
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, ClassVar, Literal, NamedTuple
 
 from csql import Q as Q
 
@@ -17,6 +19,10 @@ from ..models.query import Query, QueryExtension, RenderedQuery
 from ..models.query import QueryBit as QueryBit
 from ..models.query_replacers import QueryReplacer
 from ..renderer.query import QueryRenderer
+from .index import SQLiteKeyIndex as SQLiteKeyIndex
+from .locks import LockBackend, ThreadLockBackend
+from .sources import all_sources, with_sources
+from .stats import PersistEvent, record
 
 if TYPE_CHECKING:
 	import csql
@@ -44,7 +50,11 @@ def cache_replacer(queryRenderer: QueryRenderer) -> QueryReplacer:
 		save_fn = KL._make_save_fn(q, queryRenderer, p.cacher, p.tag)
 
 		# return q._add_extensions(PreBuild(save_fn))
-		return save_fn()
+		result = save_fn()
+		if sources := all_sources(q):
+			# so anything persisted downstream of us is keyed by our sources too.
+			result = with_sources(result, sources)
+		return result
 
 	return replacer
 
@@ -52,17 +62,46 @@ def cache_replacer(queryRenderer: QueryRenderer) -> QueryReplacer:
 Key = str  # I keep changing my mind between str, int, bytes...
 
 
-class KeyLookup:
-	saved: ClassVar[dict[Key, Query]] = {}
-	locks: ClassVar[dict[Key, threading.Lock]] = defaultdict(threading.Lock)
-	_lock = threading.Lock()
+class Persisted(NamedTuple):
+	"""
+	What :meth:`Cacher._persist` can return instead of a plain :class:`csql.Query`, to say how big
+	the saved data is. Sizes are reported in :class:`csql.persist.PersistEvent`-s, and count towards
+	the limits set with :func:`csql.persist.set_budget`.
+	"""
+
+	query: csql.Query
+	"""The retrieval query."""
+	rows: int | None = None
+	"""How many rows were saved, if known."""
+	bytes: int | None = None
+	"""How many bytes the saved data takes up, if known."""
+
+
+class _Size(NamedTuple):
+	cacher: Cacher
+	tag: str | None
+	rows: int
+	bytes: int
 
-	def _get_lock(self, key: Key) -> threading.Lock:
-		with self._lock:
-			return self.locks[key]
 
-	def _get_key(self, rq: RenderedQuery, tag: str | None) -> Key:
-		key_long = pickle.dumps((rq.sql, tag, *rq.parameters))
+class KeyLookup:
+	saved: ClassVar[dict[Key, Query]] = {}
+	# key -> time.monotonic() it was last known to exist
+	probed: ClassVar[dict[Key, float]] = {}
+	# sizes of saved keys, least recently used first
+	sizes: ClassVar[OrderedDict[Key, _Size]] = OrderedDict()
+	sizes_lock: ClassVar[threading.RLock] = threading.RLock()
+	max_bytes: ClassVar[int | None] = None
+	max_rows: ClassVar[int | None] = None
+	lock_backend: ClassVar[LockBackend] = ThreadLockBackend()
+
+	def _get_lock(self, c: Cacher, key: Key) -> AbstractContextManager[object]:
+		return (c.lock_backend or self.lock_backend).lock(key)
+
+	def _get_key(
+		self, rq: RenderedQuery, tag: str | None, versions: tuple[Hashable, ...] = ()
+	) -> Key:
+		key_long = pickle.dumps((rq.sql, tag, *rq.parameters, *versions))
 		key_hash = hashlib.sha1(key_long).hexdigest()
 		return key_hash
 
@@ -71,29 +110,198 @@ class KeyLookup:
 	) -> Callable[[], Query]:
 		rq = qr.render(q)
 		# TODO  should be rq = q.build(overrides, dialect)
-		key = self._get_key(rq, tag)
+		key = self._get_key(rq, tag, tuple(s.version() for s in all_sources(q)))
 
 		def wrapped_save_fn() -> Query:
-			with self._get_lock(key):
+			outcome: Literal["hit", "miss", "stale"] = "hit"
+			materialize_seconds = 0.0
+			persisted: Persisted | None = None
+			start = time.perf_counter()
+			with self._get_lock(c, key):
+				lock_wait_seconds = time.perf_counter() - start
 				if key not in self.saved:
+					if (restored := self._restore(c, key)) is not None:
+						logger.debug(
+							f"Using indexed result for rendered query {rq} with {tag=}"
+						)
+						self.saved[key] = restored
+						self.probed[key] = time.monotonic()
+					else:
+						logger.debug(
+							f"Executing save function for rendered query {rq} with {tag=}"
+						)
+						outcome = "miss"
+						persisted, materialize_seconds = self._save(c, q, rq, key, tag)
+				elif self._is_stale(c, key):
 					logger.debug(
-						f"Executing save function for rendered query {rq} with {tag=}"
+						f"Cached result for rendered query {rq} with {tag=} no longer exists, saving it again"
 					)
-					self.saved[key] = c._persist(rq, key, tag)
+					c.stale_hits += 1
+					outcome = "stale"
+					persisted, materialize_seconds = self._save(c, q, rq, key, tag)
 				else:
 					logger.debug(
 						f"Using cached result for rendered query {rq} with {tag=}"
 					)
+					c._touch(key)
+					self._used(key)
 				result = self.saved[key]
 
+			record(
+				PersistEvent(
+					cacher=c,
+					tag=tag,
+					key=key,
+					outcome=outcome,
+					lock_wait_seconds=lock_wait_seconds,
+					materialize_seconds=materialize_seconds,
+					sql_bytes=len(rq.sql.encode()),
+					parameters=len(rq.parameters),
+					rows=persisted and persisted.rows,
+					bytes=persisted and persisted.bytes,
+				)
+			)
+			if persisted is not None:
+				self._enforce_budget(keep=key)
 			return result
 
 		return wrapped_save_fn
 
+	def _save(
+		self, c: Cacher, q: Query, rq: RenderedQuery, key: Key, tag: str | None
+	) -> tuple[Persisted, float]:
+		"""Persist ``rq``, returning what was saved and how long it took."""
+		start = time.perf_counter()
+		# whatever q reads from has to be ready before we can run it, e.g. an async result
+		# it selects from. These hooks run again at the end of the build, so they can't
+		# replace anything here.
+		for dep in q._getDeps():
+			if (pre_build := dep._get_extension(PreBuild)) is not None:
+				pre_build.hook()
+		persisted = c._persist(rq, key, tag)
+		elapsed = time.perf_counter() - start
+		if not isinstance(persisted, Persisted):
+			persisted = Persisted(persisted)
+
+		self.saved[key] = persisted.query
+		self.probed[key] = time.monotonic()
+		with self.sizes_lock:
+			self.sizes[key] = _Size(c, tag, persisted.rows or 0, persisted.bytes or 0)
+			self.sizes.move_to_end(key)
+		if c.index is not None:
+			self.saved[key] = self._index(c.index, key, persisted.query)
+		return persisted, elapsed
+
+	def _index(self, index: SQLiteKeyIndex, key: Key, retrieval: Query) -> Query:
+		"""
+		Record ``retrieval`` in ``index``. If it has a :class:`PreBuild` hook (e.g. waiting for an async
+		result), that's left to whichever build needs it, and it's only recorded once the hook has run.
+		"""
+		if (pre_build := retrieval._get_extension(PreBuild)) is None:
+			index.put(key, retrieval)
+			return retrieval
+
+		bare = replace(retrieval, _extensions=retrieval._extensions - {pre_build})
+		indexed = threading.Lock()
+
+		def hook() -> Query | None:
+			result = pre_build.hook()
+			# only once, and not if it's been forgotten (or saved again) in the meantime.
+			if indexed.acquire(blocking=False) and self.saved.get(key) is wrapped:
+				index.put(key, bare)
+			return result
+
+		wrapped = bare._add_extensions(PreBuild(hook))
+		return wrapped
+
+	def _used(self, key: Key) -> None:
+		with self.sizes_lock:
+			if key in self.sizes:
+				self.sizes.move_to_end(key)
+
+	def _enforce_budget(self, keep: Key) -> None:
+		"""Drop the least recently used saved keys until we're within :func:`set_budget`."""
+		if self.max_bytes is None and self.max_rows is None:
+			return
+		with self.sizes_lock:
+			total_rows = sum(s.rows for s in self.sizes.values())
+			total_bytes = sum(s.bytes for s in self.sizes.values())
+			candidates = [
+				(key, size)
+				for key, size in self.sizes.items()
+				if key != keep and (size.rows or size.bytes)
+			]
+		# dropping takes the cacher's own locks, which it might hold while it calls back into
+		# us (e.g. to _forget something it evicted), so don't hold sizes_lock while we do.
+		for key, size in candidates:
+			if (self.max_bytes is None or total_bytes <= self.max_bytes) and (
+				self.max_rows is None or total_rows <= self.max_rows
+			):
+				break
+			# don't wait: whoever has the lock is about to use the key.
+			with size.cacher._try_lock(key) as locked:
+				with self.sizes_lock:
+					if not locked or self.sizes.get(key) is not size:
+						continue  # in use, or already gone
+				try:
+					if not size.cacher._drop(key, size.tag):
+						continue
+				except Exception:
+					# the build that got us here has already succeeded, so don't fail it.
+					logger.warning(f"Couldn't drop {key} for the budget", exc_info=True)
+					continue
+				logger.debug(f"Dropped {key} ({size.rows} rows, {size.bytes} bytes)")
+				total_rows -= size.rows
+				total_bytes -= size.bytes
+				self._forget(size.cacher, key)
+
+	def _is_stale(self, c: Cacher, key: Key) -> bool:
+		"""Probe a saved ``key`` if it's been more than ``c.probe_interval`` since we last checked."""
+		if c.probe_interval is None:
+			return False
+		now = time.monotonic()
+		if now - self.probed.get(key, now) < c.probe_interval:
+			return False
+		self.probed[key] = now
+		return not c._probe(self.saved[key])
+
+	def _restore(self, c: Cacher, key: Key) -> Query | None:
+		"""Look for ``key`` in the cacher's index, checking that it still exists."""
+		if c.index is None or (retrieval := c.index.get(key)) is None:
+			return None
+		if not c._probe(retrieval):
+			logger.debug(f"Indexed result for {key} no longer exists")
+			c.index.discard(key)
+			return None
+		return retrieval
+
+	def _forget(self, c: Cacher, key: Key) -> None:
+		self.saved.pop(key, None)
+		self.probed.pop(key, None)
+		with self.sizes_lock:
+			self.sizes.pop(key, None)
+		if c.index is not None:
+			c.index.discard(key)
+
 
 KL = KeyLookup()  # singleton
 
 
+def set_budget(max_bytes: int | None = None, max_rows: int | None = None) -> None:
+	"""
+	Limit how much data all persisted queries in this process can hold between them. Once a new result
+	takes the total over either limit, the least recently used results are dropped (see :meth:`Cacher._drop`)
+	until it's back under. Only sizes reported by cachers with :class:`csql.persist.Persisted` count.
+
+	Call with no arguments to remove the limits.
+
+	:param max_bytes: The most bytes to keep.
+	:param max_rows: The most rows to keep.
+	"""
+	KeyLookup.max_bytes = max_bytes
+	KeyLookup.max_rows = max_rows
+
+
 class Cacher(ABC):
 	"""
 	Abstract Base Class to represent a persistence/caching method.
@@ -126,8 +334,26 @@ class Cacher(ABC):
 	                    else: raise
 	            return Q(f'select * from #{table_name}')
 
+	Set :attr:`index` to a :class:`csql.persist.SQLiteKeyIndex` to remember saved keys across processes,
+	and :attr:`lock_backend` to a :class:`csql.persist.FileLockBackend` to only materialize each key once
+	across processes. Set :attr:`probe_interval` to check that saved results still exist before re-using them.
 	"""
 
+	index: csql.persist.SQLiteKeyIndex | None = None
+	"""An optional on-disk index of saved keys, shared between processes."""
+
+	lock_backend: csql.persist.LockBackend | None = None
+	"""An optional :class:`csql.persist.LockBackend`. By default, keys are only locked within the current process."""
+
+	probe_interval: float | None = None
+	"""
+	If set, saved results are checked with :meth:`_probe` before being re-used, at most once every this
+	many seconds (``0`` checks every time). Results that have gone missing, e.g. after a reconnect, are saved again.
+	"""
+
+	stale_hits: int = 0
+	"""How many times a saved result failed its :attr:`probe_interval` check and had to be saved again."""
+
 	def persist(self, q: Query, tag: str | None) -> Query:
 		"""
 		Marks a query as persistabe.
@@ -138,10 +364,11 @@ class Cacher(ABC):
 	@abstractmethod
 	def _persist(
 		self, rq: csql.RenderedQuery, key: csql.persist.Key, tag: str | None
-	) -> csql.Query:
+	) -> csql.Query | csql.persist.Persisted:
 		"""
 		This should take a RenderedQuery, save it (keyed by the given ``key``), and
-		return a Query that returns the saved data.
+		return a Query that returns the saved data. If you know how big the saved data is,
+		return a :class:`csql.persist.Persisted` with the Query and its size instead.
 
 		:param rq:  the :class:`csql.RenderedQuery` you need to save. Remember, ``RenderedQuery``
 		            already has its SQL and parameters prepared and ready to go to a database.
@@ -157,7 +384,7 @@ class Cacher(ABC):
 
 		``csql`` already maintains a record of ``key``-s saved in the `current` process, but this won't persist if
 		the python process is restarted - however your tables potentially could, which is where using ``key`` becomes
-		helpful.
+		helpful. Alternatively, set :attr:`index` and implement :meth:`_probe` to have ``csql`` remember keys for you.
 
 		For example, you could write
 
@@ -172,3 +399,51 @@ class Cacher(ABC):
 		if you were comfortable with leaving permanent tables around in your database.
 
 		"""
+
+	def _probe(self, retrieval: csql.Query) -> bool:
+		"""
+		Optionally override this to check that the data behind a retrieval query still exists.
+		It's called before re-using a key found in :attr:`index`, or one saved more than :attr:`probe_interval`
+		seconds ago, and should be cheap - for example a ``select * from my_table limit 0``.
+		The default implementation assumes the data exists.
+
+		:param retrieval: a :class:`csql.Query` previously returned by :meth:`_persist`.
+		"""
+		return True
+
+	def _touch(self, key: csql.persist.Key) -> None:  # noqa: B027 - optional hook
+		"""
+		Optionally override this to be told when a saved ``key`` is re-used, e.g. to keep track
+		of what has been used recently. The default implementation does nothing.
+		"""
+
+	def _forget(self, key: csql.persist.Key) -> None:
+		"""
+		Call this if you remove saved data yourself (e.g. evicting it to save space), so ``csql``
+		stops handing out its retrieval query. The next build will call :meth:`_persist` again.
+		"""
+		KL._forget(self, key)
+
+	def _try_lock(self, key: csql.persist.Key) -> AbstractContextManager[bool]:
+		"""
+		Try to take the lock for ``key`` without waiting (see :meth:`csql.persist.LockBackend.try_lock`).
+		If you evict saved data yourself, do it while holding this, and skip keys it enters as ``False``:
+		somebody is about to use them.
+		"""
+		return (self.lock_backend or KL.lock_backend).try_lock(key)
+
+	def _drop(self, key: csql.persist.Key, tag: str | None) -> bool:
+		"""
+		Optionally override this to delete the saved data for ``key``, so :func:`csql.persist.set_budget`
+		can free up space. Return ``True`` if it was dropped. The default implementation can't drop
+		anything, and returns ``False``.
+		"""
+		return False
+
+	def _retrieval(self, key: csql.persist.Key, tag: str | None) -> csql.Query | None:
+		"""
+		Optionally override this to predict the retrieval query :meth:`_persist` will return for ``key``,
+		without saving anything. This lets :meth:`csql.Query.plan` show the final SQL of a build before
+		any persistence happens. The default implementation returns ``None``, meaning "can't tell".
+		"""
+		return None
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import time
+from collections.abc import Generator
+from contextlib import closing, contextmanager
+from typing import TYPE_CHECKING
+
+from ..api import Q
+
+if TYPE_CHECKING:
+	import csql
+	import csql.persist
+
+logger = logging.getLogger(name=__name__)
+
+
+class SQLiteKeyIndex:
+	"""
+	An on-disk record of saved keys, backed by a local SQLite file. This lets ``csql`` remember
+	what has been persisted across process restarts, and between processes running at the same time.
+
+	Attach one to a :class:`Cacher` to use it:
+
+	.. code-block:: py
+
+	    from csql.persist import SQLiteKeyIndex
+	    from csql.contrib.persist.snowflake import SnowflakeResultSetCacher
+	    index = SQLiteKeyIndex('csql_keys.db', ttl=12 * 60 * 60)
+	    cache = SnowflakeResultSetCacher(con, index=index)
+
+	Each entry maps a key to the SQL of its retrieval query. When a key is found in the index,
+	the :class:`Cacher` is asked to :meth:`probe<Cacher._probe>` that the saved data still exists,
+	and if so, materialization is skipped entirely.
+
+	Only retrieval queries without parameters can be recorded. Use one index file per database.
+
+	:param path: Path to the SQLite file. It will be created if it doesn't exist.
+	:param ttl: Seconds after which entries expire. ``None`` means entries never expire.
+	:param timeout: Seconds to wait on another process holding the file lock.
+	"""
+
+	def __init__(
+		self,
+		path: str | os.PathLike[str],
+		ttl: float | None = None,
+		timeout: float = 30,
+	):
+		self.path = os.fspath(path)
+		self.ttl = ttl
+		self.timeout = timeout
+		with self._connect() as con:
+			con.execute("pragma journal_mode=wal")
+			con.execute("""
+				create table if not exists csql_keys (
+					key text primary key,
+					retrieval_sql text not null,
+					created_at real not null,
+					expires_at real
+				)
+			""")
+
+	@contextmanager
+	def _connect(self) -> Generator[sqlite3.Connection, None, None]:
+		# a fresh connection per call keeps us safe across threads and forks.
+		with closing(sqlite3.connect(self.path, timeout=self.timeout)) as con, con:
+			yield con
+
+	def get(self, key: csql.persist.Key) -> csql.Query | None:
+		"""Return the retrieval query saved for ``key``, or ``None`` if it's missing or expired."""
+		with self._connect() as con:
+			row = con.execute(
+				"select retrieval_sql, expires_at from csql_keys where key = ?", (key,)
+			).fetchone()
+		if row is None:
+			return None
+		retrieval_sql, expires_at = row
+		if expires_at is not None and expires_at <= time.time():
+			self.discard(key)
+			return None
+		return Q(retrieval_sql)
+
+	def put(self, key: csql.persist.Key, retrieval: csql.Query) -> None:
+		"""Record ``retrieval`` as the retrieval query for ``key``."""
+		rq = retrieval.build()
+		if rq.parameters != ():
+			logger.debug(
+				f"Not indexing {key}: its retrieval query has parameters {rq.parameters}"
+			)
+			return
+		now = time.time()
+		expires_at = now + self.ttl if self.ttl is not None else None
+		with self._connect() as con:
+			con.execute(
+				"insert or replace into csql_keys values (?, ?, ?, ?)",
+				(key, rq.sql, now, expires_at),
+			)
+
+	def discard(self, key: csql.persist.Key) -> None:
+		"""Remove ``key`` from the index, if it's there."""
+		with self._connect() as con:
+			con.execute("delete from csql_keys where key = ?", (key,))
+
+	def __repr__(self) -> str:
+		return f"SQLiteKeyIndex({self.path!r}, ttl={self.ttl!r})"
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Generator
+from contextlib import AbstractContextManager, contextmanager
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+	import csql.persist
+
+
+class LockBackend(ABC):
+	"""
+	Abstract Base Class for how ``csql`` makes sure only one caller materializes a given key at a time.
+	Everybody else waits for the lock, and then re-uses the result.
+	"""
+
+	@abstractmethod
+	def lock(self, key: csql.persist.Key) -> AbstractContextManager[object]:
+		"""Return a context manager that holds the lock for ``key`` while it's entered."""
+
+	@contextmanager
+	def try_lock(self, key: csql.persist.Key) -> Generator[bool, None, None]:
+		"""
+		Like :meth:`lock`, but don't wait: enter as ``True`` holding the lock if it's free, or ``False``
+		without it if somebody else has it. Used to make sure nobody is using a key before dropping it
+		for :func:`csql.persist.set_budget`, or a cacher evicting it. The default implementation never takes
+		the lock, so keys are never dropped - override it if your backend can try a lock without blocking.
+		"""
+		yield False
+
+
+class ThreadLockBackend(LockBackend):
+	"""
+	Locks keys between threads of the current process. This is the default.
+	"""
+
+	def __init__(self) -> None:
+		self._locks: dict[csql.persist.Key, threading.Lock] = defaultdict(
+			threading.Lock
+		)
+		self._lock = threading.Lock()
+
+	def lock(self, key: csql.persist.Key) -> AbstractContextManager[object]:
+		with self._lock:
+			return self._locks[key]
+
+	@contextmanager
+	def try_lock(self, key: csql.persist.Key) -> Generator[bool, None, None]:
+		with self._lock:
+			lock = self._locks[key]
+		if not lock.acquire(blocking=False):
+			yield False
+			return
+		try:
+			yield True
+		finally:
+			lock.release()
+
+
+class FileLockBackend(LockBackend):
+	"""
+	Locks keys between processes on the same machine using ``fcntl`` file locks, so e.g. a pool of
+	web workers starting up at once will only materialize each key once. Unix only.
+
+	Other processes can only re-use the result if they can find it, so you will want to pair this with
+	an :class:`SQLiteKeyIndex`, or a :class:`Cacher` that checks for its own existing results
+	(e.g. with ``create table if not exists``):
+
+	.. code-block:: py
+
+	    from csql.persist import FileLockBackend, SQLiteKeyIndex
+	    cache = SnowflakeResultSetCacher(
+	        con,
+	        index=SQLiteKeyIndex('/tmp/csql/keys.db'),
+	        lock_backend=FileLockBackend('/tmp/csql/locks'),
+	    )
+
+	:param directory: A directory to keep lock files in. It will be created if it doesn't exist.
+	"""
+
+	def __init__(self, directory: str | os.PathLike[str]):
+		self.directory = os.fspath(directory)
+		os.makedirs(self.directory, exist_ok=True)
+		# flock() is per open file, so threads in this process still need their own lock.
+		self._threads = ThreadLockBackend()
+
+	@contextmanager
+	def lock(self, key: csql.persist.Key) -> Generator[None, None, None]:
+		import fcntl
+
+		path = os.path.join(self.directory, f"csql_{key}.lock")
+		with self._threads.lock(key), open(path, "a") as f:
+			fcntl.flock(f, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+	@contextmanager
+	def try_lock(self, key: csql.persist.Key) -> Generator[bool, None, None]:
+		import fcntl
+
+		path = os.path.join(self.directory, f"csql_{key}.lock")
+		with self._threads.try_lock(key) as locked:
+			if not locked:
+				yield False
+				return
+			with open(path, "a") as f:
+				try:
+					fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+				except BlockingIOError:
+					yield False
+					return
+				try:
+					yield True
+				finally:
+					fcntl.flock(f, fcntl.LOCK_UN)
+
+	def __repr__(self) -> str:
+		return f"FileLockBackend({self.directory!r})"
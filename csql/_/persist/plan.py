@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from ..models.query import Query, RenderedQuery
+from ..models.query_replacers import QueryReplacer
+from ..renderer.query import QueryRenderer
+
+if TYPE_CHECKING:
+	import csql
+	import csql.dialect
+	import csql.overrides
+	import csql.persist
+
+
+class Materialization(NamedTuple):
+	"""
+	A persisted query that hasn't been saved yet, as listed by :attr:`BuildPlan.materializations`.
+	"""
+
+	rq: csql.RenderedQuery
+	"""The query the cacher will be asked to save."""
+	key: csql.persist.Key
+	"""The key it will be saved under."""
+	tag: str | None
+	"""The tag it was persisted with."""
+	cacher: csql.persist.Cacher
+	"""The cacher that will save it."""
+
+
+@dataclass(frozen=True)
+class BuildPlan:
+	"""
+	A :class:`BuildPlan` is what you get from :meth:`csql.Query.plan`: everything a build would
+	do, without doing any of it yet.
+
+	>>> con = my_connection()
+	>>> cache = csql.contrib.persist.TempTableCacher(con)
+	>>> q1 = Q('select * from slow_view').persist(cache, 'slow')
+	>>> plan = Q(f'select count(*) from {q1}').plan()
+	>>> [m.tag for m in plan.materializations]
+	['slow']
+	>>> print(plan.rendered.sql)  # doctest: +ELLIPSIS
+	with
+	_subQuery0 as (
+		select * from "csql_cache_slow_..."
+	)
+	select count(*) from _subQuery0
+	>>> plan.materialize()  # doctest: +IGNORE_RESULT
+	"""
+
+	materializations: tuple[Materialization, ...]
+	"""Persisted queries that will be saved, in the order they'll be saved in."""
+	rendered: csql.RenderedQuery
+	"""
+	The final query. Where a :class:`Cacher` can predict its retrieval query (see :meth:`Cacher._retrieval`)
+	it's used here; otherwise the query that would be persisted is left in place. Either way this SQL is
+	equivalent to what a real build would give you.
+
+	Keys of materializations downstream of an unpredictable retrieval query can't be known
+	until that query is actually saved, so they may differ from the ones listed here.
+	"""
+	query: csql.Query
+	":meta private:"
+	build_args: Mapping[str, Any]
+	":meta private:"
+
+	def materialize(self) -> csql.RenderedQuery:
+		"""
+		Save everything in :attr:`materializations` and return the fully built query, exactly like
+		:meth:`csql.Query.build` would have.
+		"""
+		return self.query.build(**self.build_args)
+
+
+def plan_replacer(
+	queryRenderer: QueryRenderer, materializations: list[Materialization]
+) -> QueryReplacer:
+	"""A version of cache_replacer that records materializations instead of executing them."""
+	from . import KL, Persistable
+	from .sources import all_sources, with_sources
+
+	def replacer(q: Query) -> Query:
+		if (p := q._get_extension(Persistable)) is None:
+			return q
+
+		rq = queryRenderer.render(q)
+		sources = all_sources(q)
+		key = KL._get_key(rq, p.tag, tuple(s.version() for s in sources))
+		if (result := KL.saved.get(key)) is None:
+			if key not in (m.key for m in materializations):
+				materializations.append(Materialization(rq, key, p.tag, p.cacher))
+			result = p.cacher._retrieval(key, p.tag) or q
+
+		if sources:
+			result = with_sources(result, sources)
+		return result
+
+	return replacer
+
+
+def make_plan(
+	q: Query,
+	*,
+	dialect: csql.dialect.SQLDialect | None,
+	newParams: Mapping[str, Any] | None,
+	overrides: csql.overrides.Overrides | None,
+) -> BuildPlan:
+	from ..models.query_replacers import params_replacer, replace_queries_in_tree
+
+	queryRenderer = q._renderer(dialect, overrides)
+	materializations: list[Materialization] = []
+
+	new_q = q
+	new_q = replace_queries_in_tree(params_replacer(newParams), new_q)
+	new_q = replace_queries_in_tree(
+		plan_replacer(queryRenderer, materializations), new_q
+	)
+
+	rendered: RenderedQuery = q._renderer(dialect, overrides).render(new_q)
+	return BuildPlan(
+		materializations=tuple(materializations),
+		rendered=rendered,
+		query=q,
+		build_args={"dialect": dialect, "newParams": newParams, "overrides": overrides},
+	)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import dataclasses
+import threading
+import time
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+
+from ..models.query import Query, QueryExtension
+
+
+class Source:
+	"""
+	Something a query reads from, with a function that returns its current version. Declare sources
+	with :meth:`csql.Query.depends_on`, and the version becomes part of every persistence key downstream,
+	so when a source changes, queries built on it are persisted again instead of being served stale.
+
+	The version function is called at most once every ``ttl`` seconds, so it should be cheap, but
+	doesn't have to be instant:
+
+	.. code-block:: py
+
+	    from csql.persist import Source
+	    orders = Source(lambda: con.execute('select max(updated_at) from orders').fetchone()[0], ttl=60)
+	    prices = Source(lambda: os.path.getmtime('prices.parquet'))
+
+	    q = Q('select ... from orders join prices ...').depends_on(orders, prices).persist(cache)
+
+	:param version: A function returning something hashable that changes whenever the source does,
+	                e.g. a ``max(updated_at)``, a snapshot id, or a file's mtime.
+	:param ttl: How long to re-use a version for before asking ``version`` again, in seconds.
+	            ``0`` asks on every build.
+	"""
+
+	def __init__(self, version: Callable[[], Hashable], ttl: float = 0):
+		self._version = version
+		self.ttl = ttl
+		# (time.monotonic(), version)
+		self._cached: tuple[float, Hashable] | None = None
+		self._lock = threading.Lock()
+
+	def version(self) -> Hashable:
+		"""The current version, re-using the last one if it's less than ``ttl`` seconds old."""
+		with self._lock:
+			now = time.monotonic()
+			if self._cached is None or now - self._cached[0] >= self.ttl:
+				self._cached = (now, self._version())
+			return self._cached[1]
+
+	def __repr__(self) -> str:
+		return f"Source({self._version!r}, ttl={self.ttl!r})"
+
+
+@dataclass(frozen=True)
+class DependsOn(QueryExtension):
+	"""Attached to a query that reads from some :class:`Source`-s."""
+
+	sources: tuple[Source, ...]
+
+
+def all_sources(q: Query) -> tuple[Source, ...]:
+	"""Every source ``q`` and its dependencies read from."""
+	sources: dict[Source, None] = {}
+	for dep in (*q._getDeps(), q):
+		if (d := dep._get_extension(DependsOn)) is not None:
+			sources.update(dict.fromkeys(d.sources))
+	return tuple(sources)
+
+
+def with_sources(q: Query, sources: tuple[Source, ...]) -> Query:
+	"""Add ``sources`` to any ``q`` already depends on."""
+	if (existing := q._get_extension(DependsOn)) is not None:
+		sources = tuple(dict.fromkeys((*existing.sources, *sources)))
+	others = frozenset(e for e in q._extensions if not isinstance(e, DependsOn))
+	return dataclasses.replace(q, _extensions=others | {DependsOn(sources)})
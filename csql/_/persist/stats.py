@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import threading
+import weakref
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Literal, NamedTuple
+
+if TYPE_CHECKING:
+	import csql.persist
+
+
+class PersistEvent(NamedTuple):
+	"""
+	What happened when a persisted query was built, as passed to callbacks registered
+	with :func:`add_stats_callback`.
+	"""
+
+	cacher: csql.persist.Cacher
+	tag: str | None
+	key: csql.persist.Key
+	outcome: Literal["hit", "miss", "stale"]
+	"""
+	``"hit"`` if a saved result was re-used (including one found in :attr:`Cacher.index<csql.persist.Cacher.index>`),
+	``"miss"`` if it had to be persisted, or ``"stale"`` if a saved result had gone missing and was persisted again.
+	"""
+	lock_wait_seconds: float
+	"""How long we waited for the key's lock, e.g. while somebody else persisted it."""
+	materialize_seconds: float
+	"""How long :meth:`Cacher._persist<csql.persist.Cacher._persist>` took, or 0 for hits."""
+	sql_bytes: int
+	"""The size of the rendered SQL, in bytes."""
+	parameters: int
+	"""The number of parameters in the rendered query."""
+	rows: int | None = None
+	"""How many rows were saved, if the cacher said (see :class:`csql.persist.Persisted`)."""
+	bytes: int | None = None
+	"""How many bytes were saved, if the cacher said."""
+
+
+class PersistStats(NamedTuple):
+	"""Totals of :class:`PersistEvent`-s for one cacher and tag, as returned by :func:`stats`."""
+
+	hits: int
+	misses: int
+	stale: int
+	lock_wait_seconds: float
+	materialize_seconds: float
+	sql_bytes: int
+	parameters: int
+
+
+_EMPTY = PersistStats(0, 0, 0, 0.0, 0.0, 0, 0)
+
+# weak, so we don't keep cachers (and their connections) alive just to count them.
+_stats: weakref.WeakKeyDictionary[
+	csql.persist.Cacher, dict[str | None, PersistStats]
+] = weakref.WeakKeyDictionary()
+_callbacks: list[Callable[[csql.persist.PersistEvent], None]] = []
+_lock = threading.Lock()
+
+
+def stats() -> dict[tuple[csql.persist.Cacher, str | None], csql.persist.PersistStats]:
+	"""
+	Totals for every ``(cacher, tag)`` that has been built in this process so far, for cachers
+	that are still around.
+
+	.. code-block:: py
+
+	    for (cacher, tag), s in csql.persist.stats().items():
+	        print(f'{tag}: {s.hits} hits, {s.misses} misses, {s.materialize_seconds:.1f}s persisting, '
+	              f'{s.lock_wait_seconds:.1f}s waiting for locks')
+	"""
+	with _lock:
+		return {
+			(cacher, tag): s
+			for cacher, by_tag in _stats.items()
+			for tag, s in by_tag.items()
+		}
+
+
+def reset_stats() -> None:
+	"""Zero everything returned by :func:`stats`."""
+	with _lock:
+		_stats.clear()
+
+
+def add_stats_callback(callback: Callable[[csql.persist.PersistEvent], None]) -> None:
+	"""
+	Call ``callback`` with a :class:`PersistEvent` every time a persisted query is built, e.g. to
+	send it to your metrics system. Callbacks run on the building thread, so keep them quick.
+	"""
+	with _lock:
+		_callbacks.append(callback)
+
+
+def remove_stats_callback(
+	callback: Callable[[csql.persist.PersistEvent], None],
+) -> None:
+	"""Stop calling a callback added with :func:`add_stats_callback`."""
+	with _lock:
+		_callbacks.remove(callback)
+
+
+def record(event: PersistEvent) -> None:
+	with _lock:
+		by_tag = _stats.setdefault(event.cacher, {})
+		s = by_tag.get(event.tag, _EMPTY)
+		by_tag[event.tag] = PersistStats(
+			hits=s.hits + (event.outcome == "hit"),
+			misses=s.misses + (event.outcome == "miss"),
+			stale=s.stale + (event.outcome == "stale"),
+			lock_wait_seconds=s.lock_wait_seconds + event.lock_wait_seconds,
+			materialize_seconds=s.materialize_seconds + event.materialize_seconds,
+			sql_bytes=s.sql_bytes + event.sql_bytes,
+			parameters=s.parameters + event.parameters,
+		)
+		callbacks = list(_callbacks)
+	for callback in callbacks:
+		callback(event)
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, NamedTuple
+
+from ..models.query import ParameterPlaceholder, Query
+from ..models.query_replacers import replace_queries_in_tree
+from . import Persistable
+
+if TYPE_CHECKING:
+	from types import TracebackType
+
+	from typing_extensions import Self
+
+	import csql
+	import csql.persist
+
+
+class QueryUsage(NamedTuple):
+	"""
+	How much a query (or any query with the same structure) has been used, as listed by
+	:meth:`UsageTracker.report`.
+	"""
+
+	fingerprint: str
+	"""Identifies the query's structure: its SQL, and the names (but not values) of its parameters."""
+	query: csql.Query
+	"""The most recently seen query with this fingerprint."""
+	roots: int
+	"""How many distinct queries have been built that include this one."""
+	builds: int
+	"""How many builds have included this query."""
+	executions: int
+	"""How many executions timed with :meth:`UsageTracker.timed` have included this query."""
+	seconds: float
+	"""How long those executions took in total, in seconds."""
+
+
+class _Usage:
+	def __init__(self, query: Query):
+		self.query = query
+		self.roots: set[str] = set()
+		self.builds = 0
+		self.executions = 0
+		self.seconds = 0.0
+
+
+class UsageTracker:
+	"""
+	Records which subqueries get re-used across builds, to help decide what's worth persisting.
+	While a tracker is entered as a context manager, every :meth:`csql.Query.build` is recorded against
+	each query in it, by structural fingerprint - so the same subquery with different parameter values
+	counts as one. Wrap executions in :meth:`timed` to record how long they take as well.
+
+	.. code-block:: py
+
+	    from csql.persist import UsageTracker
+	    tracker = UsageTracker()
+	    with tracker:
+	        for q in dashboard_queries:
+	            with tracker.timed(q):
+	                con.execute(*q.db)
+
+	    for usage in tracker.report():
+	        print(usage.roots, usage.seconds, usage.query.build().sql)
+
+	Give it a ``cacher`` to go one step further, and persist subqueries automatically once
+	they've been included in ``min_roots`` different queries, and at least ``min_seconds`` of
+	executions.
+
+	:param cacher: An optional :class:`csql.persist.Cacher` to persist popular subqueries with.
+	:param min_roots: How many distinct queries need to include a subquery before it's persisted.
+	:param min_seconds: How many seconds of timed executions need to include a subquery before it's persisted.
+	"""
+
+	def __init__(
+		self,
+		cacher: csql.persist.Cacher | None = None,
+		min_roots: int = 2,
+		min_seconds: float = 0.0,
+	):
+		self.cacher = cacher
+		self.min_roots = min_roots
+		self.min_seconds = min_seconds
+		self._usage: dict[str, _Usage] = {}
+		self._lock = threading.Lock()
+
+	def __enter__(self) -> Self:
+		with _trackers_lock:
+			_trackers.append(self)
+		return self
+
+	def __exit__(
+		self,
+		exc_type: type[BaseException] | None,
+		exc: BaseException | None,
+		tb: TracebackType | None,
+	) -> None:
+		with _trackers_lock:
+			_trackers.remove(self)
+
+	@contextmanager
+	def timed(self, q: csql.Query) -> Generator[None, None, None]:
+		"""Time the block inside this context manager, as an execution of ``q``."""
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			elapsed = time.perf_counter() - start
+			with self._lock:
+				for fp, dep in _fingerprints(q).items():
+					usage = self._usage.setdefault(fp, _Usage(dep))
+					usage.executions += 1
+					usage.seconds += elapsed
+
+	def report(self, top: int | None = 10) -> list[csql.persist.QueryUsage]:
+		"""
+		The most re-used subqueries so far, most distinct queries first, then most time spent.
+		Queries that have only been seen in a single query aren't included.
+		"""
+		with self._lock:
+			usages = [
+				QueryUsage(
+					fingerprint=fp,
+					query=u.query,
+					roots=len(u.roots),
+					builds=u.builds,
+					executions=u.executions,
+					seconds=u.seconds,
+				)
+				for fp, u in self._usage.items()
+				if len(u.roots) > 1
+			]
+		usages.sort(key=lambda u: (u.roots, u.seconds), reverse=True)
+		return usages[:top]
+
+	def _record(self, root: Query) -> Query:
+		fingerprints = _fingerprints(root)
+		root_fp = next(reversed(fingerprints))
+		with self._lock:
+			for fp, dep in fingerprints.items():
+				usage = self._usage.setdefault(fp, _Usage(dep))
+				usage.query = dep
+				usage.roots.add(root_fp)
+				usage.builds += 1
+			popular = {
+				fp
+				for fp, u in self._usage.items()
+				if fp != root_fp
+				and len(u.roots) >= self.min_roots
+				and u.seconds >= self.min_seconds
+			}
+
+		if (cacher := self.cacher) is None or not popular:
+			return root
+
+		memo: dict[int, str] = {}
+
+		def replacer(q: Query) -> Query:
+			if q._get_extension(Persistable) is not None:
+				return q
+			fp = _fingerprint(q, memo)
+			if fp not in popular:
+				return q
+			return cacher.persist(q, f"auto_{fp[:8]}")
+
+		return replace_queries_in_tree(replacer, root)
+
+
+_trackers: list[UsageTracker] = []
+_trackers_lock = threading.Lock()
+
+
+def track_usage(q: Query) -> Query:
+	"""Record a build of ``q`` with any active :class:`UsageTracker`-s, which may decide to persist parts of it."""
+	if not _trackers:
+		return q
+	with _trackers_lock:
+		trackers = list(_trackers)
+	for tracker in trackers:
+		q = tracker._record(q)
+	return q
+
+
+def _fingerprints(q: Query) -> dict[str, Query]:
+	"""Fingerprints of ``q`` and everything it depends on, with ``q`` last."""
+	memo: dict[int, str] = {}
+	return {_fingerprint(dep, memo): dep for dep in (*q._getDeps(), q)}
+
+
+def _fingerprint(q: Query, memo: dict[int, str]) -> str:
+	if (fp := memo.get(id(q))) is not None:
+		return fp
+	h = hashlib.sha1()
+	for part in q.queryParts:
+		if isinstance(part, str):
+			h.update(b"s" + part.encode())
+		elif isinstance(part, Query):
+			h.update(b"q" + _fingerprint(part, memo).encode())
+		elif isinstance(part, ParameterPlaceholder):
+			key = part.key if isinstance(part.key, str) else "<auto>"
+			h.update(f"p{key}:{part.fmt}".encode())
+	memo[id(q)] = fp = h.hexdigest()
+	return fp
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterable, Mapping
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
+
+from ..utils import unique
+from . import Persistable
+
+if TYPE_CHECKING:
+	import csql
+	import csql.dialect
+	import csql.overrides
+
+_default_executor: Executor | None = None
+_default_executor_lock = threading.Lock()
+
+
+def _get_default_executor() -> Executor:
+	global _default_executor
+	with _default_executor_lock:
+		if _default_executor is None:
+			_default_executor = ThreadPoolExecutor(thread_name_prefix="csql-warm")
+		return _default_executor
+
+
+def warm(
+	queries: Iterable[csql.Query],
+	executor: Executor | None = None,
+	*,
+	dialect: csql.dialect.SQLDialect | None = None,
+	newParams: Mapping[str, Any] | None = None,
+	overrides: csql.overrides.Overrides | None = None,
+) -> list[Future[csql.RenderedQuery]]:
+	"""
+	Start persisting every persisted query in ``queries`` (and the queries they reference) in the background,
+	so they're ready by the time they're needed. See :meth:`csql.Query.warm`.
+
+	>>> con = my_connection()
+	>>> cache = csql.contrib.persist.TempTableCacher(con)
+	>>> q1 = Q('select * from slow_view').persist(cache)
+	>>> q2 = Q(f'select count(*) from {q1}')
+	>>> futures = csql.warm([q2])  # returns straight away
+	>>> q2.build()  # waits for q1 to finish persisting, rather than doing it again. # doctest: +IGNORE_RESULT
+
+	:param queries: The :class:`csql.Query`-s you're about to build.
+	:param executor: A :class:`concurrent.futures.Executor` to persist with. Defaults to a shared
+	                 :class:`~concurrent.futures.ThreadPoolExecutor`.
+
+	Other arguments are the same as :meth:`csql.Query.build`. Use the ones you'll be building with, or the
+	keys won't match.
+
+	:returns: a :class:`~concurrent.futures.Future` for each persisted query, in the order they were submitted.
+	          They resolve to the built retrieval query, or raise whatever persisting it raised.
+	"""
+	if executor is None:
+		executor = _get_default_executor()
+
+	futures: list[Future[csql.RenderedQuery]] = []
+	for root in queries:
+		# persist with the same dialect and overrides the root query will be built with.
+		root_dialect = dialect or root._default_dialect()
+		root_overrides = overrides or root._default_overrides()
+		for q in unique((*root._getDeps(), root), fn=id):
+			if q._get_extension(Persistable) is None:
+				continue
+			futures.append(
+				executor.submit(
+					q.build,
+					dialect=root_dialect,
+					newParams=newParams,
+					overrides=root_overrides,
+				)
+			)
+	return futures
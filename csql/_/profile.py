@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from .execution import adapter_for
+from .models.query import ParameterPlaceholder, Query
+from .utils import unique
+
+if TYPE_CHECKING:
+	import csql
+	import csql.dialect
+	import csql.overrides
+
+
+class ProfileNode(NamedTuple):
+	"""One query in a :class:`Profile`."""
+
+	name: str
+	"""The query's CTE name in the built SQL (e.g. ``_subQuery3``), or ``root`` for the query being profiled."""
+	query: csql.Query
+	summary: str
+	"""The start of this query's own SQL, on one line."""
+	inputs: tuple[str, ...]
+	"""The names of the queries this one references directly."""
+	rows: int
+	"""How many rows this query returns."""
+	seconds: float
+	"""How long ``select count(*) from (query)`` took, which includes running everything upstream of it."""
+	self_seconds: float
+	"""
+	An estimate of how much of :attr:`seconds` was this query itself: its :attr:`seconds`, less the
+	:attr:`self_seconds` of everything upstream of it.
+	"""
+
+
+@dataclass(frozen=True)
+class Profile:
+	"""
+	A :class:`Profile` is what you get from :meth:`csql.Query.profile`: how long each query in a
+	tree takes to run, and how many rows it returns.
+
+	>>> con = my_connection()
+	>>> _ = con.execute('create table events (id integer primary key, user text)')
+	>>> q1 = Q('select * from events')
+	>>> q2 = Q(f'select user, count(*) from {q1} group by user')
+	>>> profile = q2.profile(con)
+	>>> slowest = max(profile.nodes, key=lambda n: n.self_seconds)
+	>>> print(profile.render())  # doctest: +SKIP
+	████████████████████████████████████████ root           1.204s  self 1.101s        1,000 rows  select user, count(*) from _subQuery0 group by user
+	███                                      └─ _subQuery0  0.103s  self 0.103s    1,000,000 rows  select * from events
+	"""
+
+	nodes: tuple[csql.ProfileNode, ...]
+	"""Every query in the tree, upstream first, with the profiled query last."""
+
+	def render(self, width: int = 40) -> str:
+		"""
+		Render the tree as text, with the profiled query at the top and the queries it references
+		underneath. Each row has a bar ``width`` characters wide for the slowest query, scaled by
+		:attr:`ProfileNode.seconds`. Queries referenced more than once are only expanded the first time.
+		"""
+		by_name = {n.name: n for n in self.nodes}
+		slowest = max(n.seconds for n in self.nodes) or 1.0
+		rows: list[tuple[str, ProfileNode]] = []
+		seen: set[str] = set()
+
+		def walk(node: ProfileNode, prefix: str, connector: str) -> None:
+			rows.append((f"{prefix}{connector}{node.name}", node))
+			if node.name in seen:
+				return
+			seen.add(node.name)
+			child_prefix = prefix + {"": "", "├─ ": "│  ", "└─ ": "   "}[connector]
+			for i, name in enumerate(node.inputs):
+				last = i == len(node.inputs) - 1
+				walk(by_name[name], child_prefix, "└─ " if last else "├─ ")
+
+		walk(self.nodes[-1], "", "")
+
+		tree_width = max(len(tree) for tree, _ in rows)
+		lines: list[str] = []
+		for tree, node in rows:
+			bar = "█" * max(1, round(width * node.seconds / slowest))
+			lines.append(
+				f"{bar:<{width}} {tree:<{tree_width}} {node.seconds:.3f}s"
+				f"  self {node.self_seconds:.3f}s  {node.rows:>12,} rows  {node.summary}"
+			)
+		return "\n".join(lines)
+
+	def __str__(self) -> str:
+		return self.render()
+
+
+def profile(
+	q: csql.Query,
+	con: Any,
+	dialect: csql.dialect.SQLDialect | None = None,
+	newParams: Mapping[str, Any] | None = None,
+	overrides: csql.overrides.Overrides | None = None,
+) -> csql.Profile:
+	"""See :meth:`csql.Query.profile`."""
+	from .api import Q
+
+	deps = list(q._getDeps())
+	names = {id(dep): f"_subQuery{i}" for i, dep in enumerate(deps)}
+	names[id(q)] = "root"
+
+	nodes: list[ProfileNode] = []
+	self_seconds: dict[int, float] = {}
+	adapter = adapter_for(con)
+	for node in (*deps, q):
+		rq = Q(f"select count(*) from {node}").build(
+			dialect=dialect,
+			newParams=newParams,
+			overrides=overrides,
+		)
+		start = time.perf_counter()
+		[[(rows,)]] = list(adapter.iter_batches(rq, con, 1, "tuples"))
+		seconds = time.perf_counter() - start
+
+		upstream = sum(self_seconds[id(dep)] for dep in node._getDeps())
+		self_seconds[id(node)] = max(0.0, seconds - upstream)
+		inputs = unique(
+			(names[id(part)] for part in node.queryParts if isinstance(part, Query)),
+		)
+		nodes.append(
+			ProfileNode(
+				name=names[id(node)],
+				query=node,
+				summary=_summary(node, names),
+				inputs=tuple(inputs),
+				rows=rows,
+				seconds=seconds,
+				self_seconds=self_seconds[id(node)],
+			)
+		)
+	return Profile(nodes=tuple(nodes))
+
+
+def _summary(q: Query, names: Mapping[int, str], length: int = 60) -> str:
+	parts: list[str] = []
+	for part in q.queryParts:
+		if isinstance(part, str):
+			parts.append(part)
+		elif isinstance(part, Query):
+			parts.append(names[id(part)])
+		elif isinstance(part, ParameterPlaceholder):
+			parts.append("?")
+	summary = " ".join("".join(parts).split())
+	return summary if len(summary) <= length else summary[: length - 1] + "…"
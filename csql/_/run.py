@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import pairwise
+from typing import TYPE_CHECKING, Any, Literal, NamedTuple
+
+from .execution import adapter_for, statement_timeout
+from .models.query import ParameterPlaceholder
+
+if TYPE_CHECKING:
+	import csql
+	import csql.dialect
+	import csql.overrides
+
+logger = logging.getLogger(__name__)
+
+
+class RunResult(NamedTuple):
+	"""The outcome of one query run by :func:`csql.run_all`."""
+
+	query: csql.Query
+	result: Any
+	"""The query's results in the requested format, or ``None`` if it failed."""
+	error: Exception | None
+	"""Whatever building or running the query raised, or ``None`` if it succeeded."""
+	build_seconds: float
+	"""How long building the query took, including persisting anything it depends on."""
+	run_seconds: float
+	"""How long running the query and fetching its results took."""
+
+	@property
+	def ok(self) -> bool:
+		return self.error is None
+
+
+def run_all(
+	queries: Iterable[csql.Query],
+	connect: Callable[[], Any],
+	max_workers: int | None = None,
+	*,
+	release: Callable[[Any], None] | None = None,
+	format: Literal["pandas", "polars", "arrow"] = "pandas",
+	timeout: float | None = None,
+	dialect: csql.dialect.SQLDialect | None = None,
+	newParams: Mapping[str, Any] | None = None,
+	overrides: csql.overrides.Overrides | None = None,
+) -> list[csql.RunResult]:
+	"""
+	Build and run a batch of independent queries concurrently, on a thread pool with a connection per thread.
+
+	>>> results = csql.run_all([q1, q2, q3], lambda: sqlite3.connect('reports.db'), max_workers=3)
+	>>> for r in results:
+	...     if r.ok:
+	...         print(f'{r.run_seconds:.1f}s', r.result.shape)
+	...     else:
+	...         print('failed', r.error)
+
+	A failing query doesn't stop the others - its error is returned in its :class:`RunResult` instead.
+	The same :class:`csql.Query` object given more than once is only run once. Persisted queries shared
+	between them are only persisted once, too: whichever thread gets there first persists, and the others
+	wait and re-use its result.
+
+	:param queries: The :class:`csql.Query`-s to run.
+	:param connect: Called on each worker thread to get that thread's connection.
+	                To borrow connections from a pool, pass its checkout function and ``release``.
+	:param max_workers: How many queries to run at once. Defaults to
+	                    :class:`~concurrent.futures.ThreadPoolExecutor`'s default.
+	:param release: Called with each connection when we're done with it, from the thread that opened it.
+	                Defaults to calling its ``close()``.
+	:param format: ``"pandas"``, ``"polars"`` or ``"arrow"``, fetched the same way as :meth:`csql.Query.preview_pd`,
+	               :meth:`~csql.Query.preview_pl` and :meth:`~csql.Query.to_arrow`.
+	:param timeout: If given, cancel each query that takes longer than this many seconds (including persisting
+	                anything it depends on), and report a :class:`TimeoutError` in its :class:`RunResult`.
+	                See :func:`csql.adapters.statement_timeout`.
+
+	Other arguments are the same as :meth:`csql.Query.build`.
+
+	:returns: a :class:`RunResult` for each query, in the order they were given.
+	"""
+	queries = list(queries)
+	unique_queries = list({id(q): q for q in queries}.values())
+	results = _run(
+		[(q, newParams) for q in unique_queries],
+		connect,
+		max_workers=max_workers,
+		release=release,
+		format=format,
+		timeout=timeout,
+		dialect=dialect,
+		overrides=overrides,
+	)
+	by_id = {id(r.query): r for r in results}
+	return [by_id[id(q)] for q in queries]
+
+
+def run_partitioned(
+	q: csql.Query,
+	connect: Callable[[], Any],
+	splits: int | None = None,
+	*,
+	ranges: Sequence[tuple[Any, Any]] | None = None,
+	start: str = "start",
+	end: str = "end",
+	max_workers: int | None = None,
+	release: Callable[[Any], None] | None = None,
+	format: Literal["pandas", "polars", "arrow"] = "arrow",
+	timeout: float | None = None,
+	dialect: csql.dialect.SQLDialect | None = None,
+	newParams: Mapping[str, Any] | None = None,
+	overrides: csql.overrides.Overrides | None = None,
+) -> Any:
+	"""See :meth:`csql.Query.partitioned`."""
+	for key in (start, end):
+		if _find_param(q, key) is None:
+			raise ValueError(f"Query has no parameter called {key!r}")
+	if ranges is None:
+		if splits is None:
+			raise ValueError("Need either splits or ranges")
+		lo = _param_value(q, start, newParams)
+		hi = _param_value(q, end, newParams)
+		ranges = split_range(lo, hi, splits)
+
+	jobs = [(q, {**(newParams or {}), start: lo, end: hi}) for lo, hi in ranges]
+	results = _run(
+		jobs,
+		connect,
+		max_workers=max_workers,
+		release=release,
+		format=format,
+		timeout=timeout,
+		dialect=dialect,
+		overrides=overrides,
+	)
+	for r in results:
+		if r.error is not None:
+			raise r.error
+
+	parts = [r.result for r in results]
+	if format == "pandas":
+		import pandas as pd  # pyright: ignore[reportMissingTypeStubs]
+
+		return pd.concat(parts, ignore_index=True)
+	elif format == "polars":
+		import polars as pl
+
+		return pl.concat(parts)
+	else:
+		import pyarrow as pa  # pyright: ignore[reportMissingTypeStubs]
+
+		return pa.concat_tables(parts)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+
+
+def split_range(lo: Any, hi: Any, splits: int) -> list[tuple[Any, Any]]:
+	"""
+	Split the half-open range ``[lo, hi)`` into ``splits`` contiguous, non-overlapping ranges
+	of (roughly) equal size. Ints and dates are split on whole numbers and whole days.
+	"""
+	if splits < 1:
+		raise ValueError(f"splits needs to be at least 1, not {splits}")
+	if not lo < hi:
+		raise ValueError(f"Can't split an empty range: {lo!r} to {hi!r}")
+
+	def bound(i: int) -> Any:
+		if isinstance(lo, int):
+			return lo + (hi - lo) * i // splits
+		if isinstance(lo, date) and not isinstance(lo, datetime):
+			return lo + timedelta(days=(hi - lo).days * i // splits)
+		return lo + (hi - lo) * i / splits
+
+	bounds = [bound(i) for i in range(splits)] + [hi]
+	# there might be fewer distinct bounds than splits, e.g. 10 splits of 3 days.
+	return [(a, b) for a, b in pairwise(bounds) if a < b]
+
+
+def _param_value(q: csql.Query, key: str, newParams: Mapping[str, Any] | None) -> Any:
+	if newParams is not None and key in newParams:
+		return newParams[key]
+	if (part := _find_param(q, key)) is None:
+		raise ValueError(f"Query has no parameter called {key!r}")
+	return part.value
+
+
+def _find_param(q: csql.Query, key: str) -> ParameterPlaceholder | None:
+	for dep in (*q._getDeps(), q):
+		for part in dep.queryParts:
+			if isinstance(part, ParameterPlaceholder) and part.key == key:
+				return part
+	return None
+
+
+def _run(
+	jobs: Sequence[tuple[csql.Query, Mapping[str, Any] | None]],
+	connect: Callable[[], Any],
+	*,
+	max_workers: int | None,
+	release: Callable[[Any], None] | None,
+	format: Literal["pandas", "polars", "arrow"],
+	timeout: float | None,
+	dialect: csql.dialect.SQLDialect | None,
+	overrides: csql.overrides.Overrides | None,
+) -> list[RunResult]:
+	if format not in ("pandas", "polars", "arrow"):
+		raise ValueError(f"format needs to be pandas, polars or arrow, not {format!r}")
+
+	def fetch(con: Any, rq: csql.RenderedQuery) -> Any:
+		adapter = adapter_for(con)
+		if format == "pandas":
+			return adapter.to_pandas(rq, con)
+		elif format == "polars":
+			return adapter.to_polars(rq, con)
+		else:
+			return adapter.to_arrow(rq, con)  # pyright: ignore[reportUnknownMemberType, reportUnknownVariableType]
+
+	def run(con: Any, q: csql.Query, newParams: Mapping[str, Any] | None) -> RunResult:
+		start = time.perf_counter()
+		built: float | None = None
+		try:
+			with statement_timeout(con, timeout):
+				rq = q.build(dialect=dialect, newParams=newParams, overrides=overrides)
+				built = time.perf_counter()
+				result = fetch(con, rq)
+		except Exception as e:  # noqa: BLE001 - reported in the RunResult
+			if built is None:
+				return RunResult(q, None, e, time.perf_counter() - start, 0.0)
+			return RunResult(q, None, e, built - start, time.perf_counter() - built)
+		return RunResult(q, result, None, built - start, time.perf_counter() - built)
+
+	results: list[RunResult | None] = [None] * len(jobs)
+	pending = iter(enumerate(jobs))
+	pending_lock = threading.Lock()
+
+	def worker() -> None:
+		# Each worker opens its own connection and releases it itself: drivers like
+		# sqlite3 won't let a connection be used (or closed) from another thread.
+		con: Any = None
+		try:
+			while True:
+				with pending_lock:
+					try:
+						i, (q, params) = next(pending)
+					except StopIteration:
+						return
+				if con is None:
+					try:
+						con = connect()
+					except Exception as e:  # noqa: BLE001 - reported in the RunResult
+						results[i] = RunResult(q, None, e, 0.0, 0.0)
+						continue
+				results[i] = run(con, q, params)
+		finally:
+			if con is not None:
+				try:
+					if release is not None:
+						release(con)
+					else:
+						con.close()
+				except Exception:
+					logger.warning("Couldn't release connection %r", con, exc_info=True)
+
+	if not jobs:
+		return []
+	workers = min(max_workers or _default_workers(), len(jobs))
+	with ThreadPoolExecutor(
+		max_workers=workers, thread_name_prefix="csql-run"
+	) as executor:
+		for f in [executor.submit(worker) for _ in range(workers)]:
+			f.result()
+	return [r for r in results if r is not None]
+
+
+def _default_workers() -> int:
+	# the same as ThreadPoolExecutor's default
+	return min(32, (os.cpu_count() or 1) + 4)
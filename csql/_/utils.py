@@ -41,16 +41,22 @@ def assert_never(x: NoReturn) -> NoReturn:
 
 
 def limit_query(
-	query: Query, rows: int | None, dialect: SQLDialect | None = None
+	query: Query,
+	rows: int | None,
+	dialect: SQLDialect | None = None,
+	sample: float | None = None,
 ) -> Query:
 	from .api import Q
 	from .models.dialect import Limit
 
+	dialect = dialect or query._default_dialect()
+
+	if sample is not None:
+		query = sample_query(query, sample, dialect)
+
 	if rows is None:
 		return query
 
-	dialect = dialect or query._default_dialect()
-
 	if dialect.limit is Limit.limit:
 		query_str = f"select * from {query} limit {rows}"
 	elif dialect.limit is Limit.top_n:
@@ -60,3 +66,51 @@ def limit_query(
 	else:
 		assert_never(dialect.limit)
 	return Q(query_str)
+
+
+def sample_query(query: Query, percent: float, dialect: SQLDialect) -> Query:
+	"""
+	Sample the leaves of ``query``'s tree - the queries that don't reference any others, or that are
+	persisted - so everything built on top of them only has ``percent`` % of the rows to work through.
+	``query`` itself is never sampled. Does nothing if ``dialect`` can't sample.
+	"""
+	import functools
+
+	from .api import Q
+	from .models.dialect import Sample
+	from .models.query import Query
+	from .models.query_replacers import _replace_query_parts
+	from .persist import Persistable
+
+	if not 0 < percent <= 100:
+		raise ValueError(
+			f"sample needs to be a percentage between 0 and 100, not {percent}"
+		)
+	method = dialect.sample
+	if method is None:
+		return query
+
+	def sampled(q: Query) -> Query:
+		if method is Sample.using_sample:
+			return Q(f"select * from {q} using sample {percent:g}% (bernoulli)")
+		elif method is Sample.tablesample:
+			return Q(f"select * from {q} tablesample bernoulli ({percent:g})")
+		elif method is Sample.rand_canonical:
+			return Q(f"select * from {q} where randCanonical() < {percent / 100:g}")
+		else:
+			assert_never(method)
+
+	@functools.cache
+	def rewrite(q: Query) -> Query:
+		deps = [p for p in q.queryParts if isinstance(p, Query)]
+		if not deps or q._get_extension(Persistable) is not None:
+			# sample persisted queries from the outside, rather than persisting a sample.
+			return sampled(q)
+		return rewrite_parts(q)
+
+	def rewrite_parts(q: Query) -> Query:
+		return _replace_query_parts(
+			lambda p: rewrite(p) if isinstance(p, Query) else p, q
+		)
+
+	return rewrite_parts(query)
@@ -5,6 +5,7 @@ from __future__ import annotations
 from ._.api import (
 	Q,
 )
+from ._.explain import PlanNode
 from ._.models.query import (
 	ClickhouseQueryArgs,
 	DuckDBQueryArgs,
@@ -20,6 +21,9 @@ from ._.models.query import (
 from ._.models.query import (
 	ParameterList as _Deprecated_ParameterList,
 )
+from ._.persist.warm import warm
+from ._.profile import Profile, ProfileNode
+from ._.run import RunResult, run_all
 from .overrides import Overrides as _Deprecated_Overrides
 
 __all__ = [
@@ -28,12 +32,18 @@ __all__ = [
 	"ParameterPlaceholder",
 	"ParameterValue",
 	"Parameters",
+	"PlanNode",
 	"PolarsQueryArgs",
+	"Profile",
+	"ProfileNode",
 	"Q",
 	"Query",
 	"QueryBit",
 	"QueryExtension",
 	"RenderedQuery",
+	"RunResult",
+	"run_all",
+	"warm",
 ]
 
 import typing
@@ -0,0 +1,14 @@
+# mypy: implicit-reexport
+# pyright: reportUnusedImport=false
+# ruff: noqa: F401
+from ._.execution import (
+	Adapter,
+	ADBCAdapter,
+	ClickHouseAdapter,
+	DuckDBAdapter,
+	PostgresAdapter,
+	SnowflakeAdapter,
+	adapter_for,
+	register_adapter,
+	statement_timeout,
+)
@@ -2,12 +2,20 @@
 ``contrib.persist`` contains some :class:`csql.persist.Cacher` implementations.
 """
 
+import functools
+import threading
+from collections.abc import Callable, Generator, Hashable
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
 from logging import getLogger
 from typing import Any
 
-from csql import Q, Query, RenderedQuery
+from csql import Parameters, Q, Query, RenderedQuery
+from csql._.execution import statement_timeout
+from csql._.persist import KL, PreBuild
 from csql._.persist import Cacher as Cacher
 from csql._.persist import Key as Key
+from csql.persist import LockBackend, SQLiteKeyIndex
 
 logger = getLogger(__name__)
 
@@ -27,36 +35,330 @@ class TempTableCacher(Cacher):
 	_subQuery0 as (...)
 	select count(*) from _subQuery0
 
+	Temp tables disappear when the connection is closed. If that might happen behind your back,
+	set ``probe_interval`` to have ``csql`` check tables still exist before re-using them.
+
+	"""
+
+	def __init__(
+		self,
+		connection: Any,
+		index: SQLiteKeyIndex | None = None,
+		lock_backend: LockBackend | None = None,
+		probe_interval: float | None = None,
+	):
+		self._con = connection
+		self.index = index
+		self.lock_backend = lock_backend
+		self.probe_interval = probe_interval
+
+	def _table_name(self, key: Key, tag: str | None) -> str:
+		return _table_name(key, tag)
+
+	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
+		_create_temp_table(self._con, rq, self._table_name(key, tag))
+		return self._retrieval(key, tag)
+
+	def _retrieval(self, key: Key, tag: str | None) -> Query:
+		table_name = self._table_name(key, tag)
+		retrieve_sql = Q(
+			f"""select * from {table_name}"""
+		)  # maybe copy overrides and stuff?
+		return retrieve_sql
+
+	def _drop(self, key: Key, tag: str | None) -> bool:
+		c = self._con.cursor()
+		try:
+			c.execute(f"drop table if exists {self._table_name(key, tag)}")
+		finally:
+			c.close()
+		return True
+
+	def _probe(self, retrieval: Query) -> bool:
+		try:
+			c = self._con.cursor()
+		except Exception:  # noqa: BLE001 - e.g. the connection has been closed
+			return False
+		# a failed query aborts the whole transaction on some drivers (e.g. psycopg outside
+		# autocommit), which would fail the re-materialization that follows. A savepoint
+		# lets us undo just the probe, where the database has them.
+		try:
+			c.execute("savepoint csql_probe")
+			savepoint = True
+		except Exception:  # noqa: BLE001 - e.g. not supported, or not in a transaction
+			savepoint = False
+		try:
+			c.execute(f"select * from ({retrieval.build().sql}) t where 1 = 0")
+		except Exception:  # noqa: BLE001 - DBAPI drivers all raise their own errors
+			if savepoint:
+				with suppress(Exception):
+					c.execute("rollback to savepoint csql_probe")
+			return False
+		finally:
+			if savepoint:
+				with suppress(Exception):
+					c.execute("release savepoint csql_probe")
+			c.close()
+		return True
+
+
+class PooledTempTableCacher(TempTableCacher):
+	"""
+	A :class:`TempTableCacher` for connection pools. Temp tables only exist in the session that
+	created them, so this keeps track of which sessions own each table. Bind the connection you're
+	about to run a query on with :meth:`using`, and any tables it's missing are re-created on it
+	when the query is built:
+
+	.. code-block:: py
+
+	    cache = PooledTempTableCacher()
+	    q = Q('select * from slow_view').persist(cache)
+	    q2 = Q(f'select count(*) from {q}')
+
+	    with pool.connect() as con, cache.using(con):
+	        con.execute(*q2.db)  # creates the temp table on this connection
+	    with pool.connect() as con, cache.using(con):
+	        con.execute(*q2.db)  # re-uses it if this is the same session, or re-creates it if not
+
+	:attr:`rematerializations` counts how many times a table had to be re-created on another session.
+
+	:param connection: An optional DBAPI-compliant connection to use when nothing is bound with :meth:`using`.
+	:param session_id: Identifies the database session behind a connection. Defaults to ``id``, which is
+	                   right when your pool hands out the DBAPI connections themselves. If it wraps
+	                   them, pass something that sees through that, e.g. ``lambda c: c.driver_connection``.
+	"""
+
+	rematerializations: int
+	"""How many times a table has been re-created on a session that didn't have it yet."""
+
+	def __init__(
+		self,
+		connection: Any = None,
+		session_id: Callable[[Any], Hashable] = id,
+		lock_backend: LockBackend | None = None,
+	):
+		super().__init__(connection, lock_backend=lock_backend)
+		self.session_id = session_id
+		self.rematerializations = 0
+		self._bound: ContextVar[Any] = ContextVar(
+			f"csql_pooled_{id(self)}", default=None
+		)
+		# key -> (the query behind it, its tag, sessions that have it)
+		self._tables: dict[Key, tuple[RenderedQuery, str | None, set[Hashable]]] = {}
+		self._lock = threading.RLock()
+
+	@contextmanager
+	def using(self, connection: Any) -> Generator[None, None, None]:
+		"""
+		Build queries for ``connection`` while this context manager is entered. This is tracked
+		with a :class:`contextvars.ContextVar`, so threads and async tasks can each bind their own.
+		"""
+		token = self._bound.set(connection)
+		try:
+			yield
+		finally:
+			self._bound.reset(token)
+
+	def release(self, connection: Any) -> None:
+		"""
+		Call this when ``connection``'s session ends, so its temp tables aren't assumed to exist
+		any more (e.g. if ``session_id`` might be re-used by a new session).
+		"""
+		sid = self.session_id(connection)
+		with self._lock:
+			for _rq, _tag, sessions in self._tables.values():
+				sessions.discard(sid)
+
+	def _connection(self) -> Any:
+		if (con := self._bound.get()) is None and (con := self._con) is None:
+			raise RuntimeError(
+				"No connection to persist with - use `with cache.using(con):` around your build."
+			)
+		return con
+
+	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
+		con = self._connection()
+		with self._lock:
+			_create_temp_table(con, rq, self._table_name(key, tag))
+			self._tables[key] = (rq, tag, {self.session_id(con)})
+		return self._retrieval(key, tag)._add_extensions(
+			PreBuild(functools.partial(self._ensure, key))
+		)
+
+	def _drop(self, key: Key, tag: str | None) -> bool:
+		return False  # the tables are spread across sessions we can't get to.
+
+	def _ensure(self, key: Key) -> None:
+		"""Make sure the table for ``key``, and any it was built from, exist on the bound connection."""
+		con = self._connection()
+		sid = self.session_id(con)
+		with self._lock:
+			if (table := self._tables.get(key)) is None:
+				return
+			rq, tag, sessions = table
+			if sid in sessions:
+				return
+			for upstream in [k for k in self._tables if k != key and k in rq.sql]:
+				self._ensure(upstream)
+			logger.debug(
+				f"Re-creating {self._table_name(key, tag)} for session {sid!r}"
+			)
+			_create_temp_table(con, rq, self._table_name(key, tag))
+			sessions.add(sid)
+			self.rematerializations += 1
+
+
+class IncrementalTempTableCacher(Cacher):
 	"""
+	Like a :class:`TempTableCacher`, but for queries over a range that keeps growing, like
+	``day >= {p.start} and day < {p.end}``. Every range of the same query shares one table,
+	and only the parts of a range that haven't been saved yet are run and appended to it.
+	Extending a range from yesterday to today only runs the query for today.
 
-	def __init__(self, connection: Any):
+	.. code-block:: py
+
+	    cache = IncrementalTempTableCacher(con, column='day')
+	    p = Parameters(start=date(2024, 1, 1), end=date(2024, 6, 1))
+	    q = Q(f'select day, ... from events where day >= {p.start} and day < {p.end}').persist(cache)
+	    q2 = Q(f'select ... from {q}')
+	    q2.build()  # runs [2024-01-01, 2024-06-01)
+	    q2.build(newParams={'end': date(2024, 6, 2)})  # only runs [2024-06-01, 2024-06-02)
+
+	Ranges are half-open: the query must return exactly the rows with ``start <= column < end``,
+	so that the pieces fit together. Queries without both parameters are persisted like
+	they would be by a :class:`TempTableCacher`.
+
+	The shared tables are temp tables, so they last as long as ``connection`` does.
+
+	:param connection: A DBAPI-compliant connection.
+	:param column: The column the query is partitioned by. Retrieval queries filter on it.
+	:param start: The name of the parameter holding the (inclusive) start of the range.
+	:param end: The name of the parameter holding the (exclusive) end of the range.
+	"""
+
+	def __init__(
+		self,
+		connection: Any,
+		column: str,
+		start: str = "start",
+		end: str = "end",
+		lock_backend: LockBackend | None = None,
+	):
 		self._con = connection
+		self.lock_backend = lock_backend
+		self.column = column
+		self.start = start
+		self.end = end
+		# shared table key -> ranges saved in it so far, sorted and non-overlapping.
+		self._covered: dict[Key, list[tuple[Any, Any]]] = {}
+		self._lock = threading.Lock()
+
+	def _with_range(self, rq: RenderedQuery, lo: Any, hi: Any) -> RenderedQuery:
+		bounds = {self.start: lo, self.end: hi}
+		return rq._replace(
+			parameters=tuple(
+				bounds.get(name, value) if name is not None else value
+				for name, value in zip(rq.parameter_names, rq.parameters)
+			)
+		)
 
 	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
-		table_name = f'"csql_cache_{tag}_{key}"'
-
-		sql, params, _names = rq
-
-		create_sql = RenderedQuery(
-			sql=f"""
-            create temporary table if not exists {table_name}
-            as
-            {sql}
-            """,
-			parameters=params,
-			parameter_names=_names,
+		if not {self.start, self.end} <= set(rq.parameter_names):
+			table_name = _table_name(key, tag)
+			_create_temp_table(self._con, rq, table_name)
+			return Q(f"select * from {table_name}")
+
+		lo, hi = rq.params_dict[self.start], rq.params_dict[self.end]
+		shared_key = KL._get_key(self._with_range(rq, None, None), tag)
+		table_name = _table_name(shared_key, tag)
+
+		with self._lock:
+			for gap_lo, gap_hi in _gaps(self._covered.get(shared_key, []), lo, hi):
+				gap_rq = self._with_range(rq, gap_lo, gap_hi)
+				if shared_key in self._covered:
+					self._append(gap_rq, table_name)
+				else:
+					_create_temp_table(self._con, gap_rq, table_name)
+				self._covered[shared_key] = _merge([
+					*self._covered.get(shared_key, []),
+					(gap_lo, gap_hi),
+				])
+			if shared_key not in self._covered:
+				# an empty range, but we still need a table.
+				_create_temp_table(self._con, rq, table_name)
+				self._covered[shared_key] = []
+
+		p = Parameters(**{self.start: lo, self.end: hi})
+		return Q(
+			f"""select * from {table_name} where {self.column} >= {p[self.start]} and {self.column} < {p[self.end]}"""
 		)
 
+	def _append(self, rq: RenderedQuery, table_name: str) -> None:
+		insert_sql = rq._replace(
+			sql=f"insert into {table_name} select * from ({rq.sql}) t"
+		)
 		logger.debug(
-			f"Executing persist SQL:\n{create_sql.sql}\nwith params: {create_sql.parameters}"
+			f"Executing append SQL:\n{insert_sql.sql}\nwith params: {insert_sql.parameters}"
 		)
 		c = self._con.cursor()
 		try:
-			c.execute(*create_sql.db)
+			with statement_timeout(self._con):
+				c.execute(*insert_sql.db)
 		finally:
 			c.close()
 
-		retrieve_sql = Q(
-			f"""select * from {table_name}"""
-		)  # maybe copy overrides and stuff?
-		return retrieve_sql
+
+def _table_name(key: Key, tag: str | None) -> str:
+	return f'"csql_cache_{tag}_{key}"'
+
+
+def _create_temp_table(con: Any, rq: RenderedQuery, table_name: str) -> None:
+	sql, params, _names = rq
+
+	create_sql = RenderedQuery(
+		sql=f"""
+        create temporary table if not exists {table_name}
+        as
+        {sql}
+        """,
+		parameters=params,
+		parameter_names=_names,
+	)
+
+	logger.debug(
+		f"Executing persist SQL:\n{create_sql.sql}\nwith params: {create_sql.parameters}"
+	)
+	c = con.cursor()
+	try:
+		with statement_timeout(con):
+			c.execute(*create_sql.db)
+	finally:
+		c.close()
+
+
+def _merge(ranges: list[tuple[Any, Any]]) -> list[tuple[Any, Any]]:
+	merged: list[tuple[Any, Any]] = []
+	for lo, hi in sorted(ranges):
+		if merged and lo <= merged[-1][1]:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+		else:
+			merged.append((lo, hi))
+	return merged
+
+
+def _gaps(covered: list[tuple[Any, Any]], lo: Any, hi: Any) -> list[tuple[Any, Any]]:
+	"""The parts of ``[lo, hi)`` not in ``covered``."""
+	gaps: list[tuple[Any, Any]] = []
+	for covered_lo, covered_hi in covered:
+		if lo >= hi:
+			break
+		if covered_hi <= lo:
+			continue
+		if covered_lo >= hi:
+			break
+		if covered_lo > lo:
+			gaps.append((lo, covered_lo))
+		lo = max(lo, covered_hi)
+	if lo < hi:
+		gaps.append((lo, hi))
+	return gaps
@@ -0,0 +1,264 @@
+"""
+``contrib.persist.arrow`` contains cache implementations that save results locally with Arrow.
+For this file to import properly, you'll need to make sure `pyarrow` is installed.
+"""
+
+# pyarrow is untyped.
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false, reportUnknownParameterType=false
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Literal
+
+import pyarrow as pa  # pyright: ignore[reportMissingTypeStubs]
+
+from csql import Q, Query, RenderedQuery
+from csql._.execution import fetch_arrow, statement_timeout
+from csql.persist import Persisted
+
+from . import Cacher, Key
+
+if TYPE_CHECKING:
+	from csql.persist import LockBackend, SQLiteKeyIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ParquetCacher(Cacher):
+	"""
+	The ``ParquetCacher`` runs a query once, saves the result to a local Parquet
+	(or Arrow IPC) file named after its key, and returns a query reading that file.
+	Expensive warehouse extracts become fast local scans for everything downstream, and
+	because files are named by key, they are re-used after the process restarts too.
+
+	The default ``reader`` suits DuckDB:
+
+	.. code-block:: py
+
+	    from csql.contrib.persist.arrow import ParquetCacher
+	    cache = ParquetCacher(warehouse_con, '/tmp/csql_cache', max_bytes=10 * 2**30)
+	    q = Q('select * from huge_fact_table where ...').persist(cache, 'facts')
+	    q.build().sql
+	    # "select * from read_parquet('/tmp/csql_cache/csql_cache_facts_5f1b....parquet')"
+
+	For other engines, or for Arrow IPC files (which DuckDB can't read without an extension), pass
+	a ``reader`` template, e.g. ``"file('{path}', Parquet)"`` or ``"file('{path}', Arrow)"`` for ClickHouse.
+
+	:param connection: A DuckDB connection, ClickHouse client, or DBAPI-compliant connection to run queries with.
+	:param directory: A directory to save files in. It will be created if it doesn't exist.
+	:param format: ``"parquet"``, or ``"arrow"`` for uncompressed Arrow IPC files.
+	:param reader: A SQL template to read a file, with ``{path}`` to be filled in.
+	               Defaults to ``read_parquet('{path}')`` for Parquet, and is required for Arrow IPC.
+	:param max_bytes: If given, the least recently used files are deleted once
+	                  the directory holds more than this many bytes of them.
+	:param probe_interval: If given, check files still exist before re-using them, at most
+	                       this often. Useful if something else cleans up the directory.
+	"""
+
+	def __init__(
+		self,
+		connection: Any,
+		directory: str | os.PathLike[str],
+		format: Literal["parquet", "arrow"] = "parquet",
+		reader: str | None = None,
+		max_bytes: int | None = None,
+		index: SQLiteKeyIndex | None = None,
+		lock_backend: LockBackend | None = None,
+		probe_interval: float | None = None,
+	):
+		self._con = connection
+		self.directory = os.fspath(directory)
+		self.format = format
+		if reader is None and format != "parquet":
+			raise ValueError(f"Need a reader for {format} files")
+		self.reader = reader or "read_parquet('{path}')"
+		self.max_bytes = max_bytes
+		self.index = index
+		self.lock_backend = lock_backend
+		self.probe_interval = probe_interval
+		self._paths: dict[Key, str] = {}
+		self._evict_lock = threading.Lock()
+		os.makedirs(self.directory, exist_ok=True)
+
+	def _path(self, key: Key, tag: str | None) -> str:
+		ext = "parquet" if self.format == "parquet" else "arrow"
+		return os.path.join(self.directory, f"csql_cache_{tag}_{key}.{ext}")
+
+	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Persisted:
+		path = self._path(key, tag)
+		self._paths[key] = path
+
+		rows = None
+		if os.path.exists(path):
+			logger.debug(f"Re-using {path}")
+			os.utime(path)
+		else:
+			logger.debug(
+				f"Executing persist SQL:\n{rq.sql}\nwith params: {rq.parameters}"
+			)
+			with statement_timeout(self._con):
+				table = fetch_arrow(rq, self._con)
+			self._write(table, path)
+			rows = table.num_rows
+			self._evict(keep=path)
+
+		return Persisted(
+			self._retrieval(key, tag), rows=rows, bytes=os.path.getsize(path)
+		)
+
+	def _retrieval(self, key: Key, tag: str | None) -> Query:
+		escaped = self._path(key, tag).replace("'", "''")
+		return Q(f"select * from {self.reader.format(path=escaped)}")
+
+	def _probe(self, retrieval: Query) -> bool:
+		match = re.search(
+			r"csql_cache_[^/\']*\.(?:parquet|arrow)", retrieval.build().sql
+		)
+		return match is not None and os.path.exists(
+			os.path.join(self.directory, match[0])
+		)
+
+	def _write(self, table: pa.Table, path: str) -> None:
+		# write then rename, so nobody ever reads a half-written file.
+		tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+		if self.format == "parquet":
+			import pyarrow.parquet as pq  # pyright: ignore[reportMissingTypeStubs]
+
+			pq.write_table(table, tmp)
+		else:
+			with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as w:
+				w.write_table(table)
+		os.replace(tmp, path)
+
+	def _drop(self, key: Key, tag: str | None) -> bool:
+		self._paths.pop(key, None)
+		try:
+			os.remove(self._path(key, tag))
+		except FileNotFoundError:
+			pass
+		return True
+
+	def _touch(self, key: Key) -> None:
+		if (path := self._paths.get(key)) is not None:
+			try:
+				os.utime(path)
+			except FileNotFoundError:
+				pass
+
+	def _evict(self, keep: str) -> None:
+		if self.max_bytes is None:
+			return
+		with self._evict_lock:
+			files: list[tuple[float, int, str]] = []
+			for entry in os.scandir(self.directory):
+				if entry.name.startswith("csql_cache_") and entry.path.endswith((
+					".parquet",
+					".arrow",
+				)):
+					stat = entry.stat()
+					files.append((stat.st_mtime, stat.st_size, entry.path))
+
+			total = sum(size for _mtime, size, _path in files)
+			for _mtime, size, path in sorted(files):
+				if total <= self.max_bytes:
+					break
+				if path == keep:
+					continue
+				key = os.path.splitext(path)[0].rsplit("_", 1)[-1]
+				with self._try_lock(key) as locked:
+					if not locked:
+						continue  # somebody is about to read it
+					logger.debug(f"Evicting {path}")
+					try:
+						os.remove(path)
+					except FileNotFoundError:
+						pass
+					total -= size
+					self._paths.pop(key, None)
+					self._forget(key)
+
+
+class DuckDBArrowCacher(Cacher):
+	"""
+	The ``DuckDBArrowCacher`` runs a query once, keeps the result in memory as an Arrow table,
+	and registers it on a DuckDB connection as a view. There's no round trip to disk, and DuckDB
+	scans registered Arrow tables without copying them, so this is a quick way to re-use
+	intermediate results that comfortably fit in memory.
+
+	.. code-block:: py
+
+	    from csql.contrib.persist.arrow import DuckDBArrowCacher
+	    con = duckdb.connect()
+	    cache = DuckDBArrowCacher(con, max_bytes=2 * 2**30)
+	    q = Q('select ... from read_parquet(...) group by all').persist(cache, 'agg')
+	    q.build().sql
+	    # 'select * from "csql_cache_agg_5f1b..."'
+
+	:param connection: A ``duckdb.DuckDBPyConnection``. Results are only visible on this connection.
+	:param max_bytes: If given, the least recently used tables are unregistered once
+	                  all tables held by this cacher take up more than this many bytes.
+	"""
+
+	def __init__(self, connection: Any, max_bytes: int | None = None):
+		self._con = connection
+		self.max_bytes = max_bytes
+		# key -> (view name, bytes), least recently used first.
+		self._views: OrderedDict[Key, tuple[str, int]] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _view_name(self, key: Key, tag: str | None) -> str:
+		return f"csql_cache_{tag}_{key}"
+
+	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Persisted:
+		view_name = self._view_name(key, tag)
+
+		logger.debug(f"Executing persist SQL:\n{rq.sql}\nwith params: {rq.parameters}")
+		with statement_timeout(self._con):
+			table = fetch_arrow(rq, self._con)
+
+		with self._lock:
+			self._con.register(view_name, table)
+			self._views[key] = (view_name, table.nbytes)
+			self._evict(keep=key)
+
+		return Persisted(
+			self._retrieval(key, tag), rows=table.num_rows, bytes=table.nbytes
+		)
+
+	def _retrieval(self, key: Key, tag: str | None) -> Query:
+		escaped = self._view_name(key, tag).replace('"', '""')
+		return Q(f'select * from "{escaped}"')
+
+	def _touch(self, key: Key) -> None:
+		with self._lock:
+			if key in self._views:
+				self._views.move_to_end(key)
+
+	def _drop(self, key: Key, tag: str | None) -> bool:
+		with self._lock:
+			if (view := self._views.pop(key, None)) is not None:
+				self._con.unregister(view[0])
+		return True
+
+	def _evict(self, keep: Key) -> None:
+		if self.max_bytes is None:
+			return
+		total = sum(size for _name, size in self._views.values())
+		for key, (view_name, size) in list(self._views.items()):
+			if total <= self.max_bytes:
+				break
+			if key == keep:
+				continue
+			with self._try_lock(key) as locked:
+				if not locked:
+					continue  # somebody is about to read it
+				logger.debug(f"Evicting {view_name}")
+				self._con.unregister(view_name)
+				del self._views[key]
+				total -= size
+				self._forget(key)
@@ -0,0 +1,173 @@
+"""
+``contrib.persist.clickhouse`` contains cache implementations specifically
+for ClickHouse. They're written against `clickhouse-connect`'s ``Client``,
+but anything with compatible ``command()`` and ``query()`` methods will do.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from csql import Q, Query, RenderedQuery
+from csql._.execution import statement_timeout
+from csql.persist import Persisted
+
+from . import Cacher, Key
+
+if TYPE_CHECKING:
+	from csql.persist import LockBackend, SQLiteKeyIndex
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_PREFIX = "csql created_at="
+
+
+class ClickHouseCacher(Cacher):
+	"""
+	The ``ClickHouseCacher`` persists a query into a regular ClickHouse table, with a
+	``create table if not exists ... engine = ... as`` statement. ClickHouse temporary
+	tables only live as long as a session, which doesn't suit HTTP clients like
+	``clickhouse_connect``, so this uses real tables and cleans them up itself after ``ttl``.
+
+	Queries need to be built with the :data:`csql.dialect.ClickHouse` dialect, so parameters
+	are rendered as ClickHouse query parameters.
+
+	.. code-block:: py
+
+	    import clickhouse_connect
+	    from csql.contrib.persist.clickhouse import ClickHouseCacher
+	    client = clickhouse_connect.get_client()
+	    cache = ClickHouseCacher(client, engine='MergeTree order by tuple()', ttl=60 * 60)
+	    q = Q(f'select ... from events where day >= {p.start}', dialect=csql.dialect.ClickHouse).persist(cache)
+
+	:param client: A ``clickhouse_connect`` ``Client``.
+	:param engine: The table engine to create tables with, e.g. ``Memory`` or ``MergeTree order by tuple()``.
+	:param database: The database to create tables in. Defaults to the client's current database.
+	:param ttl: If given, tables created by any ``ClickHouseCacher`` more than this many
+	            seconds ago are dropped by :meth:`cleanup`, which also runs every ``ttl``
+	            seconds when persisting.
+	:param probe_interval: If given, check tables still exist before re-using them, at most
+	                       this often. Useful when other processes' cleanups could drop them.
+	"""
+
+	def __init__(
+		self,
+		client: Any,
+		engine: str = "Memory",
+		database: str | None = None,
+		ttl: float | None = None,
+		index: SQLiteKeyIndex | None = None,
+		lock_backend: LockBackend | None = None,
+		probe_interval: float | None = None,
+	):
+		self._client = client
+		self.engine = engine
+		self.database = database
+		self.ttl = ttl
+		self.index = index
+		self.lock_backend = lock_backend
+		self.probe_interval = probe_interval
+		self._last_cleanup = time.time()
+		self._cleanup_lock = threading.Lock()
+
+	def _table_name(self, key: Key, tag: str | None) -> str:
+		name = f"`csql_cache_{tag}_{key}`"
+		return name if self.database is None else f"`{self.database}`.{name}"
+
+	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Persisted:
+		if self.ttl is not None and time.time() - self._last_cleanup > self.ttl:
+			self.cleanup()
+
+		table_name = self._table_name(key, tag)
+
+		create_sql = RenderedQuery(
+			sql=f"""
+            create table if not exists {table_name}
+            engine = {self.engine}
+            comment '{_COMMENT_PREFIX}{time.time()}'
+            as
+            {rq.sql}
+            """,
+			parameters=rq.parameters,
+			parameter_names=rq.parameter_names,
+		)
+
+		logger.debug(
+			f"Executing persist SQL:\n{create_sql.sql}\nwith params: {create_sql.params_dict}"
+		)
+		ch = create_sql.ch
+		with statement_timeout(self._client):
+			self._client.command(ch["query"], parameters=ch["parameters"])
+
+		rows, nbytes = self._size(key, tag)
+		return Persisted(self._retrieval(key, tag), rows=rows, bytes=nbytes)
+
+	def _size(self, key: Key, tag: str | None) -> tuple[int | None, int | None]:
+		if self.database is None:
+			database, parameters = "currentDatabase()", {}
+		else:
+			database, parameters = "{database:String}", {"database": self.database}
+		result = self._client.query(
+			f"""
+			select total_rows, total_bytes from system.tables
+			where database = {database} and name = {{name:String}}
+			""",
+			parameters={**parameters, "name": f"csql_cache_{tag}_{key}"},
+		).result_rows
+		return tuple(result[0]) if result else (None, None)
+
+	def _retrieval(self, key: Key, tag: str | None) -> Query:
+		return Q(f"select * from {self._table_name(key, tag)}")
+
+	def _drop(self, key: Key, tag: str | None) -> bool:
+		self._client.command(f"drop table if exists {self._table_name(key, tag)}")
+		return True
+
+	def _probe(self, retrieval: Query) -> bool:
+		table_name = retrieval.build().sql.removeprefix("select * from ")
+		return bool(self._client.command(f"exists table {table_name}"))
+
+	def cleanup(self) -> list[str]:
+		"""
+		Drop cache tables created more than ``ttl`` seconds ago.
+
+		:returns: the names of the dropped tables.
+		"""
+		if self.ttl is None:
+			return []
+
+		with self._cleanup_lock:
+			self._last_cleanup = time.time()
+			if self.database is None:
+				database, parameters = "currentDatabase()", {}
+			else:
+				database, parameters = "{database:String}", {"database": self.database}
+			tables = self._client.query(
+				f"""
+				select name, comment from system.tables
+				where database = {database}
+				and startsWith(name, 'csql_cache_')
+				and startsWith(comment, '{_COMMENT_PREFIX}')
+				""",
+				parameters=parameters,
+			).result_rows
+
+			cutoff = time.time() - self.ttl
+			dropped: list[str] = []
+			for name, comment in tables:
+				created_at = float(comment.removeprefix(_COMMENT_PREFIX))
+				if created_at >= cutoff:
+					continue
+				table_name = (
+					f"`{name}`"
+					if self.database is None
+					else f"`{self.database}`.`{name}`"
+				)
+				logger.debug(f"Dropping expired {table_name}")
+				self._client.command(f"drop table if exists {table_name}")
+				self._forget(name.rsplit("_", 1)[-1])
+				dropped.append(name)
+			return dropped
@@ -6,14 +6,23 @@ to make sure `snowflake-connector-python` is installed.
 
 from __future__ import annotations
 
+import functools
+import math
+import threading
+import time
 from typing import TYPE_CHECKING
 
 from csql import Q, Query, RenderedQuery
+from csql._.execution import _deadline, statement_timeout
+from csql._.models.query import PreBuild
+from csql.persist import Persisted
 
 from . import Cacher, Key
 
 if TYPE_CHECKING:
 	import snowflake.connector
+
+	from csql.persist import LockBackend, SQLiteKeyIndex
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,23 +34,121 @@ class SnowflakeResultSetCacher(Cacher):
 	can kill your snowflake connection without losing temp tables, and the results are still cleaned up
 	properly by Snowflake in 7 days.
 
+	Pass an ``index`` to re-use result sets from earlier processes; give it a ``ttl`` shorter than
+	the 24 hours Snowflake keeps a result available to ``RESULT_SCAN``. Add a
+	:class:`csql.persist.FileLockBackend` as ``lock_backend`` as well to have concurrent processes
+	wait for each other's results instead of all running the same query.
+
 	:type connection: `snowflake.connector.Connection <https://docs.snowflake.com/en/user-guide/python-connector-api.html#object-connection>`_
 	"""
 
-	def __init__(self, connection: snowflake.connector.SnowflakeConnection):
+	def __init__(
+		self,
+		connection: snowflake.connector.SnowflakeConnection,
+		index: SQLiteKeyIndex | None = None,
+		lock_backend: LockBackend | None = None,
+	):
 		self._con = connection
+		self.index = index
+		self.lock_backend = lock_backend
 
-	def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
+	def _persist(
+		self, rq: RenderedQuery, key: Key, tag: str | None
+	) -> Query | Persisted:
 
 		sql, params, _param_names = rq
 
 		logger.debug(f"Executing persist SQL:\n{sql}\nwith params: {params}")
 		c = self._con.cursor()
 		try:
-			c.execute(sql, params)
+			with statement_timeout(self._con):
+				c.execute(sql, params)
 			qid = c.sfqid
+			rows = c.rowcount
+		finally:
+			c.close()
+
+		retrieve_sql = Q(f"""select * from table(result_scan('{qid}'))""")
+		return Persisted(retrieve_sql, rows=rows)
+
+
+class SnowflakeAsyncResultSetCacher(SnowflakeResultSetCacher):
+	"""
+	Like :class:`SnowflakeResultSetCacher`, but submits queries with ``execute_async`` instead
+	of waiting for each one in turn. Independent persisted queries in the same build run in
+	parallel on Snowflake, and ``csql`` only waits for a result when something needs it: either
+	another persisted query built on top of it, or the end of :meth:`csql.Query.build`.
+
+	:type connection: `snowflake.connector.Connection <https://docs.snowflake.com/en/user-guide/python-connector-api.html#object-connection>`_
+	:param poll_interval: How often to check on running queries, in seconds.
+	"""
+
+	def __init__(
+		self,
+		connection: snowflake.connector.SnowflakeConnection,
+		index: SQLiteKeyIndex | None = None,
+		lock_backend: LockBackend | None = None,
+		poll_interval: float = 0.1,
+	):
+		super().__init__(connection, index=index, lock_backend=lock_backend)
+		self.poll_interval = poll_interval
+		self._pending: dict[str, Key] = {}  # query id -> key
+		self._pending_lock = threading.Lock()
+
+	def _persist(
+		self, rq: RenderedQuery, key: Key, tag: str | None
+	) -> Query | Persisted:
+
+		# anything we select from has already been waited for, by its retrieval query's PreBuild hook.
+		sql, params, _param_names = rq
+
+		logger.debug(f"Submitting persist SQL:\n{sql}\nwith params: {params}")
+		c = self._con.cursor()
+		try:
+			with statement_timeout(self._con):
+				c.execute_async(sql, params)
+			if (qid := c.sfqid) is None:
+				raise RuntimeError("execute_async() didn't give us a query id")
 		finally:
 			c.close()
 
-		retrieve_sql = Q(f"""select * from table(result_scan('{qid}')""")
-		return retrieve_sql
+		with self._pending_lock:
+			self._pending[qid] = key
+
+		retrieve_sql = Q(f"""select * from table(result_scan('{qid}'))""")
+		return retrieve_sql._add_extensions(
+			PreBuild(functools.partial(self._wait, qid))
+		)
+
+	def _wait(self, qid: str) -> None:
+		with self._pending_lock:
+			if (key := self._pending.get(qid)) is None:
+				return
+
+		# honour any statement_timeout() we're being waited for in.
+		deadline = (_deadline.get() or (math.inf,))[0]
+		try:
+			while self._con.is_still_running(
+				self._con.get_query_status_throw_if_error(qid)
+			):
+				if (remaining := deadline - time.monotonic()) <= 0:
+					self._cancel(qid)
+					raise TimeoutError(f"Timed out waiting for Snowflake query {qid}")
+				time.sleep(min(self.poll_interval, remaining))
+		except Exception:
+			# don't hand out a broken result_scan() - the next build will run it again.
+			self._forget(key)
+			raise
+		finally:
+			with self._pending_lock:
+				self._pending.pop(qid, None)
+
+	def _cancel(self, qid: str) -> None:
+		c = self._con.cursor()
+		try:
+			c.execute(f"select system$cancel_query('{qid}')")
+		except Exception:
+			# it'll still be forgotten, and Snowflake's own timeout will get it eventually.
+			logger.warning(f"Couldn't cancel Snowflake query {qid}", exc_info=True)
+		finally:
+			c.close()
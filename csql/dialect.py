@@ -3,9 +3,11 @@
 # ruff: noqa: F401
 from ._.models.dialect import (
 	DefaultDialect,
+	Explain,
 	InferOrDefault,
 	Limit,
 	ParamStyle,
+	Sample,
 	SQLDialect,
 	SQLite,
 )
@@ -13,15 +15,30 @@ from ._.models.dialect import (
 DefaultDialect = DefaultDialect  # give sphinx a nudge  # noqa: PLW0127
 """The default dialect for ``csql``."""
 
-Snowflake = SQLDialect(paramstyle=ParamStyle.numeric, limit=Limit.limit)
+Snowflake = SQLDialect(
+	paramstyle=ParamStyle.numeric,
+	limit=Limit.limit,
+	sample=Sample.tablesample,
+	explain=Explain.snowflake,
+)
 """A dialect for Snowflake"""
 
-DuckDB = SQLDialect(paramstyle=ParamStyle.numeric_dollar, limit=Limit.limit)
+DuckDB = SQLDialect(
+	paramstyle=ParamStyle.numeric_dollar,
+	limit=Limit.limit,
+	sample=Sample.using_sample,
+	explain=Explain.duckdb,
+)
 """A dialect for DuckDB"""
 
 MSSQL = SQLDialect(paramstyle=ParamStyle.numeric, limit=Limit.top_n)
 """A dialect for MS SQL Server"""
 
-ClickHouse = SQLDialect(paramstyle=ParamStyle.clickhouse, limit=Limit.limit)
+ClickHouse = SQLDialect(
+	paramstyle=ParamStyle.clickhouse,
+	limit=Limit.limit,
+	sample=Sample.rand_canonical,
+	explain=Explain.clickhouse,
+)
 
 SQLite = SQLite  # noqa: PLW0127
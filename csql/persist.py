@@ -1,4 +1,17 @@
 # mypy: implicit-reexport
 # pyright: reportUnusedImport=false
 # ruff: noqa: F401
-from ._.persist import Cacher, Key
+from ._.persist import Cacher, Key, Persisted, set_budget
+from ._.persist.index import SQLiteKeyIndex
+from ._.persist.locks import FileLockBackend, LockBackend, ThreadLockBackend
+from ._.persist.plan import BuildPlan, Materialization
+from ._.persist.sources import Source
+from ._.persist.stats import (
+	PersistEvent,
+	PersistStats,
+	add_stats_callback,
+	remove_stats_callback,
+	reset_stats,
+	stats,
+)
+from ._.persist.usage import QueryUsage, UsageTracker
@@ -0,0 +1,177 @@
+# pyarrow is untyped.
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
+
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from csql import Q
+
+pa = pytest.importorskip("pyarrow")
+duckdb = pytest.importorskip("duckdb")
+
+from csql.contrib.persist.arrow import ParquetCacher
+
+
+def test_parquet_cacher(tmp_path: Path):
+	con = duckdb.connect()
+	cache = ParquetCacher(con, tmp_path)
+
+	q1 = Q("select range as val from range(5)").persist(cache, "parquet")
+	q2 = Q(f"select sum(val) from {q1}")
+
+	assert "read_parquet" in q2.build().sql
+	assert con.execute(*q2.db).fetchall() == [(10,)]
+	[file] = os.listdir(tmp_path)
+	assert file.startswith("csql_cache_parquet_")
+
+
+def test_parquet_cacher_arrow_ipc(tmp_path: Path):
+	import sqlite3
+
+	chdb = pytest.importorskip("chdb")
+
+	with pytest.raises(ValueError, match="reader"):
+		ParquetCacher(duckdb.connect(), tmp_path, format="arrow")
+
+	with sqlite3.connect(":memory:") as con:
+		cache = ParquetCacher(
+			con, tmp_path, format="arrow", reader="file('{path}', Arrow)"
+		)
+		q = Q("select 1 as a, 'x' as b union all select 2, 'y'").persist(cache)
+		rq = Q(f"select * from {q} order by a").build()
+
+	[file] = os.listdir(tmp_path)
+	with pa.memory_map(str(tmp_path / file)) as f:
+		table = pa.ipc.open_file(f).read_all()
+	assert table.to_pylist() == [{"a": 1, "b": "x"}, {"a": 2, "b": "y"}]
+	result = json.loads(str(chdb.query(rq.sql, "JSONCompact")))
+	assert result["data"] == [[1, "x"], [2, "y"]]
+
+
+def test_parquet_cacher_eviction(tmp_path: Path):
+	from csql._.persist import KL
+
+	con = duckdb.connect()
+	cache = ParquetCacher(con, tmp_path, max_bytes=1)
+
+	q1 = Q("select 'evict me' as val").persist(cache, "evicted")
+	q2 = Q("select 'keep me' as val").persist(cache, "kept")
+
+	q1_sql = q1.build().sql
+	q2.build()
+
+	assert [f.split("_")[2] for f in os.listdir(tmp_path)] == ["kept"]
+	assert q1_sql not in [str(v.build().sql) for v in KL.saved.values()]
+	assert con.execute(*Q(f"select * from {q1}").db).fetchall() == [("evict me",)]
+
+	# a file whose key somebody holds the lock for isn't evicted.
+	[file] = os.listdir(tmp_path)
+	with KL.lock_backend.lock(os.path.splitext(file)[0].rsplit("_", 1)[-1]):
+		q2.build()
+	assert sorted(f.split("_")[2] for f in os.listdir(tmp_path)) == ["evicted", "kept"]
+
+
+def test_duckdb_arrow_cacher():
+	from csql.contrib.persist.arrow import DuckDBArrowCacher
+
+	con = duckdb.connect()
+	cache = DuckDBArrowCacher(con)
+
+	q1 = Q("select range as val from range(4)").persist(cache, "in_memory")
+	q2 = Q(f"select sum(val) from {q1}")
+
+	assert '"csql_cache_in_memory_' in q2.build().sql
+	assert con.execute(*q2.db).fetchall() == [(6,)]
+
+
+def test_duckdb_arrow_cacher_eviction():
+	from csql.contrib.persist.arrow import DuckDBArrowCacher
+
+	con = duckdb.connect()
+	cache = DuckDBArrowCacher(con, max_bytes=1)
+
+	q1 = Q("select 'evict me too' as val").persist(cache, "evicted")
+	q2 = Q("select 'keep me too' as val").persist(cache, "kept")
+
+	q1_sql = q1.build().sql
+	q2.build()
+
+	views = con.execute("select view_name from duckdb_views() where not internal")
+	assert [v for (v,) in views.fetchall() if v.startswith("csql_cache")] == [
+		next(name for name, _size in cache._views.values())
+	]
+	with pytest.raises(duckdb.CatalogException):
+		con.execute(q1_sql)
+	assert con.execute(*Q(f"select * from {q1}").db).fetchall() == [("evict me too",)]
+
+	# a view whose key somebody holds the lock for isn't evicted.
+	from csql._.persist import KL
+
+	[held] = cache._views
+	with KL.lock_backend.lock(held):
+		q2.build()
+	assert len(cache._views) == 2
+
+
+def test_parquet_cacher_probe(tmp_path: Path):
+	con = duckdb.connect()
+	cache = ParquetCacher(con, tmp_path, probe_interval=0)
+
+	q1 = Q("select 7 as probed").persist(cache, "parquet-probe")
+	q2 = Q(f"select probed from {q1}")
+	assert con.execute(*q2.db).fetchall() == [(7,)]
+
+	[file] = os.listdir(tmp_path)
+	os.remove(tmp_path / file)
+
+	assert con.execute(*q2.db).fetchall() == [(7,)]
+	assert cache.stale_hits == 1
+
+
+def test_persist_budget():
+	from csql.contrib.persist.arrow import DuckDBArrowCacher
+	from csql.persist import (
+		PersistEvent,
+		add_stats_callback,
+		remove_stats_callback,
+		set_budget,
+	)
+
+	con = duckdb.connect()
+	cache = DuckDBArrowCacher(con)
+	events: list[PersistEvent] = []
+	queries = [
+		Q(f"select range as budget_{i} from range(10)").persist(cache, "budget")
+		for i in range(3)
+	]
+
+	set_budget(max_rows=25)
+	add_stats_callback(events.append)
+	try:
+		for q in queries:
+			q.build()
+		assert [e.rows for e in events] == [10, 10, 10]
+		assert len(cache._views) == 2  # the first one was dropped
+
+		queries[1].build()  # now the most recently used
+		queries[0].build()  # so this drops queries[2]
+		assert [e.outcome for e in events[3:]] == ["hit", "miss"]
+		assert con.execute(*Q(f"select count(*) from {queries[0]}").db).fetchall() == [
+			(10,)
+		]
+		assert len(cache._views) == 2
+
+		# a key somebody holds the lock for isn't dropped, even if it's the oldest.
+		from csql._.persist import KL
+
+		oldest, newest = cache._views
+		with KL.lock_backend.lock(oldest):
+			queries[2].build()
+		assert oldest in cache._views
+		assert newest not in cache._views
+	finally:
+		set_budget()
+		remove_stats_callback(events.append)
@@ -0,0 +1,65 @@
+import json
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+import csql.dialect
+from csql import Parameters, Q
+from csql.contrib.persist.clickhouse import ClickHouseCacher
+
+chdb_session = pytest.importorskip("chdb.session")
+
+
+class ChdbClient:
+	"""A stand-in for a clickhouse_connect Client, backed by chdb."""
+
+	def __init__(self):
+		self.session = chdb_session.Session()
+		self.commands: list[str] = []
+
+	def command(self, cmd: str, parameters: dict[str, Any] | None = None) -> int:
+		self.commands.append(cmd)
+		result = self.session.query(cmd, "TSV", params=parameters or {})
+		return int(str(result).strip() or 0)
+
+	def query(
+		self, query: str, parameters: dict[str, Any] | None = None
+	) -> SimpleNamespace:
+		result = self.session.query(query, "JSONCompact", params=parameters or {})
+		return SimpleNamespace(result_rows=json.loads(str(result))["data"])
+
+
+def test_clickhouse_cacher():
+	client = ChdbClient()
+	cache = ClickHouseCacher(client, engine="MergeTree order by tuple()")
+
+	p = Parameters(n=5)
+	q1 = Q(
+		f"select number as val from numbers({p.n:UInt64})",
+		dialect=csql.dialect.ClickHouse,
+	).persist(cache, "ch")
+	q2 = Q(f"select sum(val) as total from {q1}")
+
+	assert "`csql_cache_ch_" in q2.build().sql
+	assert client.query(**q2.ch).result_rows == [[10]]
+	assert "engine = MergeTree order by tuple()" in client.commands[0]
+	assert cache._probe(Q(q1.build().sql))
+
+
+def test_clickhouse_cacher_cleanup():
+	client = ChdbClient()
+	cache = ClickHouseCacher(client, ttl=60)
+
+	q1 = Q("select 'old' as val", dialect=csql.dialect.ClickHouse).persist(cache)
+	old_table = q1.build().sql.removeprefix("select * from ")
+	assert client.command(f"exists table {old_table}") == 1
+
+	assert cache.cleanup() == []
+
+	cache.ttl = 0
+	time.sleep(0.01)
+	assert old_table.strip("`") in cache.cleanup()
+	assert client.command(f"exists table {old_table}") == 0
+	assert not cache._probe(Q(f"select * from {old_table}"))
@@ -0,0 +1,152 @@
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
+
+import pytest
+
+from csql import Q
+from csql.adapters import statement_timeout
+from csql.contrib.persist.snowflake import SnowflakeAsyncResultSetCacher
+
+if TYPE_CHECKING:
+	import snowflake.connector
+
+
+class FakeSnowflake:
+	"""Just enough of a snowflake connection to pretend every query takes `latency` seconds."""
+
+	def __init__(self, latency: float, fail: bool = False):
+		self.latency = latency
+		self.fail = fail
+		self.submitted: list[str] = []
+		self.events: list[tuple[str, str]] = []  # (started|finished, qid), in order
+		self.executed: list[str] = []
+		self._done: dict[str, threading.Event] = {}
+		self._running: dict[str, threading.Timer] = {}
+
+	def cursor(self) -> "FakeCursor":
+		return FakeCursor(self)
+
+	def get_query_status_throw_if_error(self, qid: str) -> bool:
+		if self._done[qid].is_set() and self.fail:
+			raise RuntimeError(f"{qid} failed")
+		return self._done[qid].is_set()
+
+	def is_still_running(self, done: bool) -> bool:
+		return not done
+
+
+class FakeCursor:
+	def __init__(self, con: FakeSnowflake):
+		self.con = con
+		self.sfqid: str | None = None
+
+	def execute_async(self, sql: str, params: Any) -> None:
+		qid = f"qid-{len(self.con.submitted)}"
+		done = self.con._done[qid] = threading.Event()
+		self.con.submitted.append(sql)
+		self.con.events.append(("started", qid))
+
+		def finish() -> None:
+			self.con.events.append(("finished", qid))
+			done.set()
+
+		timer = self.con._running[qid] = threading.Timer(self.con.latency, finish)
+		timer.daemon = True
+		timer.start()
+		self.sfqid = qid
+
+	def execute(self, sql: str) -> None:
+		self.con.executed.append(sql)
+		if match := re.fullmatch(r"select system\$cancel_query\('(.*)'\)", sql):
+			self.con._running[match[1]].cancel()
+
+	def close(self) -> None:
+		pass
+
+
+def _connection(fake: FakeSnowflake) -> "snowflake.connector.SnowflakeConnection":
+	return cast("snowflake.connector.SnowflakeConnection", fake)
+
+
+def test_snowflake_async():
+	con = FakeSnowflake(latency=0.2)
+	cache = SnowflakeAsyncResultSetCacher(_connection(con), poll_interval=0.01)
+
+	a = Q("select 'async a' as val").persist(cache, "a")
+	b = Q("select 'async b' as val").persist(cache, "b")
+	c = Q(f"select * from {a} union all select * from {b}").persist(cache, "c")
+
+	built = Q(f"select count(*) from {c}").build()
+
+	[_, _, c_sql] = con.submitted
+	order = con.events.index
+	assert order(("started", "qid-1")) < order((
+		"finished",
+		"qid-0",
+	))  # b didn't wait for a
+	assert order(("started", "qid-2")) > order(("finished", "qid-0"))  # c waited for a
+	assert order(("started", "qid-2")) > order(("finished", "qid-1"))  # and b
+	assert ("finished", "qid-2") in con.events  # build() waited for c
+	assert "result_scan('qid-0')" in c_sql
+	assert "result_scan('qid-1')" in c_sql
+	assert "result_scan('qid-2')" in built.sql
+
+
+def test_snowflake_async_index(tmp_path: Path):
+	from csql.persist import SQLiteKeyIndex
+
+	con = FakeSnowflake(latency=0.2)
+	index = SQLiteKeyIndex(tmp_path / "keys.db")
+	cache = SnowflakeAsyncResultSetCacher(
+		_connection(con), index=index, poll_interval=0.01
+	)
+
+	a = Q("select 'indexed a' as val").persist(cache, "a")
+	b = Q("select 'indexed b' as val").persist(cache, "b")
+	Q(f"select * from {a} union all select * from {b}").build()
+
+	order = con.events.index
+	assert order(("started", "qid-1")) < order(("finished", "qid-0"))  # still parallel
+	with sqlite3.connect(index.path) as index_con:
+		indexed = index_con.execute("select retrieval_sql from csql_keys").fetchall()
+	assert sorted(indexed) == [
+		("select * from table(result_scan('qid-0'))",),
+		("select * from table(result_scan('qid-1'))",),
+	]
+
+
+def test_snowflake_async_failure():
+	con = FakeSnowflake(latency=0.01, fail=True)
+	cache = SnowflakeAsyncResultSetCacher(_connection(con), poll_interval=0.01)
+
+	q = Q("select 'async fail' as val").persist(cache)
+	with pytest.raises(RuntimeError, match="qid-0 failed"):
+		q.build()
+
+	# it's been forgotten, so it gets submitted again
+	with pytest.raises(RuntimeError, match="qid-1 failed"):
+		q.build()
+
+
+def test_snowflake_async_timeout():
+	con = FakeSnowflake(latency=10)
+	cache = SnowflakeAsyncResultSetCacher(_connection(con), poll_interval=0.01)
+
+	q = Q("select 'async slow' as val").persist(cache)
+	with (
+		pytest.raises(TimeoutError, match="qid-0"),
+		statement_timeout(sqlite3.connect(":memory:"), 0.1),
+	):
+		q.build()
+	assert con.executed == ["select system$cancel_query('qid-0')"]
+	assert ("finished", "qid-0") not in con.events
+
+	# it's been forgotten, so it gets submitted again
+	with (
+		pytest.raises(TimeoutError, match="qid-1"),
+		statement_timeout(sqlite3.connect(":memory:"), 0.1),
+	):
+		q.build()
@@ -223,3 +223,60 @@ select count(*) from _subQuery0""",
 		parameters=(),
 		parameter_names=(),
 	)
+
+
+def test_sample_query():
+	import csql.dialect
+	from csql._.utils import limit_query
+
+	leaf = Q("select * from events", dialect=csql.dialect.DuckDB)
+	agg = Q(f"select user, count(*) as n from {leaf} group by user")
+	sampled = limit_query(agg, 10, sample=1.5)
+	assert sampled.build().sql == (
+		"""\
+with
+_subQuery0 as (
+	select * from events
+),
+_subQuery1 as (
+	select * from _subQuery0 using sample 1.5% (bernoulli)
+),
+_subQuery2 as (
+	select user, count(*) as n from _subQuery1 group by user
+)
+select * from _subQuery2 limit 10"""
+	)
+
+	# a query with nothing underneath it can't be sampled any earlier than limiting it.
+	assert (
+		limit_query(leaf, 10, sample=1.5).build().sql
+		== limit_query(leaf, 10).build().sql
+	)
+
+	assert (
+		limit_query(agg, 10, csql.dialect.ClickHouse, sample=10)
+		.build()
+		.sql.count("where randCanonical() < 0.1")
+		== 1
+	)
+	# no sampling for dialects that can't.
+	assert (
+		limit_query(agg, 10, csql.dialect.SQLite, sample=10).build().sql
+		== limit_query(agg, 10, csql.dialect.SQLite).build().sql
+	)
+
+	with pytest.raises(ValueError, match="percentage"):
+		limit_query(agg, 10, sample=0)
+
+
+def test_preview_sample():
+	duckdb = pytest.importorskip("duckdb")
+	import csql.dialect
+
+	con = duckdb.connect()
+	leaf = Q("select range as v from range(100000)", dialect=csql.dialect.DuckDB)
+	q = Q(f"select count(*) as n from {leaf}")
+	assert q.preview_pd(con).values.tolist() == [[100000]]
+	[[n]] = q.preview_pd(con, sample=1).values.tolist()
+	assert 500 < n < 1500
+	assert q.preview_pl(con, sample=1)["n"].to_list()[0] < 1500
@@ -0,0 +1,69 @@
+import sqlite3
+from typing import Any
+
+import pytest
+
+import csql.adapters
+from csql import Q, RenderedQuery
+
+
+@pytest.fixture
+def registry(monkeypatch: pytest.MonkeyPatch) -> None:
+	"""Put the adapter registry back how it was after the test."""
+	from csql._ import execution
+
+	monkeypatch.setattr(execution, "_adapters", dict(execution._adapters))
+	monkeypatch.setattr(execution, "_resolved", {})
+
+
+class MyConnection(sqlite3.Connection):
+	pass
+
+
+class MySubConnection(MyConnection):
+	pass
+
+
+def test_default_adapter():
+	with sqlite3.connect(":memory:") as con:
+		adapter = csql.adapters.adapter_for(con)
+		assert type(adapter) is csql.adapters.Adapter
+		assert csql.adapters.adapter_for(con) is adapter
+
+
+def test_builtin_adapters():
+	duckdb = pytest.importorskip("duckdb")
+	adapter = csql.adapters.adapter_for(duckdb.connect())
+	assert isinstance(adapter, csql.adapters.DuckDBAdapter)
+
+
+@pytest.mark.usefixtures("registry")
+def test_register_adapter():
+	calls: list[str] = []
+
+	class MyAdapter(csql.adapters.Adapter):
+		def to_pandas(self, rq: RenderedQuery, con: Any) -> Any:
+			calls.append(rq.sql)
+			return super().to_pandas(rq, con)
+
+	q = Q("select 1 as v")
+	with sqlite3.connect(":memory:", factory=MySubConnection) as con:
+		assert q.preview_pd(con).values.tolist() == [[1]]
+		assert calls == []
+
+		# registering clears anything already resolved, and subclasses pick it up.
+		csql.adapters.register_adapter(f"{__name__}.MyConnection", MyAdapter())
+		assert q.preview_pd(con).values.tolist() == [[1]]
+		assert len(calls) == 1
+
+		# the closest class wins.
+		sub_adapter = csql.adapters.Adapter()
+		csql.adapters.register_adapter(MySubConnection, sub_adapter)
+		assert csql.adapters.adapter_for(con) is sub_adapter
+		q.preview_pd(con)
+		assert len(calls) == 1
+
+
+def test_register_adapter_restored():
+	with sqlite3.connect(":memory:", factory=MySubConnection) as con:
+		assert type(csql.adapters.adapter_for(con)) is csql.adapters.Adapter
@@ -0,0 +1,102 @@
+import json
+import sqlite3
+
+import pytest
+
+import csql.dialect
+from csql import Parameters, Q
+from csql._.explain import parse_plan
+from csql.dialect import Explain
+
+
+def test_explain_sqlite():
+	with sqlite3.connect(":memory:") as con:
+		con.execute("create table e(id integer primary key, v int)")
+		p = Parameters(id=5)
+		q = Q(f"select * from e where id = {p.id}", dialect=csql.dialect.SQLite)
+
+		plan = q.explain(con)
+		assert plan.operation == "QUERY PLAN"
+		[search] = plan.children
+		assert search.operation == "SEARCH"
+		assert "PRIMARY KEY" in search.detail
+
+		q2 = Q(f"select * from {q} union all select * from e where v > 1")
+		assert [n.operation for n in q2.explain(con).walk()].count("SCAN") == 1
+		assert "  SEARCH" in str(q2.explain(con))
+
+		with pytest.raises(ValueError, match="analyzed"):
+			q.explain(con, analyze=True)
+		with pytest.raises(ValueError, match="explain"):
+			q.explain(con, dialect=csql.dialect.DefaultDialect)
+
+
+def test_explain_duckdb():
+	duckdb = pytest.importorskip("duckdb")
+	con = duckdb.connect()
+	con.execute("create table t as select range as a from range(1000)")
+	p = Parameters(x=5)
+	q = Q(
+		f"select a, count(*) from t where a > {p.x} group by a",
+		dialect=csql.dialect.DuckDB,
+	)
+
+	plan = q.explain(con)
+	scans = [n for n in plan.walk() if "SCAN" in n.operation]
+	assert len(scans) == 1
+	assert scans[0].estimated_rows is not None
+	assert scans[0].actual_rows is None
+
+	analyzed = q.explain(con, analyze=True)
+	assert analyzed.actual_rows == 994
+	assert all(n.seconds is not None for n in analyzed.walk())
+
+
+def test_parse_plan_snowflake():
+	plan = parse_plan(
+		Explain.snowflake,
+		[
+			(
+				json.dumps({
+					"GlobalStats": {"partitionsTotal": 10, "partitionsAssigned": 10},
+					"Operations": [
+						[
+							{"id": 0, "operation": "Result", "expressions": ["T.A"]},
+							{
+								"id": 1,
+								"parentOperators": [0],
+								"operation": "TableScan",
+								"objects": ["DB.S.T"],
+								"partitionsAssigned": 10,
+							},
+						]
+					],
+				}),
+			)
+		],
+	)
+	assert plan.operation == "Result"
+	[scan] = plan.children
+	assert scan.operation == "TableScan"
+	assert scan.detail == "objects: DB.S.T; partitionsAssigned: 10"
+
+
+def test_parse_plan_clickhouse():
+	plan = parse_plan(
+		Explain.clickhouse,
+		[
+			(
+				json.dumps([
+					{
+						"Plan": {
+							"Node Type": "Expression",
+							"Description": "Project names",
+							"Plans": [{"Node Type": "ReadFromMergeTree"}],
+						}
+					}
+				]),
+			)
+		],
+	)
+	assert [n.operation for n in plan.walk()] == ["Expression", "ReadFromMergeTree"]
+	assert plan.detail == "Description: Project names"
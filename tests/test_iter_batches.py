@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+import csql.dialect
+from csql import Parameters, Q
+
+
+def test_iter_batches_dbapi():
+	with sqlite3.connect(":memory:") as con:
+		p = Parameters(n=5)
+		q = Q(
+			f"""
+			with recursive t(v) as (select 1 union all select v + 1 from t where v < {p.n})
+			select v from t
+			""",
+			dialect=csql.dialect.SQLite,
+		)
+
+		assert list(q.iter_batches(con, batch_size=2)) == [
+			[(1,), (2,)],
+			[(3,), (4,)],
+			[(5,)],
+		]
+		assert list(q.iter_batches(con, batch_size=10, newParams={"n": 3})) == [
+			[(1,), (2,), (3,)]
+		]
+
+		[df1, df2] = q.iter_batches(con, batch_size=3, format="pandas")
+		assert list(df1.columns) == ["v"]
+		assert df2["v"].tolist() == [4, 5]
+
+		[pl1, _pl2] = q.iter_batches(con, batch_size=3, format="polars")
+		assert pl1["v"].to_list() == [1, 2, 3]
+
+		pytest.importorskip("pyarrow")
+		batches = list(q.iter_batches(con, batch_size=4, format="arrow"))
+		assert [b.num_rows for b in batches] == [4, 1]
+		assert batches[0].schema.names == ["v"]
+
+
+def test_iter_batches_bad_args():
+	q = Q("select 1")
+	with pytest.raises(ValueError):
+		q.iter_batches(None, batch_size=0)
+	with pytest.raises(ValueError):
+		q.iter_batches(None, format="csv")  # type: ignore[arg-type]
+
+
+def test_iter_batches_duckdb():
+	duckdb = pytest.importorskip("duckdb")
+	pytest.importorskip("pyarrow")
+
+	con = duckdb.connect()
+	con.execute("create temp table batches as select range as v from range(10)")
+	q = Q("select v from batches order by v")
+
+	assert [len(b) for b in q.iter_batches(con, batch_size=4)] == [4, 4, 2]
+	batches = list(q.iter_batches(con, batch_size=4, format="arrow"))
+	assert sum(b.num_rows for b in batches) == 10
+	assert all(b.num_rows <= 4 for b in batches)
+	assert [
+		v for df in q.iter_batches(con, batch_size=4, format="polars") for v in df["v"]
+	] == list(range(10))
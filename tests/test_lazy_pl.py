@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+import csql.dialect
+from csql import Parameters, Q
+
+pl = pytest.importorskip("polars")
+pytest.importorskip("polars.io.plugins")
+
+
+def test_pushdown_query():
+	from csql._.lazy import pushdown_query
+
+	q = Q("select * from events")
+	predicate = ((pl.col("a") > 10) & pl.col("s").str.contains("x")) | pl.col(
+		"b"
+	).is_null()
+
+	rq = pushdown_query(q, ["c"], predicate, 5, None).build()
+	assert rq.sql.endswith(
+		"""\
+_subQuery1 as (
+	select * from _subQuery0 limit 5
+)
+select "c", "a", "s", "b" from _subQuery1 where ((("a" > :1)) or ("b" is null))"""
+	)
+	assert rq.parameters == (10,)
+
+	# only casts that keep every value are pushed down
+	schema = {"a": pl.Int32, "f": pl.Float64}
+	predicate = (pl.col("a").cast(pl.Int64) > 1) & (pl.col("f").cast(pl.Int64) > 1)
+	rq = pushdown_query(q, None, predicate, None, None, schema).build()
+	assert rq.sql.endswith('select * from _subQuery0 where (("a" > :1))')
+	rq = pushdown_query(
+		q, None, pl.col("a").cast(pl.Int8) > 1, None, None, schema
+	).build()
+	assert rq.sql.endswith("select * from _subQuery0")
+
+	# nothing we can translate
+	rq = pushdown_query(q, None, pl.col("s").str.contains("x"), None, None).build()
+	assert rq.sql.endswith("select * from _subQuery0")
+
+
+def test_lazy_pl_duckdb():
+	duckdb = pytest.importorskip("duckdb")
+	con = duckdb.connect()
+	p = Parameters(n=100)
+	q = Q(
+		f"select range as a, range * 2 as b, 'x' || range as s from range({p.n})",
+		dialect=csql.dialect.DuckDB,
+	)
+
+	lf = q.lazy_pl(con)
+	assert lf.collect_schema() == pl.Schema({
+		"a": pl.Int64,
+		"b": pl.Int64,
+		"s": pl.String,
+	})
+	assert lf.filter((pl.col("a") >= 10) & pl.col("s").str.ends_with("5")).select(
+		"b"
+	).head(3).collect()["b"].to_list() == [30, 50, 70]
+	assert q.lazy_pl(con, newParams={"n": 3}).collect()["a"].to_list() == [0, 1, 2]
+	assert lf.head(2).collect().shape == (2, 3)
+	# head before filter takes the first rows, then filters them
+	assert lf.head(5).filter(pl.col("a") >= 3).collect()["a"].to_list() == [3, 4]
+	# truncating casts aren't pushed down
+	halves = Q(
+		"select range as a, range / 2 as h from range(10)", dialect=csql.dialect.DuckDB
+	)
+	assert halves.lazy_pl(con).filter(pl.col("h").cast(pl.Int64) == 1).collect()[
+		"a"
+	].to_list() == [2, 3]
+
+
+def test_lazy_pl_dbapi():
+	# polars collects on its own threads.
+	with sqlite3.connect(":memory:", check_same_thread=False) as con:
+		con.execute("create table t(a int, s text)")
+		con.executemany("insert into t values (?, ?)", [(1, "x"), (2, None), (3, "z")])
+		q = Q("select * from t", dialect=csql.dialect.SQLite)
+		lf = q.lazy_pl(con, schema={"a": pl.Int64, "s": pl.String})
+		assert lf.filter(
+			pl.col("s").is_not_null() & (pl.col("a") != 1)
+		).collect().to_dicts() == [{"a": 3, "s": "z"}]
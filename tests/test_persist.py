@@ -1,10 +1,15 @@
 import re
 import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
 from unittest.mock import Mock
 
+import pytest
+
 import csql.dialect
-from csql import Parameters, Q, Query
-from csql.contrib.persist import Key, TempTableCacher
+from csql import Parameters, Q, Query, RenderedQuery
+from csql.contrib.persist import Cacher, Key, TempTableCacher
 
 
 def test_persist_simple():
@@ -112,3 +117,431 @@ def test_persist_chained():
 		pprint(hooked_saves)
 
 		assert "q1" not in hooked_saves["q3"].sql
+
+
+def test_persist_index(tmp_path: Path):
+	from csql import RenderedQuery
+	from csql._.persist import KL
+	from csql.persist import SQLiteKeyIndex
+
+	persisted: list[Key] = []
+
+	class TableCacher(TempTableCacher):
+		def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
+			persisted.append(key)
+			self._con.execute(f"create table if not exists t_{key} as {rq.sql}")
+			return Q(f"select * from t_{key}")
+
+	with sqlite3.connect(tmp_path / "db.sqlite") as con:
+		index = SQLiteKeyIndex(tmp_path / "index.sqlite")
+		q = Q("select 'indexed' as val").persist(TableCacher(con, index=index))
+
+		q.build()
+		assert len(persisted) == 1
+
+		# simulate a new process
+		KL.saved.clear()
+		assert con.execute(*q.db).fetchall() == [("indexed",)]
+		assert len(persisted) == 1
+
+		# the table has gone away, so the index entry is stale
+		KL.saved.clear()
+		con.execute(f"drop table t_{persisted[0]}")
+		assert con.execute(*q.db).fetchall() == [("indexed",)]
+		assert len(persisted) == 2
+
+
+def test_persist_index_expiry(tmp_path: Path):
+	from csql.persist import SQLiteKeyIndex
+
+	index = SQLiteKeyIndex(tmp_path / "index.sqlite", ttl=-1)
+	index.put("k", Q("select * from t"))
+	assert index.get("k") is None
+
+	index = SQLiteKeyIndex(tmp_path / "index.sqlite")
+	index.put("k", Q("select * from t"))
+	assert index.get("k") == Q("select * from t")
+
+
+def test_persist_file_lock(tmp_path: Path):
+	import threading
+	import time
+
+	from csql.persist import FileLockBackend
+
+	# separate backends don't share thread locks, so they behave like separate processes.
+	a = FileLockBackend(tmp_path)
+	b = FileLockBackend(tmp_path)
+	events: list[str] = []
+
+	def wait_for_lock() -> None:
+		with b.lock("k"):
+			events.append("b")
+
+	with a.lock("k"):
+		t = threading.Thread(target=wait_for_lock)
+		t.start()
+		time.sleep(0.1)
+		events.append("a")
+	t.join()
+
+	assert events == ["a", "b"]
+
+	with a.lock("k"), b.lock("other key"):
+		pass
+
+
+def test_persist_plan():
+	from csql import RenderedQuery
+
+	class UnpredictableCacher(TempTableCacher):
+		def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
+			super()._persist(rq, key, tag)
+			return Q(f"select * from {self._table_name(key, tag)}")
+
+		def _retrieval(self, key: Key, tag: str | None) -> None:  # type: ignore[override]
+			return None
+
+	con = Mock()
+	predictable = TempTableCacher(con)
+	unpredictable = UnpredictableCacher(con)
+
+	q1 = Q("select 'planned 1' as val").persist(predictable, "q1")
+	q2 = Q(f"select val || ' and 2' as val from {q1}").persist(unpredictable, "q2")
+	q3 = Q(f"select count(*) from {q2}")
+
+	plan = q3.plan()
+
+	con.cursor.assert_not_called()
+	assert [m.tag for m in plan.materializations] == ["q1", "q2"]
+	assert 'select * from "csql_cache_q1_' in plan.materializations[1].rq.sql
+	assert "' and 2'" in plan.rendered.sql  # q2 can't be predicted, so it's inlined
+	assert '"csql_cache_q1_' in plan.rendered.sql
+	assert isinstance(plan.rendered, RenderedQuery)
+
+	built = plan.materialize()
+	assert con.cursor.call_count == 2
+	assert built == q3.build()
+	assert q3.plan().materializations == ()
+
+
+def test_persist_pooled():
+	from csql.contrib.persist import PooledTempTableCacher
+
+	cache = PooledTempTableCacher()
+	q1 = Q("select 21 as pooled_val").persist(cache, "pooled")
+	q2 = Q(f"select pooled_val * 2 as v2 from {q1}").persist(cache, "pooled2")
+	q3 = Q(f"select v2 + 1 from {q2}")
+
+	with pytest.raises(RuntimeError):
+		q3.build()
+
+	con1 = sqlite3.connect(":memory:")
+	con2 = sqlite3.connect(":memory:")
+	with cache.using(con1):
+		assert con1.execute(*q3.db).fetchall() == [(43,)]
+		assert con1.execute(*q3.db).fetchall() == [(43,)]
+	assert cache.rematerializations == 0
+
+	with cache.using(con2):
+		# both tables need re-creating on con2, upstream first.
+		assert con2.execute(*q3.db).fetchall() == [(43,)]
+	assert cache.rematerializations == 2
+
+	cache.release(con1)
+	with cache.using(con1):
+		con1.execute(*q3.db)
+	assert cache.rematerializations == 4
+
+
+def test_persist_probe_interval():
+
+	with sqlite3.connect(":memory:") as con:
+		c = TempTableCacher(con, probe_interval=0)
+		q1 = Q("select 1 as probed").persist(c, "probed")
+		q2 = Q(f"select probed from {q1}")
+
+		assert con.execute(*q2.db).fetchall() == [(1,)]
+		assert con.execute(*q2.db).fetchall() == [(1,)]
+		assert c.stale_hits == 0
+
+		[(table,)] = con.execute(
+			"select name from sqlite_temp_master where name like 'csql_cache_probed_%'"
+		).fetchall()
+		con.execute(f'drop table "{table}"')
+
+		assert con.execute(*q2.db).fetchall() == [(1,)]
+		assert c.stale_hits == 1
+
+	# a closed connection can't have anything in it.
+	con.close()
+	assert not c._probe(Q("select 1"))
+
+
+class AbortingConnection:
+	"""Wraps sqlite, but like psycopg outside autocommit, an error aborts the transaction."""
+
+	def __init__(self) -> None:
+		self.con = sqlite3.connect(":memory:")
+		self.aborted = False
+
+	def cursor(self) -> "AbortingConnection":
+		return self
+
+	def execute(self, sql: str, params: Any = ()) -> sqlite3.Cursor:
+		if self.aborted and not sql.startswith("rollback"):
+			raise sqlite3.OperationalError("current transaction is aborted")
+		try:
+			result = self.con.execute(sql, params)
+		except sqlite3.Error:
+			self.aborted = True
+			raise
+		if sql.startswith("rollback"):
+			self.aborted = False
+		return result
+
+	def close(self) -> None:
+		pass
+
+
+def test_persist_probe_aborted_transaction():
+	con = AbortingConnection()
+	c = TempTableCacher(con, probe_interval=0)
+	q1 = Q("select 1 as probed").persist(c, "aborted")
+	q2 = Q(f"select probed from {q1}")
+
+	assert con.execute(*q2.db).fetchall() == [(1,)]
+	[(table,)] = con.execute(
+		"select name from sqlite_temp_master where name like 'csql_cache_aborted_%'"
+	).fetchall()
+	con.execute(f'drop table "{table}"')
+
+	# the failed probe doesn't leave the connection unusable for re-creating it.
+	assert con.execute(*q2.db).fetchall() == [(1,)]
+	assert c.stale_hits == 1
+	assert not con.aborted
+
+
+def test_persist_incremental():
+	from csql.contrib.persist import IncrementalTempTableCacher
+
+	with sqlite3.connect(":memory:") as con:
+		scanned: list[int] = []
+
+		def scan(day: int) -> int:
+			scanned.append(day)
+			return day
+
+		con.create_function("scan", 1, scan)
+		con.execute("create table events(day)")
+		con.executemany("insert into events values (?)", [(d,) for d in range(10)])
+		c = IncrementalTempTableCacher(con, column="day")
+
+		p = Parameters(start=2, end=5)
+		q1 = Q(
+			f"select scan(day) as day from events where day >= {p.start} and day < {p.end}",
+			dialect=csql.dialect.SQLite,
+		).persist(c, "incremental")
+		q2 = Q(f"select day from {q1} order by day")
+
+		assert con.execute(*q2.db).fetchall() == [(2,), (3,), (4,)]
+		assert scanned == [2, 3, 4]
+
+		scanned.clear()
+		rq = q2.build(newParams={"start": 0, "end": 7})
+		assert con.execute(*rq.db).fetchall() == [(d,) for d in range(7)]
+		assert sorted(scanned) == [0, 1, 5, 6]
+
+		scanned.clear()
+		rq = q2.build(newParams={"start": 3, "end": 6})
+		assert con.execute(*rq.db).fetchall() == [(3,), (4,), (5,)]
+		assert scanned == []
+
+
+def test_persist_depends_on():
+	from csql.persist import Source
+
+	with sqlite3.connect(":memory:") as con:
+		con.execute("create table src(v)")
+		con.execute("insert into src values (1)")
+		c = TempTableCacher(con)
+
+		versions: list[int] = []
+
+		def version() -> int:
+			versions.append(1)
+			return con.execute("select max(v) from src").fetchone()[0]
+
+		src = Source(version, ttl=0)
+		q1 = Q("select max(v) as depends_v from src").depends_on(src)
+		q2 = Q(f"select depends_v from {q1}").persist(c, "depends")
+		q3 = Q(f"select depends_v * 10 from {q2}").persist(c, "depends_downstream")
+
+		assert con.execute(*q3.db).fetchall() == [(10,)]
+		assert con.execute(*q3.db).fetchall() == [(10,)]
+
+		con.execute("insert into src values (2)")
+		assert con.execute(*q3.db).fetchall() == [(20,)]
+
+		src.ttl = 60
+		calls = len(versions)
+		con.execute("insert into src values (3)")
+		assert con.execute(*q3.db).fetchall() == [(20,)]  # within the ttl
+		assert len(versions) == calls
+
+		assert len(q1.depends_on(Source(lambda: 1)).depends_on(src)._extensions) == 1
+
+
+def test_persist_warm():
+	import threading
+	import time
+	from concurrent.futures import ThreadPoolExecutor
+
+	import csql
+	from csql import RenderedQuery
+	from csql.persist import Cacher
+
+	class SlowCacher(Cacher):
+		def __init__(self) -> None:
+			self.persisted: list[str | None] = []
+			self.lock = threading.Lock()
+
+		def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Query:
+			time.sleep(0.1)
+			with self.lock:
+				self.persisted.append(tag)
+			return Q(f"select * from warmed_{tag}")
+
+	c = SlowCacher()
+	q1 = Q("select 1 as warm_a").persist(c, "a")
+	q2 = Q("select 1 as warm_b").persist(c, "b")
+	q3 = Q(f"select * from {q1} join {q2}").persist(c, "c")
+	q4 = Q(f"select * from {q3}")
+
+	with ThreadPoolExecutor(4) as executor:
+		futures = q4.warm(executor)
+		assert len(futures) == 3
+		built = q4.build()  # waits for the warm-up rather than persisting again.
+		assert [f.result().sql for f in futures[:2]] == [
+			"select * from warmed_a",
+			"select * from warmed_b",
+		]
+
+	assert "warmed_c" in built.sql
+	assert sorted(c.persisted, key=str) == ["a", "b", "c"]
+
+	q5 = Q("select 1 as warm_d").persist(c, "d")
+	[future] = csql.warm([q5, q4])[:1]
+	future.result()
+	assert sorted(c.persisted, key=str) == ["a", "b", "c", "d"]
+
+
+def test_persist_usage_tracker():
+	from csql.persist import UsageTracker
+
+	with sqlite3.connect(":memory:") as con:
+		cache = TempTableCacher(con)
+		tracker = UsageTracker(cache, min_roots=2)
+
+		p = Parameters(v=1)
+		shared = Q(f"select {p.v} as usage_v", dialect=csql.dialect.SQLite)
+		q1 = Q(f"select usage_v + 1 from {shared}")
+		q2 = Q(f"select usage_v + 2 from {shared}")
+
+		q1.build()  # not tracked
+		with tracker:
+			with tracker.timed(q1):
+				con.execute(*q1.db).fetchall()
+			assert "csql_cache" not in q1.build().sql
+			# seen in two queries now, so persisted.
+			assert "csql_cache_auto_" in q2.build().sql
+			assert "csql_cache_auto_" in q1.build(newParams={"v": 2}).sql
+			assert con.execute(*q2.db).fetchall() == [(3,)]
+		assert "csql_cache" not in q1.build().sql
+
+		[usage] = tracker.report()
+		assert usage.query.build().sql == "select ? as usage_v"
+		assert usage.roots == 2
+		assert usage.builds == 5
+		assert usage.executions == 1
+
+
+def test_persist_stats():
+	import csql.persist
+
+	events: list[csql.persist.PersistEvent] = []
+	csql.persist.add_stats_callback(events.append)
+	try:
+		with sqlite3.connect(":memory:") as con:
+			c = TempTableCacher(con)
+			p = Parameters(v=1)
+			q1 = Q(f"select {p.v} as stats_v").persist(c, "stats")
+			q1.build()
+			q1.build()
+	finally:
+		csql.persist.remove_stats_callback(events.append)
+
+	assert [e.outcome for e in events] == ["miss", "hit"]
+	assert events[0].materialize_seconds > 0
+	assert events[1].materialize_seconds == 0
+	assert events[0].parameters == 1
+
+	s = csql.persist.stats()[c, "stats"]
+	assert (s.hits, s.misses, s.stale) == (1, 1, 0)
+	assert s.sql_bytes == 2 * events[0].sql_bytes
+	assert s.lock_wait_seconds >= 0
+
+	csql.persist.reset_stats()
+	assert (c, "stats") not in csql.persist.stats()
+
+	# stats don't keep cachers alive.
+	import gc
+
+	from csql._.persist.stats import record
+
+	gone = TempTableCacher(None)
+	record(events[0]._replace(cacher=gone, tag="gone"))
+	assert (gone, "gone") in csql.persist.stats()
+	del gone
+	gc.collect()
+	assert not any(tag == "gone" for _, tag in csql.persist.stats())
+
+
+def test_persist_budget_drop_failure(caplog: pytest.LogCaptureFixture):
+	from csql._.persist import KL
+	from csql.persist import Persisted, set_budget
+
+	free_while_dropping: list[bool] = []
+
+	class SizedCacher(Cacher):
+		def __init__(self, con: sqlite3.Connection) -> None:
+			self.tables = TempTableCacher(con)
+
+		def _persist(self, rq: RenderedQuery, key: Key, tag: str | None) -> Persisted:
+			return Persisted(self.tables._persist(rq, key, tag), rows=10)
+
+		def _drop(self, key: Key, tag: str | None) -> bool:
+			# cachers can take their own locks in here, so nobody else should be locked out of KL.
+			def try_sizes_lock() -> None:
+				if acquired := KL.sizes_lock.acquire(timeout=5):
+					KL.sizes_lock.release()
+				free_while_dropping.append(acquired)
+
+			thread = threading.Thread(target=try_sizes_lock)
+			thread.start()
+			thread.join()
+			raise RuntimeError("can't drop this")
+
+	with sqlite3.connect(":memory:") as con:
+		c = SizedCacher(con)
+		q1 = Q("select 1 as dropped").persist(c, "drop_failure")
+		q2 = Q("select 2 as kept").persist(c, "drop_failure")
+		set_budget(max_rows=15)
+		try:
+			q1.build()
+			assert con.execute(*q2.db).fetchall() == [(2,)]
+		finally:
+			set_budget()
+
+	assert free_while_dropping == [True]
+	assert "can't drop this" in caplog.text
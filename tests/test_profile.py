@@ -0,0 +1,36 @@
+import sqlite3
+
+import csql.dialect
+from csql import Parameters, Q
+
+
+def test_profile():
+	with sqlite3.connect(":memory:") as con:
+		con.execute("create table t(v int)")
+		con.executemany("insert into t values (?)", [(i,) for i in range(10)])
+
+		p = Parameters(min=3)
+		q1 = Q(f"select v from t where v >= {p.min}", dialect=csql.dialect.SQLite)
+		q2 = Q(f"select v % 2 as odd, count(*) as n from {q1} group by 1")
+		q3 = Q(f"select * from {q2} join {q1} on {q2}.odd = {q1}.v")
+
+		profile = q3.profile(con)
+		assert [n.name for n in profile.nodes] == ["_subQuery0", "_subQuery1", "root"]
+		assert [n.rows for n in profile.nodes] == [7, 2, 0]
+		assert [n.inputs for n in profile.nodes] == [
+			(),
+			("_subQuery0",),
+			("_subQuery1", "_subQuery0"),
+		]
+		assert profile.nodes[-1].query is q3
+		assert all(0 <= n.self_seconds <= n.seconds for n in profile.nodes)
+		assert profile.nodes[0].summary == "select v from t where v >= ?"
+
+		assert q3.profile(con, newParams={"min": 0}).nodes[0].rows == 10
+
+		lines = str(profile).splitlines()
+		assert len(lines) == 4
+		assert "root" in lines[0]
+		assert "├─ _subQuery1" in lines[1]
+		assert "│  └─ _subQuery0" in lines[2]
+		assert "└─ _subQuery0" in lines[3]
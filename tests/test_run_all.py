@@ -0,0 +1,145 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+import csql
+import csql.dialect
+from csql import Parameters, Q
+
+
+def test_run_all_sqlite(tmp_path: Path):
+	db = tmp_path / "run_all.db"
+	with sqlite3.connect(db) as con:
+		con.execute("create table t as select 1 as v union all select 2")
+	con.close()
+
+	opened: list[sqlite3.Connection] = []
+	released: list[sqlite3.Connection] = []
+	threads: set[str] = set()
+
+	def connect() -> sqlite3.Connection:
+		threads.add(threading.current_thread().name)
+		con = sqlite3.connect(db, check_same_thread=False)
+		opened.append(con)
+		return con
+
+	def release(con: Any) -> None:
+		released.append(con)
+		con.close()
+
+	p = Parameters(v=2)
+	q1 = Q("select count(*) as n from t", dialect=csql.dialect.SQLite)
+	q2 = Q(f"select v from t where v = {p.v}", dialect=csql.dialect.SQLite)
+	bad = Q("select * from nonexistent", dialect=csql.dialect.SQLite)
+
+	results = csql.run_all([q2, bad, q1, q2], connect, max_workers=2, release=release)
+
+	assert [r.query for r in results] == [q2, bad, q1, q2]
+	assert [r.ok for r in results] == [True, False, True, True]
+	assert results[0].result["v"].tolist() == [2]
+	assert results[2].result["n"].tolist() == [2]
+	assert results[3] is results[0]
+	assert "nonexistent" in str(results[1].error)
+	assert results[1].result is None
+	assert all(r.build_seconds >= 0 and r.run_seconds >= 0 for r in results)
+
+	assert len(opened) == len(threads) <= 2
+	assert sorted(map(id, released)) == sorted(map(id, opened))
+
+
+def test_run_all_duckdb():
+	duckdb = pytest.importorskip("duckdb")
+	con = duckdb.connect()
+	con.execute("create table t as select range as v from range(10)")
+	p = Parameters(n=0)
+	q = Q(f"select count(*) as n from t where v >= {p.n}", dialect=csql.dialect.DuckDB)
+
+	results = csql.run_all([q], con.cursor, format="arrow", newParams={"n": 5})
+	assert results[0].result.to_pydict() == {"n": [5]}
+
+	with pytest.raises(ValueError, match="format"):
+		csql.run_all([q], con.cursor, format="nope")  # type: ignore[arg-type]
+
+
+def test_split_range():
+	from datetime import date
+
+	from csql._.run import split_range
+
+	assert split_range(0, 10, 3) == [(0, 3), (3, 6), (6, 10)]
+	assert split_range(0, 2, 5) == [(0, 1), (1, 2)]
+	assert split_range(date(2024, 1, 1), date(2024, 1, 5), 2) == [
+		(date(2024, 1, 1), date(2024, 1, 3)),
+		(date(2024, 1, 3), date(2024, 1, 5)),
+	]
+	assert split_range(0.0, 1.0, 2) == [(0.0, 0.5), (0.5, 1.0)]
+	with pytest.raises(ValueError, match="empty"):
+		split_range(5, 5, 2)
+
+
+def test_partitioned(tmp_path: Path):
+	db = tmp_path / "partitioned.db"
+	with sqlite3.connect(db) as con:
+		con.execute("create table t(v int)")
+		con.executemany("insert into t values (?)", [(i,) for i in range(100)])
+	con.close()
+
+	p = Parameters(start=10, end=90)
+	q = Q(
+		f"select v from t where v >= {p.start} and v < {p.end} order by v",
+		dialect=csql.dialect.SQLite,
+	)
+
+	def connect() -> sqlite3.Connection:
+		return sqlite3.connect(db, check_same_thread=False)
+
+	t = q.partitioned(connect, splits=4, max_workers=4)
+	assert t["v"].to_pylist() == list(range(10, 90))
+
+	df = q.partitioned(
+		connect, ranges=[(0, 5), (50, 52)], format="pandas", newParams={"end": 0}
+	)
+	assert df["v"].tolist() == [0, 1, 2, 3, 4, 50, 51]
+
+	assert q.partitioned(connect, 3, format="polars", newParams={"end": 13})[
+		"v"
+	].to_list() == [10, 11, 12]
+
+	with pytest.raises(ValueError, match="nope"):
+		q.partitioned(connect, 2, start="nope")
+	with pytest.raises(ValueError, match="nope"):
+		q.partitioned(connect, ranges=[(0, 5)], end="nope")
+	with pytest.raises(ValueError, match="nope"):
+		q.partitioned(connect, ranges=[(0, 5)], start="nope", newParams={"nope": 0})
+
+	bad = Q(f"select * from nonexistent where {p.start} < {p.end}")
+	with pytest.raises(sqlite3.OperationalError):
+		bad.partitioned(connect, 2)
+
+
+def test_run_all_default_sqlite_connections():
+	# sqlite3 connections can only be used (and closed) by the thread that opened them
+	results = csql.run_all(
+		[Q("select 1 as a"), Q("select 2 as b")],
+		lambda: sqlite3.connect(":memory:"),
+		max_workers=2,
+	)
+
+	assert all(r.ok for r in results), [r.error for r in results]
+	assert results[0].result["a"].tolist() == [1]
+	assert results[1].result["b"].tolist() == [2]
+
+
+def test_run_all_release_failure_keeps_results():
+	def release(con: Any) -> None:
+		raise RuntimeError("pool is gone")
+
+	results = csql.run_all(
+		[Q("select 1 as a")], lambda: sqlite3.connect(":memory:"), release=release
+	)
+
+	assert results[0].ok
+	assert results[0].result["a"].tolist() == [1]
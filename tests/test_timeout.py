@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import pytest
+
+import csql
+import csql.adapters
+import csql.dialect
+from csql import Parameters, Q
+from csql.contrib.persist import TempTableCacher
+
+
+def _counter(n: int) -> csql.Query:
+	p = Parameters(n=n)
+	return Q(
+		f"""
+		with recursive r(i) as (select 1 union all select i + 1 from r where i < {p.n})
+		select count(*) as n from r
+		""",
+		dialect=csql.dialect.SQLite,
+	)
+
+
+def test_timeout_sqlite():
+	with sqlite3.connect(":memory:") as con:
+		start = time.monotonic()
+		with pytest.raises(TimeoutError) as e:
+			_counter(10**12).preview_pd(con, timeout=0.2)
+		assert time.monotonic() - start < 5
+		assert "interrupted" in str(e.value.__cause__)
+
+		# the connection is still usable, and fast queries aren't affected.
+		assert _counter(10).preview_pd(con, timeout=5).values.tolist() == [[10]]
+		assert _counter(10).preview_pd(con).values.tolist() == [[10]]
+
+
+def test_timeout_duckdb():
+	duckdb = pytest.importorskip("duckdb")
+	con = duckdb.connect()
+	q = Q(
+		"select count(*) as n from range(100000000000) a", dialect=csql.dialect.DuckDB
+	)
+	with pytest.raises(TimeoutError):
+		q.to_arrow(con, timeout=0.2)  # pyright: ignore[reportUnknownMemberType]
+	assert con.execute("select 1").fetchall() == [(1,)]
+
+
+def test_timeout_cancels_persistence():
+	persist_con = sqlite3.connect(":memory:", check_same_thread=False)
+	cache = TempTableCacher(persist_con)
+	slow = _counter(10**12).persist(cache, "slow")
+	q = Q(f"select n from {slow}")
+
+	with sqlite3.connect(":memory:") as con, pytest.raises(TimeoutError):
+		q.preview_pd(con, timeout=0.2)
+	assert persist_con.execute("select * from sqlite_temp_master").fetchall() == []
+
+	# the key's lock was released, so another thread can try again (and time out again).
+	results: list[csql.RunResult] = []
+	thread = threading.Thread(
+		target=lambda: results.extend(
+			csql.run_all([q], lambda: persist_con, release=lambda _: None, timeout=0.2)
+		)
+	)
+	thread.start()
+	thread.join(timeout=10)
+	assert not thread.is_alive()
+	[result] = results
+	assert isinstance(result.error, TimeoutError)
+
+
+def test_timeout_unsupported():
+	class Connection:
+		def cursor(self) -> None:
+			raise AssertionError("shouldn't get this far")
+
+	with pytest.raises(ValueError, match="time out"):
+		Q("select 1").preview_pd(Connection(), timeout=1)
+	with pytest.raises(ValueError, match="positive"):
+		Q("select 1").preview_pd(sqlite3.connect(":memory:"), timeout=0)
+
+	# without a deadline to pass on, this does nothing.
+	with csql.adapters.statement_timeout(Connection()):
+		pass
+
+
+def test_timeout_clickhouse_reset():
+	class Client:
+		def __init__(self) -> None:
+			self.settings: dict[str, Any] = {}
+
+		def get_client_setting(self, key: str) -> Any:
+			return self.settings.get(key)
+
+		def set_client_setting(self, key: str, value: Any) -> None:
+			self.settings[key] = value
+
+	client = Client()
+	with csql.adapters.ClickHouseAdapter().timeout(client, 1.5):
+		assert client.settings == {"max_execution_time": 2}
+	assert client.settings == {"max_execution_time": 0}
+
+	client.settings["max_execution_time"] = 60
+	with csql.adapters.ClickHouseAdapter().timeout(client, 1.5):
+		assert client.settings == {"max_execution_time": 2}
+	assert client.settings == {"max_execution_time": 60}
+
+
+def test_timeout_keeps_inner_timeouts():
+	# a cacher giving up on the same deadline keeps its own, more useful, error.
+	def give_up() -> None:
+		time.sleep(0.2)
+		raise TimeoutError("Timed out waiting for Snowflake query qid-0")
+
+	with (
+		pytest.raises(TimeoutError, match="qid-0"),
+		csql.adapters.statement_timeout(sqlite3.connect(":memory:"), 0.05),
+	):
+		give_up()
@@ -0,0 +1,52 @@
+# pyarrow and pandas are untyped.
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false
+
+import sqlite3
+
+import pytest
+
+import csql.dialect
+from csql import Parameters, Q
+
+pa = pytest.importorskip("pyarrow")
+
+
+def test_to_arrow_dbapi():
+	with sqlite3.connect(":memory:") as con:
+		p = Parameters(n=5)
+		q = Q(
+			f"""
+			with recursive t(v) as (select 1 union all select v + 1 from t where v < {p.n})
+			select v, 'x' as s from t
+			""",
+			dialect=csql.dialect.SQLite,
+		)
+
+		t = q.to_arrow(con)
+		assert isinstance(t, pa.Table)
+		assert t.to_pydict() == {"v": [1, 2, 3, 4, 5], "s": ["x"] * 5}
+		assert q.to_arrow(con, rows=2).num_rows == 2
+		assert q.to_arrow(con, newParams={"n": 0}).to_pydict() == {
+			"v": [1],
+			"s": ["x"],
+		}
+
+
+def test_to_arrow_duckdb():
+	duckdb = pytest.importorskip("duckdb")
+	con = duckdb.connect()
+	p = Parameters(n=3)
+	q = Q(f"select range as v from range({p.n})", dialect=csql.dialect.DuckDB)
+
+	assert q.to_arrow(con).to_pydict() == {"v": [0, 1, 2]}
+	assert q.to_arrow(con, rows=1).to_pydict() == {"v": [0]}
+	assert q.preview_pd(con)["v"].tolist() == [0, 1, 2]
+
+
+def test_to_arrow_adbc():
+	adbc_sqlite = pytest.importorskip("adbc_driver_sqlite.dbapi")
+	with adbc_sqlite.connect() as con:
+		q = Q("select 1 as v union all select 2", dialect=csql.dialect.SQLite)
+		t = q.to_arrow(con)
+		assert t.to_pydict() == {"v": [1, 2]}
+		assert q.preview_pd(con)["v"].tolist() == [1, 2]